@@ -0,0 +1,187 @@
+"""Measure the throughput of a whole crawl against a replayed Gouden Gids.
+
+Runs the real `GoudenGidsSpider` with the production settings, except that every
+request is answered by `benchmarks.replay.ReplayDownloadHandler` and that the
+requests aren't throttled unless `--throttle` is passed. Reports the items per
+second, the latency of the requests from being scheduled until their response is
+received, the time until the first item, the largest number of queued requests, the
+CPU time per item and the peak memory of the process.
+
+Run with `poetry run python -m benchmarks.bench_crawl --pages 20`.
+"""
+
+import argparse
+import json
+import resource
+import statistics
+import tempfile
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Self
+
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler, CrawlerProcess
+from scrapy.http import Response
+from scrapy.settings import Settings
+
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+REPLAY_HANDLER = "benchmarks.replay.ReplayDownloadHandler"
+
+
+def cpu_time() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class CrawlMetrics:
+    """Extension that collects the measurements of a crawl."""
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+        self.latencies: list[float] = []
+        self.items = 0
+        self.first_item_at: float | None = None
+        self.max_queued = 0
+        self.started_at = self.finished_at = 0.0
+        self.cpu_started_at = self.cpu_finished_at = 0.0
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        metrics = cls(crawler)
+        crawler.signals.connect(metrics.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(
+            metrics.request_scheduled, signal=signals.request_scheduled
+        )
+        crawler.signals.connect(
+            metrics.response_received, signal=signals.response_received
+        )
+        crawler.signals.connect(metrics.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(metrics.spider_closed, signal=signals.spider_closed)
+        # Keep a reference to read the results once the crawl is done
+        crawler.metrics = metrics  # pyright: ignore[reportAttributeAccessIssue]
+        return metrics
+
+    def spider_opened(self, spider: Spider) -> None:
+        self.started_at = time.perf_counter()
+        self.cpu_started_at = cpu_time()
+
+    def request_scheduled(self, request: Request, spider: Spider) -> None:
+        # The meta is shared with the requests that middlewares derive from it,
+        # e.g. the ones that Splash sends
+        request.meta.setdefault("scheduled_at", time.perf_counter())
+        engine: Any = self.crawler.engine
+        if engine is not None and engine.slot is not None:
+            self.max_queued = max(self.max_queued, len(engine.slot.scheduler))
+
+    def response_received(
+        self, response: Response, request: Request, spider: Spider
+    ) -> None:
+        if (scheduled_at := request.meta.get("scheduled_at")) is not None:
+            self.latencies.append(time.perf_counter() - scheduled_at)
+
+    def item_scraped(self, item: Any, spider: Spider) -> None:
+        self.items += 1
+        if self.first_item_at is None:
+            self.first_item_at = time.perf_counter()
+
+    def spider_closed(self, spider: Spider) -> None:
+        self.finished_at = time.perf_counter()
+        self.cpu_finished_at = cpu_time()
+
+    def report(self) -> dict[str, float]:
+        duration = self.finished_at - self.started_at
+        quantiles = (
+            statistics.quantiles(self.latencies, n=100)
+            if len(self.latencies) > 1
+            else [0.0] * 99
+        )
+        return {
+            "items": self.items,
+            "requests": len(self.latencies),
+            "seconds": duration,
+            "items_per_second": self.items / duration if duration else 0.0,
+            "first_item_seconds": (self.first_item_at or self.finished_at)
+            - self.started_at,
+            "max_queued_requests": self.max_queued,
+            "latency_p50_ms": quantiles[49] * 1000,
+            "latency_p99_ms": quantiles[98] * 1000,
+            "cpu_ms_per_item": (self.cpu_finished_at - self.cpu_started_at)
+            * 1000
+            / max(self.items, 1),
+            # Kilobytes on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+
+
+def replay_settings(
+    output: Path,
+    *,
+    throttle: bool = False,
+    latency: float = 0,
+    overrides: Mapping[str, Any] | None = None,
+) -> Settings:
+    """Return the production settings, with the downloads replayed."""
+    settings = Settings()
+    settings.setmodule("trustoo_crawler.settings", priority="project")
+    replayed: dict[str, Any] = {
+        "DOWNLOAD_HANDLERS": {"http": REPLAY_HANDLER, "https": REPLAY_HANDLER},
+        "REPLAY_LATENCY": latency,
+        # Without throttling, the crawl goes as fast as the spider can
+        "ADAPTIVE_THROTTLE_ENABLED": throttle,
+        "DOWNLOAD_DELAY": settings.getfloat("DOWNLOAD_DELAY") if throttle else 0,
+        "FEEDS": {str(output): {"format": "csv", "overwrite": True}},
+        "EXTENSIONS": {CrawlMetrics: 0},
+        "LOG_LEVEL": "WARNING",
+        **(overrides or {}),
+    }
+    settings.update(replayed, priority="cmdline")
+    return settings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=20, help="Search pages to crawl")
+    parser.add_argument("--render", default="auto", help="See `RenderMode`")
+    parser.add_argument("--item-model", default="item", help="See `ItemModel`")
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds before each response"
+    )
+    parser.add_argument(
+        "--throttle",
+        action="store_true",
+        help="Throttle the requests like in production",
+    )
+    parser.add_argument(
+        "-s",
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Override a setting",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        settings = replay_settings(
+            Path(directory) / "results.csv",
+            throttle=args.throttle,
+            latency=args.latency,
+            overrides=dict(setting.split("=", 1) for setting in args.set),
+        )
+        process = CrawlerProcess(settings, install_root_handler=False)
+        crawler = process.create_crawler(GoudenGidsSpider)
+        process.crawl(
+            crawler,
+            max_page=str(args.pages),
+            render=args.render,
+            item_model=args.item_model,
+        )
+        process.start()
+    report = crawler.metrics.report()  # pyright: ignore[reportAttributeAccessIssue]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measure how fast the businesses are loaded into SQLite by `DatabasePipeline`.
+
+Writes 100,000 businesses built from the fields of the saved business pages, each
+with a listing ID of its own, in batches of the size of `DATABASE_BATCH_SIZE`.
+Then writes all of them again, which updates every business instead. Next to the
+businesses, the rows of the child tables are counted: the saved pages have a lot
+of other information, e.g. all the parkings nearby.
+
+Run with `poetry run python -m benchmarks.bench_database`.
+"""
+
+import argparse
+import tempfile
+import time
+from itertools import batched, cycle, islice
+from pathlib import Path
+
+from benchmarks.utils import load_business_pages
+from trustoo_crawler.database import SQLiteBusinessDatabase, business_rows
+from trustoo_crawler.extraction import BusinessPageExtractor, to_item
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    pages = [
+        BusinessPageExtractor(response.selector.root).fields()
+        for response in load_business_pages()
+    ]
+    items = []
+    for index, fields in enumerate(islice(cycle(pages), args.count)):
+        item = to_item(fields)
+        item["listing_id"] = f"L{index}"
+        items.append(item)
+
+    start = time.perf_counter()
+    businesses = [business_rows(item) for item in items]
+    converted = args.count / (time.perf_counter() - start)
+    print(f"{'to rows':>8}: {converted:10.0f} businesses/sec")
+    row_count = sum(
+        1
+        + len(rows.working_times or ())
+        + len(rows.social_media or ())
+        + len(rows.other_information or ())
+        for rows in businesses
+        if rows is not None
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        database = SQLiteBusinessDatabase(Path(directory) / "businesses.sqlite")
+        for name in ("insert", "upsert"):
+            start = time.perf_counter()
+            for batch in batched(businesses, args.batch_size):
+                database.write(list(batch))  # pyright: ignore[reportArgumentType]
+            elapsed = time.perf_counter() - start
+            print(
+                f"{name:>8}: {args.count / elapsed:10.0f} businesses/sec, "
+                f"{row_count / elapsed:10.0f} rows/sec"
+            )
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Compare the pages per second of the XPath-by-XPath and single-pass extraction.
+
+The single pass is also measured with each profile of `FIELD_PROFILES`, which only
+extracts some of the fields.
+
+Run with `poetry run python -m benchmarks.bench_extraction`.
+"""
+
+import argparse
+
+from benchmarks.utils import load_business_pages, pages_per_second
+from trustoo_crawler.extraction import FIELD_PROFILES, BusinessPageExtractor
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    responses = load_business_pages()
+    extractors = {
+        "xpaths": GoudenGidsSpider.extract_business_item,
+        "single pass": lambda response: BusinessPageExtractor(
+            response.selector.root
+        ).extract(),
+        **{
+            f"{profile} only": lambda response, fields=fields: BusinessPageExtractor(
+                response.selector.root, fields
+            ).extract()
+            for profile, fields in FIELD_PROFILES.items()
+            if profile != "full"
+        },
+    }
+    for include_parsing in (False, True):
+        print("Including HTML parsing" if include_parsing else "Extraction only")
+        results = {
+            name: pages_per_second(
+                extract, responses, args.rounds, include_parsing=include_parsing
+            )
+            for name, extract in extractors.items()
+        }
+        for name, result in results.items():
+            print(f"{name:>12}: {result:8.1f} pages/sec")
+        print(f"{'speedup':>12}: {results['single pass'] / results['xpaths']:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
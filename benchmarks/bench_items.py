@@ -0,0 +1,79 @@
+"""Compare the memory and speed of `BusinessItem` and `BusinessRecord`.
+
+Builds 100,000 items of each model from the fields of the saved business pages and
+keeps all of them alive, the way items pile up in pipelines and exporters.
+
+Run with `poetry run python -m benchmarks.bench_items`.
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+from collections.abc import Callable
+from itertools import cycle, islice
+from typing import Any
+
+from benchmarks.utils import load_business_pages
+from trustoo_crawler.extraction import BusinessPageExtractor
+from trustoo_crawler.items import (
+    BusinessItem,
+    BusinessRecord,
+    WorkingTimeItem,
+    WorkingTimes,
+)
+from trustoo_crawler.utils import get_listing_id
+
+
+def build_item(fields: dict[str, Any]) -> BusinessItem:
+    item = BusinessItem(fields)
+    item["working_time"] = WorkingTimeItem(fields["working_time"])
+    return item
+
+
+def build_record(fields: dict[str, Any]) -> BusinessRecord:
+    return BusinessRecord(
+        **{**fields, "working_time": WorkingTimes(**fields["working_time"])}
+    )
+
+
+def measure(
+    build: Callable[[dict[str, Any]], Any], pages: list[dict[str, Any]], count: int
+) -> tuple[float, float]:
+    """Return the items built per second and the bytes taken by each item."""
+    fields = list(islice(cycle(pages), count))
+    gc.collect()
+    start = time.perf_counter()
+    items = [build(page) for page in fields]
+    built = count / (time.perf_counter() - start)
+    del items
+    # Tracing slows the allocations down, so the memory is measured separately
+    gc.collect()
+    tracemalloc.start()
+    items = [build(page) for page in fields]
+    size = tracemalloc.get_traced_memory()[0] / len(items)
+    tracemalloc.stop()
+    return built, size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    # The values are shared by all items, so only the items themselves are measured
+    pages = [
+        {
+            "listing_id": get_listing_id(response.url),
+            **BusinessPageExtractor(response.selector.root).fields(),
+        }
+        for response in load_business_pages()
+    ]
+    models = {"BusinessItem": build_item, "BusinessRecord": build_record}
+    for name, build in models.items():
+        built, size = measure(build, pages, args.count)
+        print(f"{name:>14}: {built:10.0f} items/sec, {size:6.0f} bytes/item")
+
+
+if __name__ == "__main__":
+    main()
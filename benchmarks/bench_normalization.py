@@ -0,0 +1,64 @@
+"""Measure how fast `normalize_item` parses the phone, address and opening hours.
+
+Normalizes 100,000 items built from the fields of the saved business pages, of
+both item models. The pages repeat, so their values come from the caches of the
+parsers after the first few items. That is why the items are normalized a second
+time with a phone number and house number of their own, which have to be parsed
+every time, the way most phone numbers and addresses of a crawl are. The opening
+hours of most businesses are the same few strings, so they stay as they are.
+
+Run with `poetry run python -m benchmarks.bench_normalization`.
+"""
+
+import argparse
+import time
+from itertools import cycle, islice
+from typing import Any
+
+from benchmarks.utils import load_business_pages
+from trustoo_crawler.extraction import BusinessPageExtractor, to_item, to_record
+from trustoo_crawler.normalization import (
+    day_intervals,
+    normalize_item,
+    normalize_phone,
+    parse_address,
+    week_intervals,
+)
+
+CACHES = (normalize_phone, parse_address, day_intervals, week_intervals)
+
+
+def unique(fields: dict[str, Any], index: int) -> dict[str, Any]:
+    """Return the fields of a page with a phone number and address of their own."""
+    return {
+        **fields,
+        "phone": f"020 {index:07d}",
+        "location": f"Kerkstraat {index}, 5751BH Deurne",
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    pages = [
+        BusinessPageExtractor(response.selector.root).fields()
+        for response in load_business_pages()
+    ]
+    repeated = list(islice(cycle(pages), args.count))
+    unique_fields = [unique(fields, index) for index, fields in enumerate(repeated)]
+    for values, fields in (("repeated", repeated), ("unique", unique_fields)):
+        for model, build in (("item", to_item), ("record", to_record)):
+            items = [build(page) for page in fields]
+            for cache in CACHES:
+                cache.cache_clear()
+            start = time.perf_counter()
+            for item in items:
+                normalize_item(item)
+            elapsed = time.perf_counter() - start
+            print(f"{values:>8} {model:>6}: {args.count / elapsed:10.0f} items/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Measure the throughput of a replayed crawl as the pool of parsing processes grows.
+
+Runs `benchmarks.bench_crawl` once per pool size, each in a process of its own
+since a reactor can't be restarted, and reports the items per second of each. A
+pool size of 0 extracts the pages in the reactor thread, like without a pool.
+
+Run with `poetry run python -m benchmarks.bench_pool --pages 50 --sizes 0 1 2 4`.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+
+def crawl(pages: int, pool_size: int, latency: float) -> dict[str, float]:
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_crawl",
+            "--pages",
+            str(pages),
+            "--latency",
+            str(latency),
+            "-s",
+            f"PARSE_POOL_SIZE={pool_size}",
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    # The report is the last thing that is printed
+    return json.loads(output[output.rindex("{") :])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=50, help="Search pages to crawl")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[0, 1, 2, 4],
+        help="Pool sizes to compare",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Seconds before each response"
+    )
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} cores, {args.pages} search pages")
+    print(f"{'pool size':>9} {'items/s':>9} {'p99 latency (ms)':>17}")
+    for size in args.sizes:
+        report = crawl(args.pages, size, args.latency)
+        print(
+            f"{size:>9} {report['items_per_second']:>9.1f}"
+            f" {report['latency_p99_ms']:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Measure the per-item cost of evaluating the XPaths of a business page.
+
+Compares passing the XPath strings to `response.xpath(...)`, which parses them
+on every call, with evaluating the compiled XPaths from the registry in
+`trustoo_crawler.spiders.gouden_gids`.
+
+Run with `poetry run python -m benchmarks.bench_xpaths`.
+"""
+
+import argparse
+
+from scrapy.http import HtmlResponse
+
+from benchmarks.utils import load_business_pages, pages_per_second
+from trustoo_crawler.spiders.gouden_gids import (
+    COMPILED_TEXT_XPATHS,
+    COMPILED_WORKING_DAY_XPATHS,
+    COMPILED_XPATHS,
+    GoudenGidsXPaths,
+)
+from trustoo_crawler.utils import DutchWeekDay
+
+# The XPaths evaluated for each `BusinessItem`, grouped by how they are evaluated
+TEXT_XPATHS = [
+    GoudenGidsXPaths.NAME,
+    GoudenGidsXPaths.LOCATION,
+    GoudenGidsXPaths.DESCRIPTION,
+    GoudenGidsXPaths.PHONE,
+    GoudenGidsXPaths.WEBSITE,
+    GoudenGidsXPaths.EMAIL,
+    GoudenGidsXPaths.CERTIFICATES,
+    GoudenGidsXPaths.LOGO_SRC,
+]
+TEXTS_XPATHS = [
+    GoudenGidsXPaths.SOCIAL_MEDIA,
+    GoudenGidsXPaths.PAYMENT_OPTIONS,
+    GoudenGidsXPaths.PHOTO_SRC,
+]
+SECTION_XPATHS = [
+    (
+        GoudenGidsXPaths.OTHER_INFORMATION_SECTION,
+        GoudenGidsXPaths.OTHER_INFORMATION_SECTION_TITLE,
+        GoudenGidsXPaths.OTHER_INFORMATION_SECTION_VALUE,
+    ),
+    (
+        GoudenGidsXPaths.PARKING_INFO,
+        GoudenGidsXPaths.PARKING_INFO_SECTION_NAME,
+        GoudenGidsXPaths.PARKING_INFO_SECTION_VALUE,
+    ),
+    (
+        GoudenGidsXPaths.ECONOMIC_DATA,
+        GoudenGidsXPaths.ECONOMIC_DATA_SECTION_NAME,
+        GoudenGidsXPaths.ECONOMIC_DATA_SECTION_VALUE,
+    ),
+]
+
+
+def evaluate_strings(response: HtmlResponse) -> None:
+    """Evaluate the XPaths of an item the way the spider used to, as strings."""
+    for xpath in TEXT_XPATHS:
+        response.xpath(f"normalize-space({xpath})").get()
+    for day in DutchWeekDay:
+        xpath = GoudenGidsXPaths.WORKING_DAY.format(day=day)
+        response.xpath(f"normalize-space({xpath})").get()
+    for xpath in TEXTS_XPATHS:
+        response.xpath(xpath).getall()
+    for sections, name, value in SECTION_XPATHS:
+        for section in response.xpath(sections):
+            section.xpath(name).get()
+            section.xpath(value).getall()
+
+
+def evaluate_compiled(response: HtmlResponse) -> None:
+    """Evaluate the XPaths of an item using the compiled registry."""
+    root = response.selector.root
+    for xpath in TEXT_XPATHS:
+        COMPILED_TEXT_XPATHS[xpath](root)
+    for day in DutchWeekDay:
+        COMPILED_WORKING_DAY_XPATHS[day](root)
+    for xpath in TEXTS_XPATHS:
+        COMPILED_XPATHS[xpath](root)
+    for sections, name, value in SECTION_XPATHS:
+        for section in COMPILED_XPATHS[sections](root):
+            COMPILED_XPATHS[name](section)
+            COMPILED_XPATHS[value](section)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    responses = load_business_pages()
+    # Parsing is left out, as it costs the same no matter how the XPaths are evaluated
+    strings, compiled = (
+        1e6 / pages_per_second(evaluate, responses, args.rounds, include_parsing=False)
+        for evaluate in (evaluate_strings, evaluate_compiled)
+    )
+    print(f"{'strings':>9}: {strings:8.1f} µs/item")
+    print(f"{'compiled':>9}: {compiled:8.1f} µs/item")
+    print(f"{'speedup':>9}: {strings / compiled:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
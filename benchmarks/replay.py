@@ -0,0 +1,136 @@
+"""Serve a recorded corpus of Gouden Gids instead of the real website.
+
+`ReplayDownloadHandler` replaces Scrapy's HTTP download handlers, so that the real
+`GoudenGidsSpider` can crawl offline, with its production settings otherwise. The
+corpus is built from the responses saved for the unit tests:
+
+- every search page is generated from `lawyers_search_p1.html` with listing IDs
+  that are unique to the page, so no business is filtered as a duplicate, and
+  pagination links around the page, like on the real website. The pages after
+  the last one have no results,
+- every business page is one of the saved business pages,
+- the parking info endpoint returns one of the saved parking info responses,
+- Splash renders a business page by returning the saved page whose parking
+  info is already resolved.
+"""
+
+import re
+import zlib
+from typing import Self
+
+from scrapy import Request, Spider
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse, Response, TextResponse
+from scrapy.settings import BaseSettings
+from twisted.internet import defer, reactor
+from twisted.internet.task import deferLater
+
+from benchmarks.utils import BUSINESS_PAGES, RESPONSES_PATH
+from trustoo_crawler.parking import PARKING_API_URL
+from trustoo_crawler.utils import get_listing_id
+
+SEARCH_PAGE = re.compile(r"/nl/zoeken/([^/]+)/(\d+)/")
+SEARCH_PAGE_LINK = re.compile(rb"/nl/zoeken/advocaten/(\d+)/")
+# The number of pages that `lawyers_search_p1.html` claims
+LAST_PAGE = 424
+LISTING_ID = re.compile(rb"\bL(\d{6,})\b")
+# The saved page whose parking info is resolved, as if it was rendered
+RENDERED_PAGE = "breewel_payment_options.html"
+PARKING_INFO = (
+    "seety_parking_breewel.json",
+    "seety_parking_backer_and_mckenzie.json",
+    "seety_parking_hendricks.json",
+)
+
+
+class ReplayCorpus:
+    """The responses of the replayed website, by URL."""
+
+    def __init__(self):
+        self.search_page = (RESPONSES_PATH / "lawyers_search_p1.html").read_bytes()
+        self.business_pages = [
+            (RESPONSES_PATH / file_name).read_bytes() for file_name in BUSINESS_PAGES
+        ]
+        self.rendered_page = (RESPONSES_PATH / RENDERED_PAGE).read_bytes()
+        self.parking_info = [
+            (RESPONSES_PATH / file_name).read_bytes() for file_name in PARKING_INFO
+        ]
+
+    def search_results(self, category: str, page_number: int) -> bytes:
+        """Return a search page whose listing IDs are unique to its page number."""
+        if page_number > LAST_PAGE:
+            return b"<html><body><main></main></body></html>"
+        body = LISTING_ID.sub(
+            lambda match: b"L%d0%s" % (page_number, match.group(1)), self.search_page
+        )
+
+        def link(match: re.Match) -> bytes:
+            # The saved page links to the pages after the first one, shift them
+            # so that they follow this page instead. The last page stays the same.
+            linked_page = int(match.group(1))
+            if linked_page != LAST_PAGE:
+                linked_page = min(LAST_PAGE, linked_page + page_number - 1)
+            return b"/nl/zoeken/%s/%d/" % (category.encode(), linked_page)
+
+        return SEARCH_PAGE_LINK.sub(link, body)
+
+    def response(self, request: Request) -> Response:
+        """Return the recorded response to a request, 404 if there is none."""
+        url = request.url
+        if url.startswith(PARKING_API_URL):
+            body = self.parking_info[zlib.crc32(url.encode()) % len(self.parking_info)]
+            return TextResponse(
+                url,
+                body=body,
+                headers={"Content-Type": "application/json"},
+                request=request,
+            )
+        if url.endswith("/render.html"):
+            # A Splash request, which scrapy-splash turns back into a response
+            # with the URL of the rendered page
+            return self.html(url, self.rendered_page, request)
+        if (listing_id := get_listing_id(url)) is not None:
+            index = int(listing_id[1:]) % len(self.business_pages)
+            return self.html(url, self.business_pages[index], request)
+        if match := SEARCH_PAGE.search(url):
+            body = self.search_results(match.group(1), int(match.group(2)))
+            return self.html(url, body, request)
+        return HtmlResponse(url, status=404, request=request)
+
+    @staticmethod
+    def html(url: str, body: bytes, request: Request) -> HtmlResponse:
+        return HtmlResponse(
+            url,
+            body=body,
+            encoding="utf-8",
+            headers={"Content-Type": "text/html; charset=utf-8"},
+            request=request,
+        )
+
+
+class ReplayDownloadHandler:
+    """Download handler that answers every request from a `ReplayCorpus`.
+
+    :param latency: Seconds to wait before answering, to imitate the network.
+    """
+
+    lazy = False
+
+    def __init__(self, latency: float = 0):
+        self.corpus = ReplayCorpus()
+        self.latency = latency
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self:
+        return cls(settings.getfloat("REPLAY_LATENCY"))
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        return cls.from_settings(crawler.settings)
+
+    def download_request(self, request: Request, spider: Spider) -> defer.Deferred:
+        # Like Scrapy's HTTP handlers, for the throttling to work with
+        request.meta["download_latency"] = self.latency
+        if not self.latency:
+            return defer.succeed(self.corpus.response(request))
+        return deferLater(reactor, self.latency, self.corpus.response, request)  # pyright: ignore[reportArgumentType]
@@ -0,0 +1,58 @@
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from scrapy.http import HtmlResponse
+
+from tests.utils import read_response_from_file
+
+RESPONSES_PATH = Path(__file__).parent.parent / "tests/test_gouden_gids/responses"
+# The saved business pages together with the URLs they were downloaded from
+BUSINESS_PAGES = {
+    "backer_and_mckenzie.html": "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker+%26+McKenzie+Amsterdam+NV/",
+    "hendricks_short_description.html": "https://www.goudengids.nl/nl/bedrijf/Deurne/L145578951/Advocatenkantoor+Hendriks/",
+    "breewel_payment_options.html": "https://www.goudengids.nl/nl/bedrijf/Bergen+op+Zoom/L146093845/Breewel+Advocatuur/",
+}
+
+
+def load_business_pages() -> list[HtmlResponse]:
+    """Return the saved business pages as responses."""
+    return [
+        read_response_from_file(RESPONSES_PATH / file_name, url)
+        for file_name, url in BUSINESS_PAGES.items()
+    ]
+
+
+def fresh_copies(responses: list[HtmlResponse]) -> list[HtmlResponse]:
+    """Return copies of the responses that have not been parsed yet.
+
+    Parsel caches the parsed tree on the response, so reusing a response would
+    leave the cost of parsing the HTML out of the measurement.
+    """
+    return [response.replace() for response in responses]
+
+
+def pages_per_second(
+    extract: Callable[[HtmlResponse], object],
+    responses: list[HtmlResponse],
+    rounds: int,
+    *,
+    include_parsing: bool = True,
+) -> float:
+    """Return how many of the responses `extract` processes per second.
+
+    :param extract: Function to measure.
+    :param responses: Responses to pass to `extract` in each round.
+    :param rounds: Number of times to go through all responses.
+    :param include_parsing: Whether to measure the parsing of the HTML as well.
+    """
+    batches = [fresh_copies(responses) for _ in range(rounds)]
+    if not include_parsing:
+        for batch in batches:
+            for response in batch:
+                response.selector.root  # noqa: B018 -- Parse ahead of time
+    start = time.perf_counter()
+    for batch in batches:
+        for response in batch:
+            extract(response)
+    return rounds * len(responses) / (time.perf_counter() - start)
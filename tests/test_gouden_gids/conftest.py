@@ -0,0 +1,8 @@
+import pytest
+
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+@pytest.fixture()
+def spider() -> GoudenGidsSpider:
+    return GoudenGidsSpider()
@@ -0,0 +1,119 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.utils.test import get_crawler
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.backpressure import BackpressureMiddleware
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+SEARCH_PAGE_URL = "https://www.goudengids.nl/nl/zoeken/advocaten/1/"
+
+
+class FakeEngine:
+    """Records the requests that are scheduled by the middleware."""
+
+    def __init__(self):
+        self.scheduled: list[Request] = []
+
+    def crawl(self, request: Request) -> None:
+        self.scheduled.append(request)
+
+
+@pytest.fixture()
+def engine() -> FakeEngine:
+    return FakeEngine()
+
+
+@pytest.fixture()
+def middleware(
+    engine: FakeEngine, spider: GoudenGidsSpider, monkeypatch: pytest.MonkeyPatch
+) -> BackpressureMiddleware:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {"BACKPRESSURE_WATERMARK": 10, "BACKPRESSURE_IN_FLIGHT": 1},
+    )
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    crawler.engine = engine  # pyright: ignore[reportAttributeAccessIssue]
+    middleware = BackpressureMiddleware.from_crawler(crawler)
+    # Plenty of business pages pending, unless a test says otherwise
+    monkeypatch.setattr(middleware, "pending", lambda: 20)
+    return middleware
+
+
+def parse_search_page(
+    middleware: BackpressureMiddleware, spider: GoudenGidsSpider
+) -> list[Request]:
+    response = read_response_from_file(
+        Path("test_gouden_gids/responses/lawyers_search_p1.html"), SEARCH_PAGE_URL
+    )
+    return list(
+        middleware.process_spider_output(
+            response,
+            spider.parse_page(response, category="advocaten", page_number=1),
+            spider,
+        )
+    )
+
+
+def test_not_configured():
+    crawler = get_crawler(GoudenGidsSpider, {"BACKPRESSURE_WATERMARK": 0})
+    with pytest.raises(NotConfigured):
+        BackpressureMiddleware.from_crawler(crawler)
+
+
+def test_holds_search_pages(
+    middleware: BackpressureMiddleware, spider: GoudenGidsSpider, engine: FakeEngine
+):
+    requests = parse_search_page(middleware, spider)
+    # The business pages go through, the next search pages wait
+    assert len(requests) == 20
+    assert all(request.callback == spider.parse_business_page for request in requests)
+    assert len(middleware.held) == 5
+    assert engine.scheduled == []
+
+
+def test_releases_below_watermark(
+    middleware: BackpressureMiddleware,
+    spider: GoudenGidsSpider,
+    engine: FakeEngine,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    parse_search_page(middleware, spider)
+    monkeypatch.setattr(middleware, "pending", lambda: 5)
+    middleware.release()
+    middleware.release()
+    # Only a single search page may be in flight at a time
+    assert [request.url for request in engine.scheduled] == [
+        "https://www.goudengids.nl/nl/zoeken/advocaten/2/"
+    ]
+    middleware.request_done(engine.scheduled[0], spider)
+    assert engine.scheduled[-1].url == (
+        "https://www.goudengids.nl/nl/zoeken/advocaten/3/"
+    )
+    assert len(middleware.held) == 3
+
+
+def test_holds_each_page_once(
+    middleware: BackpressureMiddleware, spider: GoudenGidsSpider
+):
+    parse_search_page(middleware, spider)
+    parse_search_page(middleware, spider)
+    assert len(middleware.held) == 5
+
+
+def test_spider_idle(
+    middleware: BackpressureMiddleware,
+    spider: GoudenGidsSpider,
+    engine: FakeEngine,
+    monkeypatch: pytest.MonkeyPatch,
+):
+    parse_search_page(middleware, spider)
+    monkeypatch.setattr(middleware, "pending", lambda: 0)
+    # A released search page that got lost on the way doesn't stall the crawl
+    middleware.in_flight.add(Request(SEARCH_PAGE_URL))
+    with pytest.raises(DontCloseSpider):
+        middleware.spider_idle(spider)
+    assert len(engine.scheduled) == 1
@@ -0,0 +1,50 @@
+from pathlib import Path
+
+import pytest
+
+from trustoo_crawler.categories import (
+    Categories,
+    load_categories,
+    parse_categories,
+)
+
+
+@pytest.mark.parametrize(
+    ("categories", "expected"),
+    [
+        pytest.param("advocaten", {"advocaten": None}, id="single"),
+        pytest.param(
+            "advocaten:3, notarissen,",
+            {"advocaten": 3, "notarissen": None},
+            id="multiple",
+        ),
+    ],
+)
+def test_parse_categories(categories: str, expected: Categories):
+    assert parse_categories(categories) == expected
+
+
+def test_parse_categories_invalid_max_page():
+    with pytest.raises(ValueError, match="must be positive"):
+        parse_categories("advocaten:0")
+
+
+@pytest.mark.parametrize(
+    ("content", "expected"),
+    [
+        pytest.param(
+            "- advocaten\n- name: notarissen\n  max_page: 5\n",
+            {"advocaten": None, "notarissen": 5},
+            id="list",
+        ),
+        pytest.param(
+            "advocaten: 3\nnotarissen:\n",
+            {"advocaten": 3, "notarissen": None},
+            id="mapping",
+        ),
+    ],
+)
+def test_load_categories(tmp_path: Path, content: str, expected: Categories):
+    file_path = tmp_path / "categories.yaml"
+    file_path.write_text(content)
+    assert load_categories(file_path) == expected
@@ -0,0 +1,239 @@
+import sqlite3
+from pathlib import Path
+
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred, maybeDeferred
+
+from trustoo_crawler.database import (
+    CHILD_TABLES,
+    SQLiteBusinessDatabase,
+    business_rows,
+)
+from trustoo_crawler.extraction import to_item
+from trustoo_crawler.items import BusinessItem, BusinessRecord, WorkingTimes
+from trustoo_crawler.normalization import normalize_item
+from trustoo_crawler.pipelines import MAX_PENDING_BATCHES, DatabasePipeline
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+def business(listing_id: str, **fields) -> BusinessItem:
+    return BusinessItem(
+        listing_id=listing_id,
+        name="Advocatenkantoor Hendriks",
+        social_media=["https://www.facebook.com/hendriks", "https://x.com/hendriks"],
+        working_time={"monday": "09:00 - 17:00", "sunday": ""},
+        other_information={"Talen": ["Nederlands", "Engels"], "Opgericht": "1998"},
+        parking_info={"Soort parking:": ["Betalend"]},
+        **fields,
+    )
+
+
+def rows(database: SQLiteBusinessDatabase, query: str) -> list[tuple]:
+    return database.connection.execute(query).fetchall()
+
+
+def test_business_rows():
+    item_rows = business_rows(business("L1"))
+    assert item_rows is not None
+    assert item_rows.working_times == [("L1", "monday", "09:00 - 17:00")]
+    assert item_rows.other_information == [
+        ("L1", "Talen", 0, "Nederlands"),
+        ("L1", "Talen", 1, "Engels"),
+        ("L1", "Opgericht", 0, "1998"),
+    ]
+    record_rows = business_rows(
+        BusinessRecord(
+            listing_id="L1", working_time=WorkingTimes(monday="09:00 - 17:00")
+        )
+    )
+    assert record_rows is not None
+    assert record_rows.working_times == item_rows.working_times
+    assert business_rows(BusinessItem(name="No listing ID")) is None
+
+
+def test_upsert(tmp_path: Path):
+    database = SQLiteBusinessDatabase(tmp_path / "businesses.sqlite")
+    database.write([business_rows(business("L1")), business_rows(business("L2"))])  # pyright: ignore[reportArgumentType]
+    assert rows(database, "SELECT count(*) FROM social_media") == [(4,)]
+    # The business changed, including its child rows
+    changed = business("L1")
+    changed["name"] = "Hendriks Advocaten"
+    changed["social_media"] = ["https://x.com/hendriks"]
+    database.write([business_rows(changed)])  # pyright: ignore[reportArgumentType]
+    assert rows(
+        database, "SELECT listing_id, name, parking_info FROM businesses ORDER BY 1"
+    ) == [
+        ("L1", "Hendriks Advocaten", '{"Soort parking:": ["Betalend"]}'),
+        ("L2", "Advocatenkantoor Hendriks", '{"Soort parking:": ["Betalend"]}'),
+    ]
+    assert rows(database, "SELECT * FROM social_media WHERE listing_id = 'L1'") == [
+        ("L1", 0, "https://x.com/hendriks")
+    ]
+    assert rows(database, "SELECT count(*) FROM other_information") == [(6,)]
+    # Twice in a batch
+    database.write([business_rows(business("L3")), business_rows(business("L3"))])  # pyright: ignore[reportArgumentType]
+    assert rows(database, "SELECT count(*) FROM working_times") == [(3,)]
+    database.close()
+
+
+def test_normalized_fields(tmp_path: Path):
+    database = SQLiteBusinessDatabase(tmp_path / "businesses.sqlite")
+    item = business(
+        "L1",
+        phone="0493 32 18 72",
+        location="Kerkstraat 28, 5751BH Deurne",
+        rating=4.5,
+        review_count=45,
+    )
+    database.write([business_rows(normalize_item(item))])  # pyright: ignore[reportArgumentType]
+    assert rows(
+        database,
+        "SELECT rating, review_count, phone_e164, address, opening_hours"
+        " FROM businesses",
+    ) == [
+        (
+            4.5,
+            45,
+            "+31493321872",
+            '{"street": "Kerkstraat", "house_number": "28", "postcode": "5751 BH", '
+            '"city": "Deurne"}',
+            "[[540, 1020]]",
+        )
+    ]
+    database.close()
+
+
+def test_added_columns(tmp_path: Path):
+    # A database of a crawl from before the columns were added
+    path = tmp_path / "businesses.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE businesses (listing_id TEXT PRIMARY KEY, name TEXT, "
+        "location TEXT, description TEXT, phone TEXT, website TEXT, email TEXT, "
+        "payment_options TEXT, certificates TEXT, parking_info TEXT, "
+        "economic_data TEXT, logo TEXT, pictures TEXT, updated_at REAL NOT NULL)"
+    )
+    connection.close()
+    database = SQLiteBusinessDatabase(path)
+    database.write([business_rows(business("L1", review_count=3))])  # pyright: ignore[reportArgumentType]
+    assert rows(database, "SELECT listing_id, review_count FROM businesses") == [
+        ("L1", 3)
+    ]
+    database.close()
+
+
+def test_asset_files(tmp_path: Path):
+    database = SQLiteBusinessDatabase(tmp_path / "businesses.sqlite")
+    item = business(
+        "L1", logo_file="files/ab/ab.png", picture_files=[None, "files/cd/cd.webp"]
+    )
+    database.write([business_rows(item)])  # pyright: ignore[reportArgumentType]
+    assert rows(database, "SELECT logo_file, picture_files FROM businesses") == [
+        ("files/ab/ab.png", '[null, "files/cd/cd.webp"]')
+    ]
+    database.close()
+
+
+class InlinePipeline(DatabasePipeline):
+    """Writes the batches when the test tells it to, instead of in a thread."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches: list[Deferred] = []
+
+    def write_in_thread(self, function, *args) -> Deferred:
+        written = Deferred()
+        written.addCallback(lambda _: maybeDeferred(function, *args))
+        self.batches.append(written)
+        return written
+
+
+def test_pipeline(tmp_path: Path):
+    crawler = get_crawler(GoudenGidsSpider)
+    crawler.stats.open_spider(GoudenGidsSpider())  # pyright: ignore[reportOptionalMemberAccess]
+    database = SQLiteBusinessDatabase(tmp_path / "businesses.sqlite")
+    pipeline = InlinePipeline(database, crawler.stats, batch_size=2)  # pyright: ignore[reportArgumentType]
+    spider = GoudenGidsSpider()
+    results = []
+    for index in range(2 * MAX_PENDING_BATCHES + 1):
+        result = pipeline.process_item(business(f"L{index}"), spider)
+        assert not isinstance(result, Deferred)
+        results.append(result)
+    assert pipeline.stats.get_value("database/written") is None
+    # The database doesn't keep up, so the items wait
+    waiting = pipeline.process_item(business("L100"), spider)
+    assert isinstance(waiting, Deferred)
+    waiting.addCallback(results.append)
+    assert len(results) == 2 * MAX_PENDING_BATCHES + 1
+    pipeline.batches[0].callback(None)
+    assert results[-1]["listing_id"] == "L100"
+    assert pipeline.stats.get_value("database/written") == 2
+
+    pipeline.process_item(BusinessItem(name="No listing ID"), spider)
+    assert pipeline.stats.get_value("database/no_listing_id") == 1
+    closed = pipeline.close_spider(spider)
+    for batch in pipeline.batches[1:]:
+        batch.callback(None)
+    pipeline.batches[-1].callback(None)  # Closes the database
+    assert closed.called
+    database = SQLiteBusinessDatabase(tmp_path / "businesses.sqlite")
+    assert rows(database, "SELECT count(*) FROM businesses") == [
+        (2 * MAX_PENDING_BATCHES + 2,)
+    ]
+
+
+def crawl(path: Path, spider: GoudenGidsSpider, item: BusinessItem) -> None:
+    """Write an item to the database like a crawl by a spider would."""
+    crawler = get_crawler(GoudenGidsSpider)
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    pipeline = InlinePipeline(
+        SQLiteBusinessDatabase(path),
+        crawler.stats,  # pyright: ignore[reportArgumentType]
+        flush_interval=0,
+    )
+    pipeline.open_spider(spider)
+    pipeline.process_item(normalize_item(item), spider)
+    pipeline.close_spider(spider)
+    pipeline.batches[0].callback(None)
+    pipeline.batches[1].callback(None)  # Closes the database
+
+
+def test_pipeline_fields(tmp_path: Path):
+    path = tmp_path / "businesses.sqlite"
+    item = business(
+        "L1",
+        location="Kerkstraat 28, 5751BH Deurne",
+        description="Advocaten",
+        phone="0493 32 18 72",
+        website="https://hendriks.nl",
+        rating=4.5,
+        review_count=45,
+    )
+    crawl(path, GoudenGidsSpider(), item)
+    query = (
+        "SELECT name, location, description, rating, review_count, address,"
+        " opening_hours FROM businesses"
+    )
+    database = SQLiteBusinessDatabase(path)
+    full = rows(database, query)
+    children = [rows(database, f"SELECT * FROM {table}") for table in CHILD_TABLES]
+    database.close()
+
+    # A refresh of the leads, whose item has the other fields empty
+    spider = GoudenGidsSpider(fields="leads")
+    refreshed = to_item(
+        {"name": "Hendriks", "phone": "0493 32 18 73", "website": "https://hendriks.eu"}
+    )
+    refreshed["listing_id"] = "L1"
+    crawl(path, spider, refreshed)
+    database = SQLiteBusinessDatabase(path)
+    assert rows(
+        database, "SELECT name, phone, phone_e164, website FROM businesses"
+    ) == [("Hendriks", "0493 32 18 73", "+31493321873", "https://hendriks.eu")]
+    # The other fields are kept from the full crawl
+    assert rows(database, query) == [("Hendriks", *full[0][1:])]
+    assert [
+        rows(database, f"SELECT * FROM {table}") for table in CHILD_TABLES
+    ] == children
+    assert all(children)
+    database.close()
@@ -0,0 +1,81 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.settings import Settings
+from scrapy_splash import SplashRequest
+
+from trustoo_crawler.dupefilters import ListingDupeFilter, ListingIndex
+from trustoo_crawler.utils import get_listing_id
+
+BUSINESS_URL = "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker+%26+McKenzie+Amsterdam+NV/"
+
+
+@pytest.mark.parametrize(
+    ("url", "expected"),
+    [
+        pytest.param(BUSINESS_URL, "L119193538", id="business"),
+        pytest.param(
+            "https://www.goudengids.nl/nl/zoeken/advocaten/1/", None, id="search"
+        ),
+    ],
+)
+def test_get_listing_id(url: str, expected: str | None):
+    assert get_listing_id(url) == expected
+
+
+class TestListingIndex:
+    def test_add(self):
+        index = ListingIndex(capacity=1000)
+        assert not index.add("L1")
+        assert index.add("L1")
+        assert "L1" in index
+        assert "L2" not in index
+
+    def test_false_positives(self):
+        index = ListingIndex(capacity=10_000, error_rate=1e-3)
+        for number in range(10_000):
+            index.add(f"L{number}")
+        false_positives = sum(f"L{number}" in index for number in range(10_000, 20_000))
+        assert false_positives < 50
+
+    def test_reopen(self, tmp_path: Path):
+        path = tmp_path / "listings.index"
+        index = ListingIndex(capacity=1000, path=path)
+        index.add("L1")
+        index.close()
+        # The dimensions of the existing file take precedence
+        reopened = ListingIndex(capacity=5, path=path)
+        assert reopened.bits == index.bits
+        assert "L1" in reopened
+        reopened.close()
+
+
+class TestListingDupeFilter:
+    @pytest.fixture()
+    def dupefilter(self) -> ListingDupeFilter:
+        return ListingDupeFilter.from_settings(
+            Settings({"LISTING_INDEX_CAPACITY": 1000})
+        )
+
+    def test_same_listing(self, dupefilter: ListingDupeFilter):
+        assert not dupefilter.request_seen(Request(BUSINESS_URL))
+        # Found in another category, rendered this time
+        other_url = "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker/"
+        assert dupefilter.request_seen(SplashRequest(other_url, args={"wait": 1}))
+
+    def test_other_requests(self, dupefilter: ListingDupeFilter):
+        url = "https://www.goudengids.nl/nl/zoeken/advocaten/1/"
+        assert not dupefilter.request_seen(Request(url))
+        assert dupefilter.request_seen(Request(url))
+
+    def test_job_dir(self, tmp_path: Path):
+        dupefilter = ListingDupeFilter.from_settings(
+            Settings({"JOBDIR": str(tmp_path), "LISTING_INDEX_CAPACITY": 1000})
+        )
+        dupefilter.request_seen(Request(BUSINESS_URL))
+        dupefilter.close("finished")
+        resumed = ListingDupeFilter.from_settings(
+            Settings({"JOBDIR": str(tmp_path), "LISTING_INDEX_CAPACITY": 1000})
+        )
+        assert resumed.request_seen(Request(BUSINESS_URL))
@@ -0,0 +1,93 @@
+from collections.abc import Iterable
+from io import BytesIO
+
+import pytest
+from itemadapter import ItemAdapter
+
+from benchmarks.utils import load_business_pages
+from trustoo_crawler.extraction import BusinessPageExtractor
+from trustoo_crawler.items import (
+    AnyBusinessItem,
+    BusinessItem,
+    BusinessRecord,
+    WorkingTimes,
+)
+from trustoo_crawler.normalization import normalize_item
+from trustoo_crawler.utils import get_listing_id
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from trustoo_crawler.exporters import ParquetItemExporter  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def business_items() -> list[BusinessItem]:
+    items = []
+    for response in load_business_pages():
+        item = BusinessPageExtractor(response.selector.root).extract()
+        item["listing_id"] = get_listing_id(response.url)
+        # As they come out of the pipelines
+        item["logo_file"] = "files/ab/ab.png" if item.get("logo") else None
+        item["picture_files"] = [None] * len(item.get("pictures") or [])
+        items.append(normalize_item(item))
+    return items
+
+
+def export(items: Iterable[AnyBusinessItem], **kwargs) -> BytesIO:
+    file = BytesIO()
+    exporter = ParquetItemExporter(file, **kwargs)
+    exporter.start_exporting()
+    for item in items:
+        exporter.export_item(item)
+    exporter.finish_exporting()
+    file.seek(0)
+    return file
+
+
+def test_round_trip(business_items: list[BusinessItem]):
+    rows = pq.read_table(export(business_items)).to_pylist()
+    # Maps are read back as lists of key-value pairs
+    for row in rows:
+        for field in ("other_information", "parking_info", "economic_data"):
+            row[field] = dict(row[field])
+    assert rows == [
+        {
+            **ItemAdapter(item).asdict(),
+            "working_time": dict(item["working_time"]),
+        }
+        for item in business_items
+    ]
+
+
+def test_row_groups(business_items: list[BusinessItem]):
+    file = export(business_items * 3, row_group_size=2)
+    metadata = pq.ParquetFile(file).metadata
+    assert metadata.num_rows == 9
+    assert metadata.num_row_groups == 5
+
+
+def test_fields_to_export(business_items: list[BusinessItem]):
+    file = export(business_items, fields_to_export={"listing_id": "id", "name": "name"})
+    assert pq.read_table(file).to_pylist()[0] == {
+        "id": "L119193538",
+        "name": "Baker & McKenzie Amsterdam NV",
+    }
+
+
+def test_missing_fields():
+    rows = pq.read_table(export([BusinessItem(name="Breewel")])).to_pylist()
+    assert rows[0]["name"] == "Breewel"
+    assert rows[0]["working_time"] is None
+
+
+def test_business_record(business_items: list[BusinessItem]):
+    records = [
+        BusinessRecord(
+            **{
+                **item,
+                "working_time": WorkingTimes(**item["working_time"]),
+            }
+        )
+        for item in business_items
+    ]
+    assert pq.read_table(export(records)).equals(pq.read_table(export(business_items)))
@@ -0,0 +1,140 @@
+import json
+from dataclasses import dataclass, field, fields
+
+import pytest
+from scrapy.exporters import PythonItemExporter
+from scrapy.http import HtmlResponse
+
+from tests.test_gouden_gids.test_spider import LawyerResponse
+from trustoo_crawler.extraction import (
+    FIELD_PROFILES,
+    FIELDS,
+    BusinessPageExtractor,
+    field_default,
+    normalize_space,
+    select_fields,
+)
+from trustoo_crawler.normalization import normalize_item
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+from trustoo_crawler.utils import DutchWeekDay
+
+
+class TestBusinessPageExtractor:
+    @pytest.mark.parametrize(
+        "response",
+        [pytest.param(response.value, id=response.name) for response in LawyerResponse],
+    )
+    def test_extract_matches_xpaths(self, response: HtmlResponse):
+        expected = GoudenGidsSpider.extract_business_item(response)
+        item = BusinessPageExtractor(response.selector.root).extract()
+        # Compare the serialized items to also catch differences in ordering
+        assert json.dumps(dict(item), default=dict) == json.dumps(
+            dict(expected), default=dict
+        )
+
+    @pytest.mark.parametrize(
+        "response",
+        [pytest.param(response.value, id=response.name) for response in LawyerResponse],
+    )
+    def test_extract_record(self, response: HtmlResponse):
+        extractor = BusinessPageExtractor(response.selector.root)
+        item = extractor.extract()
+        record = extractor.extract_record()
+        assert (
+            record.working_time.on(DutchWeekDay.MONDAY)
+            == (item["working_time"]["monday"])
+        )
+        # Exported, both models look the same
+        item["listing_id"] = record.listing_id = "L1"
+        # Without `AssetPipeline`, the record keeps the defaults of its files
+        item["logo_file"] = item["picture_files"] = None
+        normalize_item(item)
+        normalize_item(record)
+        exporter = PythonItemExporter()
+        assert exporter.export_item(record) == exporter.export_item(item)
+
+    @pytest.mark.parametrize(
+        "response",
+        [pytest.param(response.value, id=response.name) for response in LawyerResponse],
+    )
+    def test_extract_selected_fields(self, response: HtmlResponse):
+        full = BusinessPageExtractor(response.selector.root).fields()
+        fields = ("name", "phone", "website", "review_count")
+        extractor = BusinessPageExtractor(response.selector.root, fields)
+        assert extractor.fields() == {field: full[field] for field in fields}
+        # The sections of the other fields aren't even looked for
+        assert not extractor.anchors["working_time"]
+        assert not extractor.list_span_texts
+        record = extractor.extract_record()
+        assert record.name == full["name"]
+        assert record.description == ""
+        assert extractor.extract()["description"] == ""
+
+    @pytest.mark.parametrize("profile", FIELD_PROFILES)
+    def test_extract_profile(self, profile: str):
+        response = LawyerResponse.BREEWEL.value
+        extractor = BusinessPageExtractor(
+            response.selector.root, FIELD_PROFILES[profile]
+        )
+        item = extractor.extract()
+        record = extractor.extract_record()
+        # Both models have every field, those that weren't selected are empty
+        assert list(item) == list(FIELDS)
+        exporter = PythonItemExporter()
+        assert exporter.export_item(item) == {
+            field: value
+            for field, value in exporter.export_item(record).items()
+            if field in FIELDS
+        }
+
+    def test_extract_empty_page(self):
+        response = HtmlResponse(
+            url="https://www.goudengids.nl/", body=b"<html></html>", encoding="utf-8"
+        )
+        item = BusinessPageExtractor(response.selector.root).extract()
+        assert item == GoudenGidsSpider.extract_business_item(response)
+        assert item["name"] == ""
+        assert item["pictures"] == []
+
+    @pytest.mark.parametrize(
+        ("text", "expected"),
+        [
+            pytest.param(None, "", id="none"),
+            pytest.param("  a \n\t b  ", "a b", id="whitespace"),
+            pytest.param("a\xa0 b", "a\xa0 b", id="non-breaking-space"),
+        ],
+    )
+    def test_normalize_space(self, text: str | None, expected: str):
+        assert normalize_space(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("selection", "expected"),
+    [
+        pytest.param("leads", FIELD_PROFILES["leads"], id="profile"),
+        pytest.param("full", FIELDS, id="full"),
+        pytest.param("website, name,phone,", ("name", "phone", "website"), id="fields"),
+    ],
+)
+def test_select_fields(selection: str, expected: tuple[str, ...]):
+    assert select_fields(selection) == expected
+
+
+@pytest.mark.parametrize("selection", ["name,fax", ","])
+def test_select_fields_invalid(selection: str):
+    with pytest.raises(ValueError):
+        select_fields(selection)
+
+
+def test_field_default():
+    @dataclass
+    class Record:
+        required: str
+        name: str = ""
+        pictures: list[str] = field(default_factory=list)
+
+    assert [field_default(record_field) for record_field in fields(Record)] == [
+        None,
+        "",
+        [],
+    ]
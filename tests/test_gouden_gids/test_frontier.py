@@ -0,0 +1,189 @@
+import pickle
+from pathlib import Path
+
+import pytest
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.test import get_crawler
+
+from trustoo_crawler.frontier import (
+    ENTRY_ID_META,
+    FrontierEntry,
+    FrontierScheduler,
+    SQLiteFrontier,
+)
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+from trustoo_crawler.workers import check_frontier, merge_parts
+
+BUSINESS_URL = "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker/"
+
+
+@pytest.fixture()
+def frontier(tmp_path: Path) -> SQLiteFrontier:
+    return SQLiteFrontier(tmp_path / "frontier.sqlite")
+
+
+def scheduler(path: Path, worker: str, **settings) -> FrontierScheduler:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {"FRONTIER_PATH": str(path), "FRONTIER_WORKER": worker, **settings},
+    )
+    crawler.stats.open_spider(GoudenGidsSpider())  # pyright: ignore[reportOptionalMemberAccess]
+    scheduler = FrontierScheduler.from_crawler(crawler)
+    scheduler.spider = GoudenGidsSpider()
+    return scheduler
+
+
+def test_push_deduplicates(frontier: SQLiteFrontier):
+    assert frontier.push(FrontierEntry("L1", 0, b"first"))
+    assert not frontier.push(FrontierEntry("L1", 0, b"again"))
+    # Requests without a key aren't filtered
+    assert frontier.push(FrontierEntry(None, 0, b"a"))
+    assert frontier.push(FrontierEntry(None, 0, b"a"))
+    assert frontier.queued() == 3
+
+
+def test_lease_by_priority(frontier: SQLiteFrontier):
+    for key, priority in (("search", -10), ("business", 0), ("parking", 10)):
+        frontier.push(FrontierEntry(key, priority, key.encode()))
+    assert [data for _, data in frontier.lease("a", 2)] == [b"parking", b"business"]
+    # Leased requests are not handed to another worker
+    assert [data for _, data in frontier.lease("b", 2)] == [b"search"]
+    assert frontier.lease("b", 2) == []
+
+
+def test_ack_keeps_the_key(frontier: SQLiteFrontier):
+    frontier.push(FrontierEntry("L1", 0, b"request"))
+    [(entry_id, _)] = frontier.lease("a", 1)
+    frontier.ack(entry_id)
+    assert frontier.queued() == 0
+    assert not frontier.push(FrontierEntry("L1", 0, b"request"))
+
+
+def test_release(frontier: SQLiteFrontier):
+    frontier.push(FrontierEntry("L1", 0, b"request"))
+    frontier.lease("a", 1)
+    frontier.release("a")
+    assert [data for _, data in frontier.lease("b", 1)] == [b"request"]
+
+
+def test_workers_that_are_gone(tmp_path: Path):
+    frontier = SQLiteFrontier(tmp_path / "frontier.sqlite", worker_timeout=0)
+    frontier.heartbeat("a", idle=False)
+    frontier.push(FrontierEntry("L1", 0, b"request"))
+    frontier.lease("a", 1)
+    # Worker "a" stopped sending heartbeats, so its requests are taken over
+    assert [data for _, data in frontier.lease("b", 1)] == [b"request"]
+    assert frontier.busy_workers(exclude="b") == 0
+
+
+def test_busy_workers(frontier: SQLiteFrontier):
+    frontier.heartbeat("a", idle=False)
+    frontier.heartbeat("b", idle=True)
+    assert frontier.busy_workers(exclude="b") == 1
+    assert frontier.busy_workers(exclude="a") == 0
+
+
+def test_scheduler_shares_requests(tmp_path: Path):
+    path = tmp_path / "frontier.sqlite"
+    first, second = scheduler(path, "first"), scheduler(path, "second")
+    assert first.enqueue_request(Request(BUSINESS_URL))
+    # The same business, found in another category by another worker
+    assert not second.enqueue_request(
+        Request("https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Other/")
+    )
+    assert second.has_pending_requests()
+    request = second.next_request()
+    assert request is not None
+    assert request.url == BUSINESS_URL
+    assert first.next_request() is None
+
+
+def test_scheduler_acks_downloaded_requests(tmp_path: Path):
+    worker = scheduler(tmp_path / "frontier.sqlite", "worker")
+    worker.enqueue_request(Request(BUSINESS_URL))
+    worker.enqueue_request(Request(BUSINESS_URL.replace("L119193538", "L2")))
+    downloaded, dropped = worker.next_request(), worker.next_request()
+    assert downloaded is not None and dropped is not None
+    # Handed over, but not downloaded yet
+    assert isinstance(worker.frontier, SQLiteFrontier)
+    assert worker.frontier.connection.execute(
+        "SELECT COUNT(*) FROM requests WHERE data IS NOT NULL"
+    ).fetchone() == (2,)
+    worker.crawler.signals.send_catch_log(
+        signals.request_left_downloader, request=downloaded, spider=worker.spider
+    )
+    assert worker.in_progress == {dropped.meta[ENTRY_ID_META]}
+    # The requests that never reached the downloader are done with on close
+    worker.close("finished")
+    frontier = SQLiteFrontier(tmp_path / "frontier.sqlite")
+    assert frontier.lease("other", 2) == []
+
+
+def test_scheduler_crashed_mid_download(tmp_path: Path):
+    path = tmp_path / "frontier.sqlite"
+    crashed = scheduler(path, "crashed", FRONTIER_WORKER_TIMEOUT=0)
+    crashed.enqueue_request(Request(BUSINESS_URL))
+    crashed.heartbeat()
+    assert crashed.next_request() is not None
+    # It never acks the request, so another worker downloads it instead
+    other = scheduler(path, "other", FRONTIER_WORKER_TIMEOUT=0)
+    request = other.next_request()
+    assert request is not None
+    assert request.url == BUSINESS_URL
+
+
+def test_scheduler_keeps_callbacks(tmp_path: Path):
+    worker = scheduler(tmp_path / "frontier.sqlite", "worker")
+    spider = worker.spider
+    assert isinstance(spider, GoudenGidsSpider)
+    worker.enqueue_request(spider.search_page_request("advocaten", 2))
+    request = worker.next_request()
+    assert request is not None
+    assert request.callback == spider.parse_page
+    assert request.cb_kwargs == {"category": "advocaten", "page_number": 2}
+    assert pickle.loads(pickle.dumps(request.to_dict(spider=spider)))
+
+
+def test_scheduler_waits_for_busy_workers(tmp_path: Path):
+    path = tmp_path / "frontier.sqlite"
+    first, second = scheduler(path, "first"), scheduler(path, "second")
+    first.frontier.heartbeat("first", idle=False)
+    with pytest.raises(DontCloseSpider):
+        second.spider_idle(GoudenGidsSpider())
+    first.spider_idle(GoudenGidsSpider())
+
+
+def test_check_frontier(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    path = tmp_path / "frontier.sqlite"
+    check_frontier(path)
+    frontier = SQLiteFrontier(path)
+    frontier.push(FrontierEntry("L1", 0, b"request"))
+    [(entry_id, _)] = frontier.lease("a", 1)
+    check_frontier(path)
+    assert not caplog.records
+    # A previous run crawled everything
+    frontier.ack(entry_id)
+    frontier.close()
+    check_frontier(path)
+    assert "has no pending requests" in caplog.text
+
+
+@pytest.mark.parametrize(
+    ("suffix", "parts", "expected"),
+    [
+        pytest.param(
+            ".csv", [b"a,b\n1,2\n", b"a,b\n3,4\n"], b"a,b\n1,2\n3,4\n", id="csv"
+        ),
+        pytest.param(
+            ".jl", [b'{"a": 1}\n', b'{"a": 2}\n'], b'{"a": 1}\n{"a": 2}\n', id="jl"
+        ),
+    ],
+)
+def test_merge_parts(tmp_path: Path, suffix: str, parts: list[bytes], expected: bytes):
+    paths = [tmp_path / f"part{index}{suffix}" for index in range(len(parts) + 1)]
+    for path, content in zip(paths, parts, strict=False):
+        path.write_bytes(content)
+    # The last worker didn't write anything
+    merge_parts(paths, tmp_path / f"results{suffix}")
+    assert (tmp_path / f"results{suffix}").read_bytes() == expected
@@ -0,0 +1,190 @@
+import json
+from pathlib import Path
+
+import pytest
+from itemadapter import ItemAdapter
+from scrapy import Request
+from scrapy.http import HtmlResponse, Response, TextResponse
+from scrapy.utils.test import get_crawler
+from scrapy_splash import SplashRequest
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.httpcache import (
+    ContentAddressedCacheStorage,
+    ResponseCache,
+    cache_key,
+    cache_target,
+)
+from trustoo_crawler.normalization import normalize_phone
+from trustoo_crawler.reparse import reparse
+from trustoo_crawler.spiders.gouden_gids import (
+    DYNAMIC_SECTION_SELECTORS,
+    GoudenGidsSpider,
+)
+from trustoo_crawler.splash import render_args
+
+RESPONSES_PATH = "test_gouden_gids/responses"
+HENDRICKS_URL = (
+    "https://www.goudengids.nl/nl/bedrijf/Deurne/L145578951/Advocatenkantoor+Hendriks/"
+)
+BREEWEL_URL = (
+    "https://www.goudengids.nl/nl/bedrijf/Bergen+op+Zoom/L146093845/Breewel+Advocatuur/"
+)
+PARKING_URL = "https://www.goudengids.nl/api/seety/parking/?lat=51.46559&lng=5.79714"
+
+
+def processed(request: SplashRequest, splash_url: str, **headers: str) -> Request:
+    """Return the request that `SplashMiddleware` sends to a Splash instance."""
+    meta = {**request.meta, "_splash_processed": True}
+    meta["splash"] = {
+        **meta["splash"],
+        "splash_url": splash_url,
+        "args": {**meta["splash"]["args"], "headers": headers},
+    }
+    return Request(f"{splash_url}/execute", method="POST", meta=meta)
+
+
+def render_request(url: str, **kwargs) -> SplashRequest:
+    return SplashRequest(url, endpoint="execute", args=render_args(10, **kwargs))
+
+
+@pytest.fixture(params=["zstd", "gzip"])
+def cache(tmp_path: Path, request: pytest.FixtureRequest) -> ResponseCache:
+    return ResponseCache(tmp_path / "gouden_gids", request.param)
+
+
+def store(cache: ResponseCache, request: Request, body: bytes) -> None:
+    url, render = cache_target(request)
+    cache.put(cache_key(request), url, render, 200, b"", body)
+
+
+class TestResponseCache:
+    def test_body(self, cache: ResponseCache):
+        store(cache, Request(HENDRICKS_URL), b"<html>Hendriks</html>")
+        cached = cache.get(cache_key(Request(HENDRICKS_URL)))
+        assert cached is not None
+        assert cached.url == HENDRICKS_URL
+        assert cached.render is None
+        assert cache.body(cached.digest) == b"<html>Hendriks</html>"
+        assert cache.get(cache_key(Request(BREEWEL_URL))) is None
+
+    def test_content_addressed(self, cache: ResponseCache):
+        store(cache, Request(HENDRICKS_URL), b"<html></html>")
+        store(cache, Request(BREEWEL_URL), b"<html></html>")
+        assert len(list(cache.path.glob("bodies/*/*"))) == 1
+        # The body stays as long as a response refers to it
+        cache.connection.execute("DELETE FROM responses WHERE url = ?", (BREEWEL_URL,))
+        cache.remove_orphans()
+        assert len(list(cache.path.glob("bodies/*/*"))) == 1
+
+    def test_render_key(self):
+        request = render_request(HENDRICKS_URL)
+        key = cache_key(processed(request, "http://splash-1:8050", UserAgent="a"))
+        # Neither the Splash instance nor the headers change what is rendered
+        assert key == cache_key(
+            processed(request, "http://splash-2:8050", UserAgent="b")
+        )
+        assert key != cache_key(Request(HENDRICKS_URL))
+        fragments = render_request(HENDRICKS_URL, selectors=DYNAMIC_SECTION_SELECTORS)
+        assert key != cache_key(processed(fragments, "http://splash-1:8050"))
+        assert cache_target(processed(request, "http://splash-1:8050"))[0] == (
+            HENDRICKS_URL
+        )
+
+    def test_expire(self, cache: ResponseCache):
+        store(cache, Request(HENDRICKS_URL), b"<html></html>")
+        cache.connection.execute("UPDATE responses SET stored_at = stored_at - 100")
+        assert cache.get(cache_key(Request(HENDRICKS_URL)), max_age=10) is None
+        assert cache.expire(10) == 1
+        assert cache.size() == 0
+        assert not list(cache.path.glob("bodies/*/*"))
+
+    def test_evict(self, cache: ResponseCache):
+        for index in range(10):
+            store(cache, Request(f"{HENDRICKS_URL}?{index}"), bytes(range(256)) * index)
+        # The response that was used last is kept
+        cache.connection.execute("UPDATE responses SET accessed_at = accessed_at - 10")
+        assert cache.get(cache_key(Request(f"{HENDRICKS_URL}?9"))) is not None
+        size = cache.size()
+        assert cache.evict(size // 2) > 0
+        assert 0 < cache.size() <= size // 2
+        assert cache.get(cache_key(Request(f"{HENDRICKS_URL}?9"))) is not None
+
+
+def test_storage(tmp_path: Path):
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {"HTTPCACHE_DIR": str(tmp_path), "HTTPCACHE_COMPRESSION": "gzip"},
+    )
+    spider = GoudenGidsSpider.from_crawler(crawler)
+    storage = ContentAddressedCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    request = Request(HENDRICKS_URL)
+    assert storage.retrieve_response(spider, request) is None
+    response = HtmlResponse(
+        HENDRICKS_URL,
+        status=200,
+        headers={"Content-Type": "text/html; charset=utf-8"},
+        body=b"<html>Hendriks</html>",
+    )
+    storage.store_response(spider, request, response)
+    cached = storage.retrieve_response(spider, request)
+    assert isinstance(cached, HtmlResponse)
+    assert cached.body == response.body
+    assert cached.headers["Content-Type"] == b"text/html; charset=utf-8"
+    storage.close_spider(spider)
+    assert (tmp_path / "gouden_gids" / "index.sqlite").exists()
+
+
+def test_reparse(tmp_path: Path):
+    cache = ResponseCache(tmp_path / "gouden_gids")
+    for file_name, url in (
+        ("hendricks_short_description.html", HENDRICKS_URL),
+        ("breewel_payment_options.html", BREEWEL_URL),
+    ):
+        response = read_response_from_file(Path(f"{RESPONSES_PATH}/{file_name}"), url)
+        store(cache, Request(url), response.body)
+    parking = read_response_from_file(
+        Path(f"{RESPONSES_PATH}/seety_parking_breewel.json"), PARKING_URL, TextResponse
+    )
+    store(cache, Request(PARKING_URL), parking.body)
+    # The render of the economic data of Hendriks, which only has placeholders
+    rendered = json.dumps(
+        {
+            "url": HENDRICKS_URL,
+            "html": '<div id="economic-data"><ul><li><span>KVK-nummer:</span>'
+            "<span>12345678</span></li></ul></div>",
+        }
+    ).encode()
+    fragments = render_request(HENDRICKS_URL, selectors=DYNAMIC_SECTION_SELECTORS)
+    store(cache, processed(fragments, "http://splash-1:8050"), rendered)
+    # Not a business page
+    store(cache, Request("https://www.goudengids.nl/nl/zoeken/advocaten/1/"), b"")
+
+    items = {
+        item["listing_id"]: item
+        for item in map(ItemAdapter, reparse(cache, processes=1))
+    }
+    assert set(items) == {"L145578951", "L146093845"}
+    hendricks = items["L145578951"]
+    assert hendricks["name"] == "Advocatenkantoor Hendriks"
+    assert hendricks["parking_info"]["Soort parking:"] == ["Betalend"]
+    assert items["L146093845"]["parking_info"]["Soort parking:"] == ["Betalend"]
+    # Normalized, like the items that go through the pipelines
+    assert hendricks["phone_e164"] == normalize_phone(hendricks["phone"]) is not None
+    assert hendricks["address"]["city"] == "Deurne"
+
+
+def test_response_class(tmp_path: Path):
+    crawler = get_crawler(GoudenGidsSpider, {"HTTPCACHE_DIR": str(tmp_path)})
+    spider = GoudenGidsSpider.from_crawler(crawler)
+    storage = ContentAddressedCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    request = Request(PARKING_URL)
+    storage.store_response(
+        spider,
+        request,
+        Response(PARKING_URL, headers={"Content-Type": "application/json"}, body=b"{}"),
+    )
+    assert isinstance(storage.retrieve_response(spider, request), TextResponse)
+    storage.close_spider(spider)
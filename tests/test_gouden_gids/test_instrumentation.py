@@ -0,0 +1,116 @@
+import json
+import math
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.instrumentation import (
+    Histogram,
+    InstrumentationMiddleware,
+    Timings,
+)
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+BUSINESS_URL = (
+    "https://www.goudengids.nl/nl/bedrijf/Deurne/L145578951/Advocatenkantoor+Hendriks/"
+)
+
+
+@pytest.fixture()
+def middleware(tmp_path: Path, spider: GoudenGidsSpider) -> InstrumentationMiddleware:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {
+            "INSTRUMENTATION_ENABLED": True,
+            "INSTRUMENTATION_INTERVAL": 0,
+            "INSTRUMENTATION_SNAPSHOT_PATH": str(tmp_path / "timings.json"),
+        },
+    )
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    return InstrumentationMiddleware.from_crawler(crawler)
+
+
+def test_not_configured():
+    with pytest.raises(NotConfigured):
+        InstrumentationMiddleware.from_crawler(
+            get_crawler(GoudenGidsSpider, {"INSTRUMENTATION_ENABLED": False})
+        )
+
+
+def test_histogram():
+    histogram = Histogram()
+    for seconds in (0.002, 0.003, 0.004, 0.2, 120):
+        histogram.observe(seconds)
+    assert histogram.count == 5
+    assert histogram.sum == pytest.approx(120.209)
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.8) == 0.25
+    # The last bucket has no upper bound, the maximum is the best guess
+    assert histogram.quantile(0.99) == 120
+    assert Histogram().quantile(0.5) == 0
+
+
+def test_prometheus():
+    timings = Timings()
+    timings.observe("download", 0.3)
+    timings.observe("download", 0.7)
+    lines = timings.prometheus().splitlines()
+    assert 'trustoo_crawler_stage_seconds_bucket{stage="download",le="0.25"} 0' in lines
+    assert 'trustoo_crawler_stage_seconds_bucket{stage="download",le="0.5"} 1' in lines
+    assert 'trustoo_crawler_stage_seconds_bucket{stage="download",le="+Inf"} 2' in lines
+    assert 'trustoo_crawler_stage_seconds_count{stage="download"} 2' in lines
+
+
+def test_stages(middleware: InstrumentationMiddleware, spider: GoudenGidsSpider):
+    request = Request(BUSINESS_URL)
+    middleware.request_scheduled(request, spider)
+    middleware.request_reached_downloader(request, spider)
+    request.meta["download_latency"] = 0.4
+    middleware.response_received(Response(BUSINESS_URL), request, spider)
+    render = Request(
+        "http://localhost:8050/execute",
+        meta={"_splash_processed": True, "download_latency": 2.0},
+    )
+    middleware.response_received(Response(render.url), render, spider)
+    histograms = middleware.timings.histograms
+    assert histograms["queue_wait"].count == 1
+    assert histograms["download"].sum == 0.4
+    assert histograms["render"].sum == 2.0
+
+
+def test_callbacks(middleware: InstrumentationMiddleware, spider: GoudenGidsSpider):
+    middleware.spider_opened(spider)
+    assert spider.timings is middleware.timings
+    response = read_response_from_file(
+        Path("test_gouden_gids/responses/hendricks_short_description.html"),
+        BUSINESS_URL,
+    )
+    response.request = Request(BUSINESS_URL, callback=spider.parse_business_page)
+    output = list(
+        middleware.process_spider_output(
+            response, spider.parse_business_page(response), spider
+        )
+    )
+    assert [request.url for request in output] == [
+        request.url
+        for request in spider.parse_business_page(response)
+        if isinstance(request, Request)
+    ]
+    histograms = middleware.timings.histograms
+    assert histograms["callback/parse_business_page"].count == 1
+    assert histograms["extraction/walk"].count == 2
+    assert histograms["field/working_time"].count == 2
+
+    middleware.spider_closed(spider)
+    stats = middleware.stats
+    assert stats.get_value("timing/callback/parse_business_page/count") == 1
+    assert stats.get_value("timing/field/name/p95") > 0
+    snapshot = json.loads(Path(middleware.snapshot_path).read_text())  # pyright: ignore[reportArgumentType]
+    assert snapshot["timings"]["field/name"]["count"] == 2
+    assert sum(snapshot["timings"]["field/name"]["buckets"].values()) == 2
+    assert str(math.inf) in snapshot["timings"]["field/name"]["buckets"]
@@ -0,0 +1,158 @@
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from scrapy.utils.test import get_crawler
+from twisted.internet.defer import Deferred, fail, succeed
+
+from trustoo_crawler.items import BusinessItem, BusinessRecord, ReviewItem
+from trustoo_crawler.media import AssetStore, make_thumbnails
+from trustoo_crawler.pipelines import AssetPipeline
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+IMAGES = "https://i.fcrmedia.com/goudengids.nl/images/w460/000/048"
+CHAIN_LOGO = f"{IMAGES}/079/48079788_advocatenkantoor_zeeland_logo.webp"
+OTHER_CHAIN_LOGO = f"{IMAGES}/079/48079799_advocatenkantoor_zeeland_logo.webp"
+PICTURE = f"{IMAGES}/310/48310966_breewel_advocatuur_traffic_image.webp"
+
+
+class FakeFetcher:
+    """Serves the bodies of some URLs, or leaves the downloads pending."""
+
+    def __init__(self, bodies: dict[str, bytes], *, pending: bool = False):
+        self.bodies = bodies
+        self.pending = pending
+        self.fetched: list[str] = []
+        self.downloads: dict[str, Deferred] = {}
+
+    def fetch(self, url: str) -> Deferred:
+        self.fetched.append(url)
+        if self.pending:
+            return self.downloads.setdefault(url, Deferred())
+        if url not in self.bodies:
+            return fail(ValueError(f"{url} answered with 404"))
+        return succeed((self.bodies[url], "image/webp"))
+
+    def close(self) -> Deferred:
+        return succeed(None)
+
+
+def pipeline(path: Path, fetcher: FakeFetcher) -> AssetPipeline:
+    crawler = get_crawler(GoudenGidsSpider)
+    crawler.stats.open_spider(GoudenGidsSpider())  # pyright: ignore[reportOptionalMemberAccess]
+    return AssetPipeline(
+        AssetStore(path),
+        fetcher,  # pyright: ignore[reportArgumentType]
+        crawler.stats,  # pyright: ignore[reportArgumentType]
+    )
+
+
+def process(pipeline: AssetPipeline, item) -> Deferred:
+    return pipeline.process_item(item, None)  # pyright: ignore[reportArgumentType]
+
+
+def test_deduplication(tmp_path: Path):
+    fetcher = FakeFetcher(
+        # Both branches of the chain have the same logo
+        {CHAIN_LOGO: b"logo", OTHER_CHAIN_LOGO: b"logo", PICTURE: b"picture"}
+    )
+    assets = pipeline(tmp_path, fetcher)
+    items = [
+        BusinessItem(logo=CHAIN_LOGO, pictures=[PICTURE, PICTURE]),
+        BusinessRecord(logo=CHAIN_LOGO),
+        BusinessItem(logo=OTHER_CHAIN_LOGO, pictures=[]),
+    ]
+    for item in items:
+        result = []
+        process(assets, item).addCallback(result.append)
+        assert result == [item]
+    assert fetcher.fetched == [CHAIN_LOGO, PICTURE, OTHER_CHAIN_LOGO]
+    assert len(list(tmp_path.glob("files/*/*"))) == 2
+    assert assets.stats.get_value("media/duplicate_content") == 1
+    assert assets.store.get(OTHER_CHAIN_LOGO).digest == (  # pyright: ignore[reportOptionalMemberAccess]
+        assets.store.get(CHAIN_LOGO).digest  # pyright: ignore[reportOptionalMemberAccess]
+    )
+    # The files of the images are set on the items, the same file for the same content
+    logo_file = items[0]["logo_file"]
+    assert (tmp_path / logo_file).read_bytes() == b"logo"
+    assert items[0]["picture_files"][0] == items[0]["picture_files"][1] != logo_file
+    assert items[1].logo_file == items[2]["logo_file"] == logo_file
+    assert items[1].picture_files == items[2]["picture_files"] == []
+    assets.store.close()
+
+    # The next crawl downloads nothing
+    fetcher = FakeFetcher({})
+    assets = pipeline(tmp_path, fetcher)
+    for item in items:
+        process(assets, item)
+    assert not fetcher.fetched
+    assert assets.stats.get_value("media/stored_already") == 4
+
+
+def test_shared_download(tmp_path: Path):
+    fetcher = FakeFetcher({}, pending=True)
+    assets = pipeline(tmp_path, fetcher)
+    done = []
+    for listing_id in ("L1", "L2"):
+        item = BusinessItem(listing_id=listing_id, logo=CHAIN_LOGO)
+        process(assets, item).addCallback(done.append)
+    assert fetcher.fetched == [CHAIN_LOGO]
+    assert not done
+    fetcher.downloads[CHAIN_LOGO].callback((b"logo", "image/webp"))
+    assert sorted(item["listing_id"] for item in done) == ["L1", "L2"]
+    assert assets.store.get(CHAIN_LOGO) is not None
+
+
+def test_failed_download(tmp_path: Path):
+    fetcher = FakeFetcher({PICTURE: b"picture"})
+    assets = pipeline(tmp_path, fetcher)
+    item = BusinessItem(logo="logo.webp", pictures=[CHAIN_LOGO, PICTURE])
+    result = []
+    process(assets, item).addCallback(result.append)
+    # The item goes on without the images that couldn't be downloaded
+    assert result == [item]
+    assert assets.stats.get_value("media/failed") == 1
+    assert assets.stats.get_value("media/invalid_url") == 1
+    assert assets.store.get(CHAIN_LOGO) is None
+    assert assets.store.get(PICTURE) is not None
+    assert item["logo_file"] is None
+    assert item["picture_files"] == [None, assets.store.get(PICTURE).file_name]  # pyright: ignore[reportOptionalMemberAccess]
+
+
+def test_other_items(tmp_path: Path):
+    fetcher = FakeFetcher({})
+    assets = pipeline(tmp_path, fetcher)
+    review = ReviewItem(listing_id="L1", rating=4)
+    result = []
+    process(assets, review).addCallback(result.append)
+    assert result == [review]
+    assert dict(review) == {"listing_id": "L1", "rating": 4}
+    assert not fetcher.fetched
+
+
+def test_thumbnails(tmp_path: Path):
+    image_module = pytest.importorskip("PIL.Image")
+    logo = BytesIO()
+    image_module.new("RGBA", (800, 200), (255, 0, 0, 128)).save(logo, "PNG")
+    fetcher = FakeFetcher({CHAIN_LOGO: logo.getvalue(), PICTURE: b"<svg></svg>"})
+    assets = pipeline(tmp_path, fetcher)
+    assets.thumbnails = {"small": (100, 100), "medium": (400, 400)}
+    process(assets, BusinessItem(logo=CHAIN_LOGO, pictures=[PICTURE]))
+    stored = assets.store.get(CHAIN_LOGO)
+    assert stored is not None
+    with image_module.open(assets.store.thumbnail_path(stored, "small")) as small:
+        assert small.size == (100, 25)
+        assert small.format == "JPEG"
+    assert assets.stats.get_value("media/thumbnails") == 2
+    # Not an image that pillow can read
+    assert assets.stats.get_value("media/thumbnails_failed") == 1
+
+
+def test_make_thumbnails(tmp_path: Path):
+    image_module = pytest.importorskip("PIL.Image")
+    source = tmp_path / "picture.png"
+    image_module.new("RGB", (300, 600), "blue").save(source)
+    target = tmp_path / "thumbnails" / "small" / "picture.jpg"
+    assert make_thumbnails(source, {target: (150, 150)}) == 1
+    with image_module.open(target) as thumbnail:
+        assert thumbnail.size == (75, 150)
@@ -0,0 +1,133 @@
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.test import get_crawler
+
+from trustoo_crawler.items import (
+    BusinessItem,
+    BusinessRecord,
+    ReviewItem,
+    WorkingTimeItem,
+    WorkingTimes,
+)
+from trustoo_crawler.normalization import (
+    Address,
+    day_intervals,
+    normalize_item,
+    normalize_phone,
+    parse_address,
+)
+from trustoo_crawler.pipelines import NormalizationPipeline
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        pytest.param("+31205517555", "+31205517555", id="e164"),
+        pytest.param("020 - 551 75 55", "+31205517555", id="national"),
+        pytest.param("+31 (0)20 551 7555", "+31205517555", id="trunk-prefix"),
+        pytest.param("0031 493 32 18 72", "+31493321872", id="access-code"),
+        pytest.param("+32 3 123 45 67", "+3231234567", id="belgian"),
+        pytest.param("0800 1234", "+318001234", id="short"),
+        pytest.param("551 75 55", None, id="no-prefix"),
+        pytest.param("0800-BEL-ONS", None, id="letters"),
+        pytest.param("06", None, id="too-short"),
+    ],
+)
+def test_normalize_phone(text: str, expected: str | None):
+    assert normalize_phone(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        pytest.param(
+            "Claude Debussylaan 54, 1082MD Amsterdam",
+            Address("Claude Debussylaan", "54", "1082 MD", "Amsterdam"),
+            id="plain",
+        ),
+        pytest.param(
+            "Zuidzijde Haven 39/a, 4611HC Bergen op Zoom",
+            Address("Zuidzijde Haven", "39/a", "4611 HC", "Bergen op Zoom"),
+            id="addition",
+        ),
+        pytest.param(
+            "Laan 1940-1945 12 A, 6711 aa Ede",
+            Address("Laan 1940-1945", "12 A", "6711 AA", "Ede"),
+            id="digits-in-street",
+        ),
+        pytest.param("Amsterdam", None, id="city-only"),
+    ],
+)
+def test_parse_address(text: str, expected: Address | None):
+    assert parse_address(text) == expected
+
+
+@pytest.mark.parametrize(
+    ("text", "expected"),
+    [
+        pytest.param("Maandag 9:00 - 17:30", ((540, 1050),), id="day"),
+        pytest.param(
+            "Dinsdag 8.30-12.00 13.00-17.00",
+            ((510, 720), (780, 1020)),
+            id="break",
+        ),
+        pytest.param("Vrijdag 18:00 - 02:00", ((1080, 1560),), id="past-midnight"),
+        pytest.param("Zaterdag 24 uur geopend", ((0, 1440),), id="all-day"),
+        pytest.param("Zondag", (), id="closed"),
+        pytest.param("", (), id="empty"),
+    ],
+)
+def test_day_intervals(text: str, expected: tuple[tuple[int, int], ...]):
+    assert day_intervals(text) == expected
+
+
+def test_normalize_item():
+    working_time = {
+        "monday": "Maandag 9:00 - 17:30",
+        "tuesday": "Dinsdag 9:00 - 17:30",
+        "sunday": "Zondag 22:00 - 1:00",
+    }
+    item = normalize_item(
+        BusinessItem(
+            phone="0493 32 18 72",
+            location="Kerkstraat 28, 5751BH Deurne",
+            working_time=WorkingTimeItem(working_time),
+        )
+    )
+    assert item["phone_e164"] == "+31493321872"
+    assert item["address"] == {
+        "street": "Kerkstraat",
+        "house_number": "28",
+        "postcode": "5751 BH",
+        "city": "Deurne",
+    }
+    assert item["opening_hours"] == [[540, 1050], [1980, 2490], [9960, 10140]]
+    record = normalize_item(
+        BusinessRecord(
+            phone="0493 32 18 72",
+            location="Kerkstraat 28, 5751BH Deurne",
+            working_time=WorkingTimes(**working_time),
+        )
+    )
+    assert record.opening_hours == item["opening_hours"]
+    assert record.address == item["address"]
+    # Every item gets lists of its own
+    assert record.opening_hours is not item["opening_hours"]
+    empty = normalize_item(BusinessItem(name="No details"))
+    assert empty["phone_e164"] is None
+    assert empty["address"] is None
+    assert empty["opening_hours"] == []
+
+
+def test_pipeline():
+    pipeline = NormalizationPipeline.from_crawler(get_crawler(GoudenGidsSpider))
+    spider = GoudenGidsSpider()
+    item = pipeline.process_item(BusinessItem(phone="020 551 7555"), spider)
+    assert item["phone_e164"] == "+31205517555"
+    review = ReviewItem(listing_id="L1", review_id="R1")
+    assert pipeline.process_item(review, spider) == review
+    with pytest.raises(NotConfigured):
+        NormalizationPipeline.from_crawler(
+            get_crawler(GoudenGidsSpider, {"NORMALIZATION_ENABLED": False})
+        )
@@ -0,0 +1,65 @@
+import pytest
+
+from trustoo_crawler.parking import (
+    fill_parking_info,
+    format_hours,
+    format_max_stay,
+    format_prices,
+    parking_api_url,
+)
+
+
+@pytest.mark.parametrize(
+    ("parameters", "expected"),
+    [
+        pytest.param(
+            {"id": "L1", "lat": "51,5", "lng": "4.2", "isDetail": True},
+            "https://www.goudengids.nl/api/seety/parking/?lat=51.5&lng=4.2",
+            id="complete",
+        ),
+        pytest.param({"id": "L1", "lat": "51.5", "lng": "4.2"}, None, id="incomplete"),
+    ],
+)
+def test_parking_api_url(parameters: dict, expected: str | None):
+    assert parking_api_url(parameters) == expected
+
+
+@pytest.mark.parametrize(
+    ("hours", "expected"),
+    [
+        pytest.param({"0": "09:00", "1": "18:30"}, "9:00-18:30", id="single"),
+        pytest.param(
+            ["08:00", "12:00", "13:00", "18:00"], "8:00-12:00 13:00-18:00", id="double"
+        ),
+        pytest.param(["08:00", "12:00", "13:00"], "8:00-12:00", id="unpaired"),
+        pytest.param(["08:00"], "", id="single-value"),
+        pytest.param([], "", id="empty"),
+    ],
+)
+def test_format_hours(hours: dict | list, expected: str):
+    assert format_hours(hours) == expected
+
+
+def test_format_prices():
+    assert (
+        format_prices({"30": 0.5, "60": 1, "unit": "euro"})
+        == " 0.5 euro (0.5h) 1 euro (1h)"
+    )
+
+
+@pytest.mark.parametrize(
+    ("max_stay", "expected"),
+    [
+        pytest.param(30, "30m", id="minutes"),
+        pytest.param(90, "1.5h", id="hours"),
+    ],
+)
+def test_format_max_stay(max_stay: int, expected: str):
+    assert format_max_stay(max_stay) == expected
+
+
+def test_fill_parking_info_missing_rule():
+    template = {"Soort parking:": ["{0}"], "Uren:": ["{1}"]}
+    assert fill_parking_info(template, {"status": "OK", "rules": {"type": "free"}}) == {
+        "Soort parking:": ["Gratis"]
+    }
@@ -0,0 +1,77 @@
+from pathlib import Path
+from typing import Any
+
+from scrapy import Request
+from scrapy.settings import Settings
+from twisted.internet import defer
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.extraction import FIELDS, BusinessPageExtractor, extract_page
+from trustoo_crawler.items import BusinessItem
+from trustoo_crawler.pool import ParsePool
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+RESPONSES_PATH = "test_gouden_gids/responses"
+BREEWEL = read_response_from_file(
+    Path(f"{RESPONSES_PATH}/breewel_payment_options.html"),
+    "https://www.goudengids.nl/nl/bedrijf/Bergen+op+Zoom/L146093845/Breewel+Advocatuur/",
+)
+
+
+class InlinePool:
+    """Extracts the pages right away, in the process of the test."""
+
+    def extract(self, text: str, fields: tuple[str, ...] = FIELDS) -> defer.Deferred:
+        return defer.succeed(extract_page(text, fields))
+
+
+def test_extract_page():
+    extractor = BusinessPageExtractor(BREEWEL.selector.root)
+    assert extract_page(BREEWEL.text) == (
+        extractor.fields(),
+        extractor.parking_info_parameters(),
+    )
+
+
+def test_from_settings():
+    assert ParsePool.from_settings(Settings({"PARSE_POOL_SIZE": 0})) is None
+
+
+def test_pool():
+    pool = ParsePool(1)
+    try:
+        future = pool.executor.submit(extract_page, BREEWEL.text)
+        assert future.result(timeout=60) == extract_page(BREEWEL.text)
+    finally:
+        pool.close()
+
+
+def test_parse_page_in_pool():
+    spider = GoudenGidsSpider()
+    spider.parse_pool = InlinePool()  # pyright: ignore[reportAttributeAccessIssue]
+    requests = spider.parse_page(
+        read_response_from_file(
+            Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+            "https://www.goudengids.nl/nl/zoeken/advocaten/1/",
+        )
+    )
+    assert next(iter(requests)).callback == spider.parse_business_page_in_pool
+
+
+def test_parse_business_page_in_pool():
+    spider = GoudenGidsSpider()
+    spider.parse_pool = InlinePool()  # pyright: ignore[reportAttributeAccessIssue]
+    results: list[Any] = []
+    defer.ensureDeferred(spider.parse_business_page_in_pool(BREEWEL)).addCallback(
+        results.extend
+    )
+    # The same results as when the page is extracted in the reactor thread
+    expected = list(spider.parse_business_page(BREEWEL))
+    assert len(results) == len(expected)
+    for result, item in zip(results, expected, strict=True):
+        if isinstance(item, Request):
+            assert result.url == item.url
+        else:
+            assert isinstance(result, BusinessItem)
+            assert isinstance(item, BusinessItem)
+            assert dict(result) == dict(item)
@@ -0,0 +1,66 @@
+from scrapy import Request
+from scrapy.http import HtmlResponse
+from scrapy_splash import SplashRequest
+
+from benchmarks.replay import ReplayCorpus
+from trustoo_crawler.extraction import BusinessPageExtractor
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+def test_search_pages_have_unique_listings():
+    corpus = ReplayCorpus()
+    spider = GoudenGidsSpider()
+    urls = set()
+    for page_number in (1, 2):
+        response = corpus.response(
+            Request(f"https://www.goudengids.nl/nl/zoeken/advocaten/{page_number}/")
+        )
+        assert isinstance(response, HtmlResponse)
+        urls.update(request.url for request in spider.parse_page(response))
+    assert len(urls) == 40
+
+
+def test_search_page_pagination():
+    corpus = ReplayCorpus()
+    spider = GoudenGidsSpider(category="notarissen")
+    response = corpus.response(
+        Request("https://www.goudengids.nl/nl/zoeken/notarissen/10/")
+    )
+    assert isinstance(response, HtmlResponse)
+    requests = spider.parse_page(response, category="notarissen", page_number=10)
+    assert [
+        request.cb_kwargs["page_number"]
+        for request in requests
+        if request.callback == spider.parse_page
+    ] == [11, 12, 13, 14, 15]
+
+
+def test_search_page_past_the_last_page():
+    corpus = ReplayCorpus()
+    response = corpus.response(
+        Request("https://www.goudengids.nl/nl/zoeken/advocaten/425/")
+    )
+    assert isinstance(response, HtmlResponse)
+    assert list(GoudenGidsSpider().parse_page(response, category="advocaten")) == []
+
+
+def test_business_page():
+    corpus = ReplayCorpus()
+    response = corpus.response(
+        Request("https://www.goudengids.nl/nl/bedrijf/Amsterdam/L10119193538/Baker/")
+    )
+    assert isinstance(response, HtmlResponse)
+    assert BusinessPageExtractor(response.selector.root).extract()["name"]
+
+
+def test_unknown_url():
+    response = ReplayCorpus().response(Request("https://www.goudengids.nl/unknown"))
+    assert response.status == 404
+
+
+def test_splash_request():
+    # The request as it is sent to Splash, after the middleware has processed it
+    request = SplashRequest("https://www.goudengids.nl/nl/bedrijf/X/L1/Y/").replace(
+        url="http://localhost:8050/render.html"
+    )
+    assert ReplayCorpus().response(request).status == 200
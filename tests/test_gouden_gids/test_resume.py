@@ -0,0 +1,142 @@
+from pathlib import Path
+
+import pytest
+from scrapy.exceptions import NotConfigured
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.items import BusinessItem
+from trustoo_crawler.resume import ResumeMiddleware, SearchPageJournal, resume_feeds
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+
+
+@pytest.fixture()
+def spider() -> GoudenGidsSpider:
+    return GoudenGidsSpider(categories="advocaten,notarissen:2")
+
+
+def middleware(job_dir: Path) -> ResumeMiddleware:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {"JOBDIR": str(job_dir), "LISTING_INDEX_CAPACITY": 1000},
+    )
+    crawler.stats.open_spider(GoudenGidsSpider())  # pyright: ignore[reportOptionalMemberAccess]
+    return ResumeMiddleware.from_crawler(crawler)
+
+
+def test_journal(tmp_path: Path):
+    journal = SearchPageJournal(tmp_path / "journal", batch_size=2)
+    journal.add("advocaten", 1)
+    assert (tmp_path / "journal").read_text() == ""
+    journal.add("advocaten", 3)
+    # Written once the batch is full
+    assert (tmp_path / "journal").read_text() == "advocaten\t1\nadvocaten\t3\n"
+    journal.add("notarissen", 1)
+    journal.close()
+    with (tmp_path / "journal").open("a") as file:
+        file.write("notarissen\t")  # Killed while writing
+    journal = SearchPageJournal(tmp_path / "journal")
+    assert journal.done == {"advocaten": {1, 3}, "notarissen": {1}}
+
+
+@pytest.mark.parametrize(
+    ("done", "max_page", "expected"),
+    [
+        pytest.param(set(), None, [1], id="new"),
+        pytest.param({1, 2, 3}, None, [4], id="next"),
+        pytest.param({1, 3, 5}, None, [2, 4, 6], id="gaps"),
+        pytest.param({1, 2}, 2, [], id="complete"),
+    ],
+)
+def test_journal_remaining(
+    tmp_path: Path, done: set[int], max_page: int | None, expected: list[int]
+):
+    journal = SearchPageJournal(tmp_path / "journal")
+    for page_number in done:
+        journal.add("advocaten", page_number)
+    assert journal.remaining("advocaten", max_page) == expected
+
+
+def test_not_configured():
+    with pytest.raises(NotConfigured):
+        ResumeMiddleware.from_crawler(get_crawler(GoudenGidsSpider))
+
+
+def test_start_requests(tmp_path: Path, spider: GoudenGidsSpider):
+    resume = middleware(tmp_path)
+    for page_number in (1, 2, 4):
+        resume.journal.add("advocaten", page_number)
+    requests = list(resume.process_start_requests(spider.start_requests(), spider))
+    assert [request.url for request in requests] == [
+        "https://www.goudengids.nl/nl/zoeken/advocaten/3/",
+        "https://www.goudengids.nl/nl/zoeken/advocaten/5/",
+        "https://www.goudengids.nl/nl/zoeken/notarissen/1/",
+    ]
+    # The fingerprints of the previous run don't apply to the search pages
+    assert all(request.dont_filter for request in requests)
+
+
+def test_search_pages(tmp_path: Path, spider: GoudenGidsSpider):
+    resume = middleware(tmp_path)
+    resume.journal.add("advocaten", 3)
+    response = read_response_from_file(
+        Path("test_gouden_gids/responses/lawyers_search_p1.html"),
+        "https://www.goudengids.nl/nl/zoeken/advocaten/1/",
+    )
+    response.request = spider.search_page_request("advocaten", 1)
+
+    def search_pages() -> list[int]:
+        return [
+            request.cb_kwargs["page_number"]
+            for request in resume.process_spider_output(
+                response,
+                spider.parse_page(response, category="advocaten", page_number=1),
+                spider,
+            )
+            if request.callback == spider.parse_page
+        ]
+
+    # Page 3 is done already
+    assert search_pages() == [2, 4, 5, 6]
+    # The pages were requested already during this run
+    assert search_pages() == []
+    assert resume.journal.is_done("advocaten", 1)
+
+
+def test_exported_items(tmp_path: Path, spider: GoudenGidsSpider):
+    resume = middleware(tmp_path)
+    resume.item_scraped(BusinessItem(listing_id="L1"), spider)
+    resume.spider_closed(spider)
+    # The business was exported before the crawl was stopped
+    resume = middleware(tmp_path)
+    items = [BusinessItem(listing_id="L1"), BusinessItem(listing_id="L2")]
+    response = read_response_from_file(
+        Path("test_gouden_gids/responses/backer_and_mckenzie.html"),
+        "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L2/Baker/",
+    )
+    assert list(resume.process_spider_output(response, items, spider)) == items[1:]
+
+
+def test_resume_feeds(tmp_path: Path):
+    settings = Settings(
+        {
+            "JOBDIR": str(tmp_path),
+            "FEEDS": {
+                "results.csv": {"format": "csv", "overwrite": True},
+                "results.parquet": {"format": "parquet", "overwrite": True},
+            },
+        }
+    )
+    resume_feeds(settings)
+    # Nothing to resume yet
+    assert settings.getdict("FEEDS")["results.csv"]["overwrite"] is True
+    (tmp_path / "search_pages.journal").touch()
+    resume_feeds(settings)
+    feeds = settings.getdict("FEEDS")
+    assert feeds["results.csv"] == {
+        "format": "csv",
+        "overwrite": False,
+        "item_export_kwargs": {"include_headers_line": False},
+    }
+    assert feeds["results.parquet"]["overwrite"] is True
@@ -0,0 +1,187 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.extensions.feedexport import ItemFilter
+from scrapy.http import HtmlResponse
+from scrapy.settings import Settings
+from scrapy.utils.test import get_crawler
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.extraction import BusinessPageExtractor
+from trustoo_crawler.items import BusinessItem, ReviewItem
+from trustoo_crawler.reviews import extract_reviews
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+from trustoo_crawler.state import ListingStateStore
+
+LISTING_ID = "L145578951"
+BUSINESS_URL = (
+    "https://www.goudengids.nl/nl/bedrijf/Deurne/L145578951/Advocatenkantoor+Hendriks/"
+)
+
+
+def review_html(review_id: str, classes: str = "review") -> str:
+    return f"""
+    <li class="{classes}" data-id="{review_id}" itemprop="review" itemscope
+        itemtype="http://schema.org/Review">
+        <span itemprop="author">Jan</span>
+        <div itemprop="reviewRating" itemscope itemtype="http://schema.org/Rating">
+            <meta itemprop="ratingValue" content="5">
+        </div>
+        <time itemprop="datePublished" datetime="2024-05-01">1 mei 2024</time>
+        <p itemprop="reviewBody">Snel en  goed
+            geholpen.</p>
+    </li>
+    """
+
+
+def business_page(*review_ids: str) -> HtmlResponse:
+    """Return the saved page of a business, with reviews if any are given.
+
+    None of the saved pages has reviews. The tabs of reviews are laid out like
+    `Detail.switchReviews` and `Detail.showReviews` of `detail.min.js` expect
+    them: a list per tab, of which all but the first 5 reviews are hidden.
+    """
+    response = read_response_from_file(
+        Path("test_gouden_gids/responses/hendricks_short_description.html"),
+        BUSINESS_URL,
+    )
+    if not review_ids:
+        return response
+    reviews = "".join(
+        review_html(review_id, "review" if index < 5 else "review hidden")
+        for index, review_id in enumerate(review_ids)
+    )
+    tabs = f"""
+    <div class="tabs-navigation">
+        <a id="reviews-all" class="review-filter reviews review-filter--active">
+            Alle</a>
+        <a id="reviews-best" class="review-filter reviews">Beste</a>
+    </div>
+    <div class="tabs">
+        <ul class="reviews-all active">
+            {reviews}
+            <li class="load-more">Meer reviews</li>
+        </ul>
+        <ul class="reviews-best hidden">{review_html(review_ids[0], "review hidden")}</ul>
+    </div>
+    """
+    body = (
+        response.text.replace('data-rating-avg="0"', 'data-rating-avg="4,5"')
+        .replace('data-rating-cnt="0"', f'data-rating-cnt="{len(review_ids)}"')
+        .replace("</body>", f"{tabs}</body>")
+    )
+    return response.replace(body=body.encode())
+
+
+def reviewing_spider() -> GoudenGidsSpider:
+    crawler = get_crawler(GoudenGidsSpider, {"REVIEWS_ENABLED": True})
+    return GoudenGidsSpider.from_crawler(crawler)
+
+
+def test_extract_reviews():
+    response = business_page("R7", "R6", "R5", "R4", "R3", "R2", "R1")
+    reviews = list(extract_reviews(response.selector.root, LISTING_ID))
+    assert reviews[0] == ReviewItem(
+        listing_id=LISTING_ID,
+        review_id="R7",
+        author="Jan",
+        rating=5.0,
+        date="2024-05-01",
+        text="Snel en goed geholpen.",
+    )
+    # The hidden ones included, and the one of the other tab only once
+    assert [review["review_id"] for review in reviews] == [
+        "R7",
+        "R6",
+        "R5",
+        "R4",
+        "R3",
+        "R2",
+        "R1",
+    ]
+    # Up to the newest review of the previous crawl
+    reviews = extract_reviews(response.selector.root, LISTING_ID, "R5")
+    assert [review["review_id"] for review in reviews] == ["R7", "R6"]
+
+
+def test_extract_reviews_without_reviews():
+    response = business_page()
+    assert not list(extract_reviews(response.selector.root, LISTING_ID))
+
+
+def test_review_id_without_id():
+    response = business_page("")
+    (review,) = extract_reviews(response.selector.root, LISTING_ID)
+    (again,) = extract_reviews(response.selector.root, LISTING_ID)
+    assert review["review_id"] and review["review_id"] == again["review_id"]
+
+
+def test_review_summary():
+    response = business_page("R2", "R1")
+    item = BusinessPageExtractor(response.selector.root).extract()
+    assert item == GoudenGidsSpider.extract_business_item(response)
+    assert item["rating"] == 4.5
+    assert item["review_count"] == 2
+
+
+class TestBusinessReviews:
+    def test_business_page(self):
+        response = business_page("R2", "R1")
+        spider = reviewing_spider()
+        results = list(spider.parse_business_page(response))
+        reviews = [result for result in results if isinstance(result, ReviewItem)]
+        assert [review["review_id"] for review in reviews] == ["R2", "R1"]
+        # No page of reviews is requested, only the parking info of the business
+        assert [
+            result.callback for result in results if isinstance(result, Request)
+        ] == [spider.parse_parking_info]
+        # Off by default
+        assert not any(
+            isinstance(result, ReviewItem)
+            for result in GoudenGidsSpider().parse_business_page(response)
+        )
+        crawler = get_crawler(GoudenGidsSpider)
+        assert not GoudenGidsSpider.from_crawler(crawler).scrape_reviews
+
+    def test_newest_review(self):
+        store = ListingStateStore(":memory:")
+        store.see(LISTING_ID, BUSINESS_URL)
+        store.record_reviews(LISTING_ID, 2, "R2")
+        spider = reviewing_spider()
+        business_item = BusinessItem(listing_id=LISTING_ID, review_count=3)
+        response = business_page("R3", "R2", "R1")
+        reviews = spider.business_reviews(
+            business_item, response, store.get(LISTING_ID)
+        )
+        assert [review["review_id"] for review in reviews] == ["R3"]
+        reviews = spider.business_reviews(business_item, response)
+        assert [review["review_id"] for review in reviews] == ["R3", "R2", "R1"]
+        # Without reviews, the page isn't searched for them
+        assert not list(spider.business_reviews(BusinessItem(review_count=0), response))
+
+
+@pytest.mark.parametrize("output", ["results.csv", "results.parquet"])
+def test_review_feeds(output: str):
+    # What `scrapy crawl gouden_gids -O <output> -s REVIEWS_ENABLED=True` gets
+    settings = Settings()
+    settings.setmodule("trustoo_crawler.settings", priority="project")
+    settings.set("FEEDS", {output: {"format": output.split(".")[1]}}, "cmdline")
+    settings.set("REVIEWS_ENABLED", True, "cmdline")
+    GoudenGidsSpider.update_settings(settings)
+    feeds = settings.getdict("FEEDS")
+    assert list(feeds) == [output, "reviews.csv"]
+    business_item = BusinessItem(listing_id=LISTING_ID)
+    review = ReviewItem(listing_id=LISTING_ID, review_id="R1")
+    business_feed = ItemFilter(feeds[output])
+    assert business_feed.accepts(business_item)
+    assert not business_feed.accepts(review)
+    reviews_feed = ItemFilter(feeds["reviews.csv"])
+    assert reviews_feed.accepts(review)
+    assert not reviews_feed.accepts(business_item)
+
+
+def test_review_feeds_disabled():
+    settings = {"FEEDS": {"results.csv": {"format": "csv"}}}
+    feeds = get_crawler(GoudenGidsSpider, settings).settings.getdict("FEEDS")
+    assert list(feeds) == ["results.csv"]
@@ -1,15 +1,24 @@
-from collections.abc import Iterator
+from collections.abc import Iterable, Iterator
 from enum import Enum
 from pathlib import Path
 
 import pytest
 from scrapy import Request
-from scrapy.http import HtmlResponse
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy_splash import SplashRequest
 
+from benchmarks.replay import ReplayDownloadHandler
 from tests.utils import read_response_from_file
+from trustoo_crawler.extraction import BusinessPageExtractor, unresolved_sections
+from trustoo_crawler.items import BusinessItem, BusinessRecord, ItemModel
 from trustoo_crawler.spiders.gouden_gids import (
+    COMPILED_TEXT_XPATHS,
+    COMPILED_WORKING_DAY_XPATHS,
+    COMPILED_XPATHS,
     GoudenGidsSpider,
     GoudenGidsXPaths,
+    RenderMode,
+    get_compiled_xpath,
 )
 from trustoo_crawler.utils import DutchWeekDay
 
@@ -31,34 +40,103 @@ class LawyerResponse(Enum):
     )
 
 
+def first[T](results: Iterable[object], result_type: type[T]) -> T:
+    """Return the first result of a callback, which has to be of a type."""
+    result = next(iter(results))
+    assert isinstance(result, result_type)
+    return result
+
+
 class TestGoudenGidsSpider:
     @pytest.fixture()
     def spider(self) -> GoudenGidsSpider:
         return GoudenGidsSpider()
 
     @pytest.fixture
-    def front_page_requests(self, spider: GoudenGidsSpider) -> Iterator[Request]:
-        return spider.parse(
+    def search_page_requests(self, spider: GoudenGidsSpider) -> Iterator[Request]:
+        return spider.parse_page(
             read_response_from_file(
                 Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
                 "https://www.goudengids.nl/nl/bedrijven/advocaten/",
             )
         )
 
-    @pytest.fixture
-    def search_page_requests(self, spider: GoudenGidsSpider) -> Iterator[Request]:
-        return spider.parse_page(
-            read_response_from_file(
-                Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
-                "https://www.goudengids.nl/nl/bedrijven/advocaten/",
+    def test_start_requests_categories(self):
+        spider = GoudenGidsSpider(categories="advocaten:2,notarissen")
+        assert [request.url for request in spider.start_requests()] == [
+            "https://www.goudengids.nl/nl/zoeken/advocaten/1/",
+            "https://www.goudengids.nl/nl/zoeken/notarissen/1/",
+        ]
+
+    @pytest.mark.parametrize(
+        ("categories", "page_number", "expected"),
+        [
+            pytest.param("advocaten", 1, [2, 3, 4, 5, 6], id="lookahead"),
+            pytest.param("advocaten:3", 1, [2, 3], id="limited"),
+            pytest.param("advocaten", 4, [5, 6], id="linked-pages"),
+            pytest.param("advocaten:4", 4, [], id="last-page"),
+        ],
+    )
+    def test_parse_page_pagination(
+        self, categories: str, page_number: int, expected: list[int]
+    ):
+        spider = GoudenGidsSpider(categories=categories)
+        requests = list(
+            spider.parse_page(
+                read_response_from_file(
+                    Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+                    f"https://www.goudengids.nl/nl/zoeken/advocaten/{page_number}/",
+                ),
+                category="advocaten",
+                page_number=page_number,
             )
         )
+        search_pages = [
+            request for request in requests if request.callback == spider.parse_page
+        ]
+        assert [request.cb_kwargs["page_number"] for request in search_pages] == (
+            expected
+        )
+        assert [request.url for request in search_pages] == [
+            f"https://www.goudengids.nl/nl/zoeken/advocaten/{page}/"
+            for page in expected
+        ]
+        # The businesses come first and are requested before the next pages
+        assert requests[0].callback == spider.parse_business_page
+        assert all(request.priority < requests[0].priority for request in search_pages)
 
-    def test_parse(self, front_page_requests: Iterator[Request]):
-        assert (
-            next(iter(front_page_requests)).url
-            == "https://www.goudengids.nl/nl/zoeken/advocaten/1/"
+    def test_parse_page_next_page(self):
+        # Without pagination links towards the category, the next page is requested
+        spider = GoudenGidsSpider(category="notarissen")
+        requests = list(
+            spider.parse_page(
+                read_response_from_file(
+                    Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+                    "https://www.goudengids.nl/nl/zoeken/notarissen/7/",
+                ),
+                category="notarissen",
+            )
+        )
+        assert requests[-1].url == "https://www.goudengids.nl/nl/zoeken/notarissen/8/"
+
+    def test_parse_page_no_listings(self, spider: GoudenGidsSpider):
+        # A page without businesses is past the last page, the crawl stops there
+        response = HtmlResponse(
+            "https://www.goudengids.nl/nl/zoeken/advocaten/425/",
+            body=b"<html><body><main></main></body></html>",
+            encoding="utf-8",
+        )
+        assert list(spider.parse_page(response, category="advocaten")) == []
+
+    def test_parse_page_category(self, spider: GoudenGidsSpider):
+        requests = spider.parse_page(
+            read_response_from_file(
+                Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+                "https://www.goudengids.nl/nl/zoeken/advocaten/1/",
+            ),
+            category="advocaten",
         )
+        assert next(iter(requests)).meta["category"] == "advocaten"
 
     def test_parse_page(self, search_page_requests: Iterator[Request]):
         assert (
@@ -66,6 +144,171 @@ class TestGoudenGidsSpider:
             == "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119701094/Rijnja+Meijer+%26+Balemans+Advocaten/"
         )
 
+    @pytest.mark.parametrize(
+        ("render", "request_type"),
+        [
+            pytest.param(RenderMode.ALWAYS, SplashRequest, id="always"),
+            pytest.param(RenderMode.AUTO, Request, id="auto"),
+            pytest.param(RenderMode.NEVER, Request, id="never"),
+        ],
+    )
+    def test_parse_page_render(self, render: RenderMode, request_type: type[Request]):
+        requests = GoudenGidsSpider(render=render).parse_page(
+            read_response_from_file(
+                Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+                "https://www.goudengids.nl/nl/bedrijven/advocaten/",
+            )
+        )
+        assert type(next(iter(requests))) is request_type
+
+    def test_parse_business_page_render_auto_unresolved(self, spider: GoudenGidsSpider):
+        # The parking info of this business still contains the placeholders,
+        # so its data is requested from the endpoint of the widget
+        response = LawyerResponse.HENDRICKS.value
+        request = first(spider.parse_business_page(response), Request)
+        assert type(request) is Request
+        assert (
+            request.url
+            == "https://www.goudengids.nl/api/seety/parking/?lat=51.46559&lng=5.79714"
+        )
+        assert request.cb_kwargs["business_item"]["name"] == "Advocatenkantoor Hendriks"
+        assert request.cb_kwargs["url"] == response.url
+
+    def test_parse_business_page_render_auto_resolved(self, spider: GoudenGidsSpider):
+        response = LawyerResponse.BREEWEL.value
+        item = first(spider.parse_business_page(response), BusinessItem)
+        assert item["parking_info"]["Soort parking:"] == ["Betalend"]
+
+    def test_parse_business_page_render_never(self):
+        response = LawyerResponse.HENDRICKS.value
+        item = first(
+            GoudenGidsSpider(render=RenderMode.NEVER).parse_business_page(response),
+            BusinessItem,
+        )
+        assert item["parking_info"]["Soort parking:"] == ["{0}"]
+
+    def test_parse_business_page_fields(self):
+        spider = GoudenGidsSpider(render=RenderMode.ALWAYS, fields="leads")
+        # None of the fields are dynamic, so nothing is rendered
+        requests = spider.parse_page(
+            read_response_from_file(
+                Path(f"{RESPONSES_PATH}/lawyers_search_p1.html"),
+                "https://www.goudengids.nl/nl/bedrijven/advocaten/",
+            )
+        )
+        assert type(next(iter(requests))) is Request
+        # The parking info of this business would have to be requested otherwise
+        (item,) = spider.parse_business_page(LawyerResponse.HENDRICKS.value)
+        assert isinstance(item, BusinessItem)
+        assert item["name"] == "Advocatenkantoor Hendriks"
+        assert item["description"] == ""
+        assert item["parking_info"] == {}
+        spider = GoudenGidsSpider(fields="name,parking_info")
+        assert spider.render is RenderMode.AUTO
+        (request,) = spider.parse_business_page(LawyerResponse.HENDRICKS.value)
+        assert isinstance(request, Request)
+        assert request.cb_kwargs["business_item"]["name"] == "Advocatenkantoor Hendriks"
+
+    @pytest.mark.parametrize(
+        ("file_name", "expected"),
+        [
+            pytest.param(
+                "seety_parking_breewel.json",
+                {
+                    "Soort parking:": ["Betalend"],
+                    "Uren:": ["9:00-18:30"],
+                    "Tarief:": ["1.3 euro (1h) 2.6 euro (2h)"],
+                    "Maximale duurtijd:": ["24h"],
+                },
+                id="breewel",
+            ),
+            pytest.param(
+                "seety_parking_backer_and_mckenzie.json",
+                {
+                    "Soort parking:": ["Voetgangerszone"],
+                    "Uren:": ["0:00-24:00"],
+                },
+                id="baker-and-mckenzie",
+            ),
+            pytest.param("seety_parking_hendricks.json", {}, id="hendricks"),
+        ],
+    )
+    def test_parse_parking_info(
+        self, spider: GoudenGidsSpider, file_name: str, expected: dict[str, list[str]]
+    ):
+        # Use the page with the placeholders as the template for all recorded data
+        request = first(
+            spider.parse_business_page(LawyerResponse.HENDRICKS.value), Request
+        )
+        response = read_response_from_file(
+            Path(f"{RESPONSES_PATH}/{file_name}"), request.url, TextResponse
+        )
+        item = first(
+            spider.parse_parking_info(response, **request.cb_kwargs), BusinessItem
+        )
+        assert item["name"] == "Advocatenkantoor Hendriks"
+        assert item["parking_info"] == expected
+
+    def test_parse_parking_info_replayed(self, spider: GoudenGidsSpider):
+        request = first(
+            spider.parse_business_page(LawyerResponse.HENDRICKS.value), Request
+        )
+        # The recorded responses of the endpoint, served like the real one
+        responses = []
+        ReplayDownloadHandler().download_request(request, spider).addCallback(
+            responses.append
+        )
+        (response,) = responses
+        assert response.headers["Content-Type"] == b"application/json"
+        item = first(
+            spider.parse_parking_info(response, **request.cb_kwargs), BusinessItem
+        )
+        assert item["name"] == "Advocatenkantoor Hendriks"
+        assert not unresolved_sections(item)
+        assert item["parking_info"]["Soort parking:"] == ["Voetgangerszone"]
+
+    def test_parse_parking_info_invalid(self, spider: GoudenGidsSpider):
+        request = first(
+            spider.parse_business_page(LawyerResponse.HENDRICKS.value), Request
+        )
+        response = TextResponse(request.url, body=b"<html></html>")
+        # Rendering the page is the fallback
+        rendered_request = next(
+            iter(spider.parse_parking_info(response, **request.cb_kwargs))
+        )
+        assert isinstance(rendered_request, SplashRequest)
+        assert rendered_request.cb_kwargs["business_item"]["name"] == (
+            "Advocatenkantoor Hendriks"
+        )
+
+    def test_parse_rendered_business_page(self, spider: GoudenGidsSpider):
+        business_item = BusinessPageExtractor(
+            LawyerResponse.HENDRICKS.value.selector.root
+        ).extract()
+        item = first(
+            spider.parse_rendered_business_page(
+                LawyerResponse.BREEWEL.value, business_item
+            ),
+            BusinessItem,
+        )
+        assert item["name"] == "Advocatenkantoor Hendriks"
+        assert item["parking_info"]["Soort parking:"] == ["Betalend"]
+
+    def test_parse_business_page_record(self):
+        spider = GoudenGidsSpider(item_model=ItemModel.RECORD)
+        request = first(
+            spider.parse_business_page(LawyerResponse.HENDRICKS.value), Request
+        )
+        response = read_response_from_file(
+            Path(f"{RESPONSES_PATH}/seety_parking_breewel.json"),
+            request.url,
+            TextResponse,
+        )
+        record = next(iter(spider.parse_parking_info(response, **request.cb_kwargs)))
+        assert isinstance(record, BusinessRecord)
+        assert record.listing_id == "L145578951"
+        assert record.parking_info["Soort parking:"] == ["Betalend"]
+
     def test_parse_business_page(self, spider: GoudenGidsSpider):
         items = spider.parse_business_page(
             read_response_from_file(
@@ -73,7 +316,9 @@ class TestGoudenGidsSpider:
                 "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker+%26+McKenzie+Amsterdam+NV/",
             )
         )
-        assert next(iter(items))["name"] == "Baker & McKenzie Amsterdam NV"
+        item = first(items, BusinessItem)
+        assert item["name"] == "Baker & McKenzie Amsterdam NV"
+        assert item["listing_id"] == "L119193538"
 
     @pytest.mark.parametrize(
         ("response", "xpath", "expected"),
@@ -284,3 +529,69 @@ class TestGoudenGidsSpider:
             section_value_xpath,
         )
         assert result == expected
+
+    @pytest.mark.parametrize(
+        "response",
+        [pytest.param(response.value, id=response.name) for response in LawyerResponse],
+    )
+    @pytest.mark.parametrize(
+        "xpath",
+        [
+            GoudenGidsXPaths.NAME,
+            GoudenGidsXPaths.DESCRIPTION,
+            GoudenGidsXPaths.WEBSITE,
+            GoudenGidsXPaths.SOCIAL_MEDIA,
+            GoudenGidsXPaths.PAYMENT_OPTIONS,
+            GoudenGidsXPaths.PHOTO_SRC,
+        ],
+    )
+    def test_compiled_text_xpath(self, response: HtmlResponse, xpath: GoudenGidsXPaths):
+        assert (
+            COMPILED_TEXT_XPATHS[xpath](response.selector.root)
+            == response.xpath(f"normalize-space({xpath})").get()
+        )
+
+    @pytest.mark.parametrize(
+        "response",
+        [pytest.param(response.value, id=response.name) for response in LawyerResponse],
+    )
+    @pytest.mark.parametrize(
+        "xpath",
+        [
+            GoudenGidsXPaths.SOCIAL_MEDIA,
+            GoudenGidsXPaths.PAYMENT_OPTIONS,
+            GoudenGidsXPaths.CERTIFICATES,
+            GoudenGidsXPaths.PHOTO_SRC,
+        ],
+    )
+    def test_compiled_xpath(self, response: HtmlResponse, xpath: GoudenGidsXPaths):
+        assert (
+            COMPILED_XPATHS[xpath](response.selector.root)
+            == response.xpath(xpath).getall()
+        )
+
+    @pytest.mark.parametrize("day", list(DutchWeekDay))
+    def test_compiled_working_day_xpath(self, day: DutchWeekDay):
+        response = LawyerResponse.BREEWEL.value
+        xpath = GoudenGidsXPaths.WORKING_DAY.format(day=day)
+        assert (
+            COMPILED_WORKING_DAY_XPATHS[day](response.selector.root)
+            == response.xpath(f"normalize-space({xpath})").get()
+        )
+
+    def test_get_compiled_xpath(self):
+        assert (
+            get_compiled_xpath(GoudenGidsXPaths.NAME)
+            is COMPILED_XPATHS[GoudenGidsXPaths.NAME]
+        )
+        # XPaths that are not registered are compiled only once as well
+        xpath = "//title/text()"
+        assert get_compiled_xpath(xpath, normalize=True) is get_compiled_xpath(
+            xpath, normalize=True
+        )
+        assert (
+            get_compiled_xpath(xpath, normalize=True)(
+                LawyerResponse.BREEWEL.value.selector.root
+            )
+            == LawyerResponse.BREEWEL.value.xpath(f"normalize-space({xpath})").get()
+        )
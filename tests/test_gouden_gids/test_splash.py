@@ -0,0 +1,179 @@
+import pytest
+from scrapy import Request
+from scrapy.exceptions import NotConfigured
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+from scrapy_splash import SplashJsonResponse, SplashRequest
+from twisted.internet.error import TimeoutError as TwistedTimeoutError
+
+from tests.test_gouden_gids.test_spider import LawyerResponse
+from trustoo_crawler.extraction import BusinessPageExtractor
+from trustoo_crawler.items import BusinessItem
+from trustoo_crawler.spiders.gouden_gids import (
+    DYNAMIC_SECTION_SELECTORS,
+    GoudenGidsSpider,
+)
+from trustoo_crawler.splash import (
+    BLOCKED_REQUESTS,
+    RENDER_SCRIPT,
+    SplashPoolMiddleware,
+    SplashStatsMiddleware,
+    render_args,
+)
+
+URL = (
+    "https://www.goudengids.nl/nl/bedrijf/Deurne/L145578951/Advocatenkantoor+Hendriks/"
+)
+SPLASH_URLS = ["http://splash-1:8050", "http://splash-2:8050"]
+
+
+@pytest.fixture()
+def middleware(spider: GoudenGidsSpider) -> SplashPoolMiddleware:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {
+            "SPLASH_URLS": SPLASH_URLS,
+            "SPLASH_POOL_MAX_FAILURES": 2,
+            "SPLASH_POOL_HEALTH_CHECK_INTERVAL": 0,
+        },
+    )
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    return SplashPoolMiddleware.from_crawler(crawler)
+
+
+def route(middleware: SplashPoolMiddleware, spider: GoudenGidsSpider) -> Request:
+    """Route a render like `SplashMiddleware` would see it, return the processed request."""
+    request = SplashRequest(URL, endpoint="execute", args=render_args(1))
+    assert middleware.process_request(request, spider) is None
+    # What `SplashMiddleware` makes of it
+    return request.replace(
+        url=request.meta["splash"]["splash_url"] + "/execute",
+        meta={**request.meta, "_splash_processed": True},
+    )
+
+
+def test_not_configured():
+    with pytest.raises(NotConfigured):
+        SplashPoolMiddleware.from_crawler(get_crawler(GoudenGidsSpider))
+
+
+def test_render_args():
+    args = render_args(
+        1, selectors=DYNAMIC_SECTION_SELECTORS, wait_for=DYNAMIC_SECTION_SELECTORS
+    )
+    assert args["lua_source"] == RENDER_SCRIPT
+    assert args["max_wait"] == 1
+    assert args["blocked"] == BLOCKED_REQUESTS
+    assert args["selectors"] == DYNAMIC_SECTION_SELECTORS
+    assert args["wait_for"] == DYNAMIC_SECTION_SELECTORS
+    assert "selectors" not in render_args(1)
+    assert "wait_for" not in render_args(1)
+
+
+def test_render_stats(spider: GoudenGidsSpider, monkeypatch: pytest.MonkeyPatch):
+    crawler = get_crawler(
+        GoudenGidsSpider, {"SPLASH_URL": "http://splash-1:8050", "SPLASH_SLOTS": 2}
+    )
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    middleware = SplashStatsMiddleware.from_crawler(crawler)
+    request = SplashRequest(URL, endpoint="execute", args=render_args(10))
+    request.meta["_splash_processed"] = True
+    for waited, ready in ((0.3, "elements"), (0.8, "idle"), (10, "timeout")):
+        body = (
+            f'{{"url": "{URL}", "html": "<html></html>", "waited": {waited},'
+            f' "ready": "{ready}", "elapsed": {waited + 0.2}}}'
+        )
+        response = SplashJsonResponse(
+            "http://splash-1:8050/execute",
+            body=body.encode(),
+            headers={"Content-Type": "application/json"},
+            request=request,
+        )
+        assert middleware.process_response(request, response, spider) is response
+    stats = middleware.stats
+    assert stats.get_value("splash/renders") == 3
+    assert stats.get_value("splash/waited") == pytest.approx(11.1)
+    assert stats.get_value("splash/max_waited") == 10
+    assert stats.get_value("splash/ready/elements") == 1
+    assert stats.get_value("splash/ready/timeout") == 1
+    # 11.7 seconds of rendering on 2 slots, during 10 seconds
+    monkeypatch.setattr(middleware, "started_at", middleware.started_at - 10)
+    middleware.spider_closed(spider)
+    assert stats.get_value("splash/splash-1:8050/slot_utilization") == pytest.approx(
+        11.7 / 20, rel=0.01
+    )
+
+
+def test_least_loaded(middleware: SplashPoolMiddleware, spider: GoudenGidsSpider):
+    first, second, third = (route(middleware, spider) for _ in range(3))
+    assert first.meta["splash"]["splash_url"] == SPLASH_URLS[0]
+    assert second.meta["splash"]["splash_url"] == SPLASH_URLS[1]
+    assert first.meta["download_slot"] == "__splash__/splash-1:8050"
+    assert second.meta["download_slot"] == "__splash__/splash-2:8050"
+    assert third.meta["splash"]["splash_url"] == SPLASH_URLS[0]
+    # Once the second instance is done, it is the least loaded again
+    response = Response(second.url, request=second)
+    assert middleware.process_response(second, response, spider) is response
+    assert route(middleware, spider).meta["splash"]["splash_url"] == SPLASH_URLS[1]
+
+
+def test_reroute(middleware: SplashPoolMiddleware, spider: GoudenGidsSpider):
+    request = route(middleware, spider)
+    response = Response(request.url, status=503, request=request)
+    rerouted = middleware.process_response(request, response, spider)
+    assert isinstance(rerouted, Request)
+    assert rerouted.url == URL
+    assert "splash_url" not in rerouted.meta["splash"]
+    assert "_splash_processed" not in rerouted.meta
+    assert middleware.nodes[SPLASH_URLS[0]].failures == 1
+    # The instance that failed has a failure more, so the other one is chosen
+    assert middleware.process_request(rerouted, spider) is None
+    assert rerouted.meta["splash"]["splash_url"] == SPLASH_URLS[1]
+    # Every instance was tried, the render is left to `RetryMiddleware`
+    rerouted = rerouted.replace(meta={**rerouted.meta, "_splash_processed": True})
+    response = Response(rerouted.url, status=503, request=rerouted)
+    assert middleware.process_response(rerouted, response, spider) is response
+
+
+def test_leave_out_failed(middleware: SplashPoolMiddleware, spider: GoudenGidsSpider):
+    request = route(middleware, spider)
+    assert request.meta["splash"]["splash_url"] == SPLASH_URLS[0]
+    for _ in range(2):
+        middleware.process_exception(request, TwistedTimeoutError(), spider)
+    node = middleware.nodes[SPLASH_URLS[0]]
+    assert not node.healthy
+    assert middleware.stats.get_value("splash_pool/splash-1:8050/healthy") is False
+    # Even with more renders pending, only the healthy instance is used
+    assert all(
+        route(middleware, spider).meta["splash"]["splash_url"] == SPLASH_URLS[1]
+        for _ in range(3)
+    )
+    middleware.set_health(node, healthy=True)
+    assert node.failures == 0
+    assert route(middleware, spider).meta["splash"]["splash_url"] == SPLASH_URLS[0]
+
+
+def test_ignore_plain_requests(
+    middleware: SplashPoolMiddleware, spider: GoudenGidsSpider
+):
+    request = Request(URL)
+    assert middleware.process_request(request, spider) is None
+    assert "download_slot" not in request.meta
+    response = Response(URL, status=503, request=request)
+    assert middleware.process_response(request, response, spider) is response
+
+
+def test_dynamic_section_fragments(spider: GoudenGidsSpider):
+    # What the render script returns for `DYNAMIC_SECTION_SELECTORS`
+    page = LawyerResponse.BREEWEL.value
+    fragments = "".join(page.css(DYNAMIC_SECTION_SELECTORS).getall())
+    response = HtmlResponse(
+        URL, body=f"<html><body>{fragments}</body></html>", encoding="utf-8"
+    )
+    business_item = BusinessPageExtractor(
+        LawyerResponse.HENDRICKS.value.selector.root
+    ).extract()
+    item = next(iter(spider.parse_rendered_business_page(response, business_item)))
+    assert isinstance(item, BusinessItem)
+    assert item["name"] == "Advocatenkantoor Hendriks"
+    assert item["parking_info"]["Soort parking:"] == ["Betalend"]
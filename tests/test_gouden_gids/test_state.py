@@ -0,0 +1,219 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+from scrapy_splash import SplashRequest
+
+from trustoo_crawler.items import BusinessItem, ReviewItem
+from trustoo_crawler.middlewares import (
+    ListingStateMiddleware,
+    ListingStateSpiderMiddleware,
+)
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+from trustoo_crawler.state import ListingStateStore, item_hash
+
+BUSINESS_URL = "https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker+%26+McKenzie+Amsterdam+NV/"
+LISTING_ID = "L119193538"
+
+
+@pytest.fixture()
+def store() -> ListingStateStore:
+    return ListingStateStore(":memory:")
+
+
+class TestListingStateStore:
+    def test_see(self, store: ListingStateStore):
+        assert store.see(LISTING_ID, BUSINESS_URL, "advocaten") is None
+        state = store.see(LISTING_ID, BUSINESS_URL)
+        assert state is not None
+        assert state.category == "advocaten"
+        assert state.fetched_at is None
+
+    def test_record_item(self, store: ListingStateStore):
+        store.see(LISTING_ID, BUSINESS_URL)
+        store.record_response(LISTING_ID, '"v1"', None)
+        assert store.record_item(LISTING_ID, "hash")
+        assert not store.record_item(LISTING_ID, "hash")
+        assert store.record_item(LISTING_ID, "other hash")
+        state = store.get(LISTING_ID)
+        assert state is not None
+        assert state.etag == '"v1"'
+        assert state.fetched_at is not None
+
+    def test_record_reviews(self, store: ListingStateStore):
+        store.see(LISTING_ID, BUSINESS_URL)
+        store.record_reviews(LISTING_ID, 45)
+        store.record_reviews(LISTING_ID, newest_review_id="R1")
+        state = store.get(LISTING_ID)
+        assert state is not None
+        assert (state.review_count, state.newest_review_id) == (45, "R1")
+
+    def test_added_columns(self, tmp_path: Path):
+        # The state of a crawl from before the reviews were scraped
+        connection = sqlite3.connect(tmp_path / "state.sqlite")
+        connection.execute(
+            "CREATE TABLE listings (listing_id TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "category TEXT, first_seen REAL NOT NULL, last_seen REAL NOT NULL, "
+            "fetched_at REAL, content_hash TEXT, etag TEXT, last_modified TEXT, "
+            "disappeared_at REAL, has_pending_response INTEGER NOT NULL DEFAULT 0, "
+            "pending_etag TEXT, pending_last_modified TEXT)"
+        )
+        connection.execute(
+            "INSERT INTO listings (listing_id, url, first_seen, last_seen) "
+            "VALUES (?, ?, 0, 0)",
+            (LISTING_ID, BUSINESS_URL),
+        )
+        connection.commit()
+        connection.close()
+        store = ListingStateStore(tmp_path / "state.sqlite")
+        state = store.get(LISTING_ID)
+        assert state is not None
+        assert state.review_count is None
+
+    def test_mark_disappeared(self, store: ListingStateStore):
+        store.see(LISTING_ID, BUSINESS_URL, "advocaten")
+        store.see("L1", "https://www.goudengids.nl/nl/bedrijf/X/L1/", "notarissen")
+        since = time.time()
+        assert store.mark_disappeared(["advocaten"], since) == 1
+        assert [state.listing_id for state in store.disappeared()] == [LISTING_ID]
+        # Finding it again means that it's back
+        store.see(LISTING_ID, BUSINESS_URL)
+        assert store.disappeared() == []
+
+    def test_item_hash(self):
+        assert item_hash(BusinessItem(name="a", phone="1")) == item_hash(
+            BusinessItem(phone="1", name="a")
+        )
+        assert item_hash(BusinessItem(name="a")) != item_hash(BusinessItem(name="b"))
+
+
+class TestListingStateMiddleware:
+    @pytest.fixture()
+    def spider(self) -> GoudenGidsSpider:
+        return GoudenGidsSpider()
+
+    @pytest.fixture()
+    def middleware(
+        self, tmp_path: Path, spider: GoudenGidsSpider
+    ) -> ListingStateMiddleware:
+        crawler = get_crawler(
+            GoudenGidsSpider,
+            {"LISTING_STATE_PATH": str(tmp_path / "state.sqlite")},
+        )
+        crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+        return ListingStateMiddleware.from_crawler(crawler)
+
+    def test_not_configured(self):
+        with pytest.raises(NotConfigured):
+            ListingStateMiddleware.from_crawler(get_crawler(GoudenGidsSpider))
+
+    def test_conditional_request(
+        self, middleware: ListingStateMiddleware, spider: GoudenGidsSpider
+    ):
+        request = Request(BUSINESS_URL)
+        middleware.process_request(request, spider)
+        assert "If-None-Match" not in request.headers
+        response = Response(BUSINESS_URL, headers={"ETag": '"v1"'}, request=request)
+        assert middleware.process_response(request, response, spider) is response
+        middleware.store.record_item(LISTING_ID, "hash")
+
+        request = Request(BUSINESS_URL)
+        middleware.process_request(request, spider)
+        assert request.headers["If-None-Match"] == b'"v1"'
+        assert request.meta["listing_state"].content_hash == "hash"
+        with pytest.raises(IgnoreRequest):
+            middleware.process_response(
+                request, Response(BUSINESS_URL, status=304), spider
+            )
+
+    def test_skip_recent(
+        self, middleware: ListingStateMiddleware, spider: GoudenGidsSpider
+    ):
+        middleware.max_age = 3600
+        middleware.store.see(LISTING_ID, BUSINESS_URL)
+        middleware.store.record_item(LISTING_ID, "hash")
+        with pytest.raises(IgnoreRequest):
+            middleware.process_request(Request(BUSINESS_URL), spider)
+
+    def test_splash_request(
+        self, middleware: ListingStateMiddleware, spider: GoudenGidsSpider
+    ):
+        middleware.store.see(LISTING_ID, BUSINESS_URL)
+        middleware.store.record_response(LISTING_ID, '"v1"', None)
+        middleware.store.record_item(LISTING_ID, "hash")
+        request = SplashRequest(BUSINESS_URL)
+        middleware.process_request(request, spider)
+        assert "If-None-Match" not in request.headers
+
+    def test_spider_closed(
+        self,
+        middleware: ListingStateMiddleware,
+        spider: GoudenGidsSpider,
+        tmp_path: Path,
+    ):
+        store = ListingStateStore(tmp_path / "state.sqlite")
+        store.see(LISTING_ID, BUSINESS_URL, "advocaten")
+        middleware.started_at = time.time()
+        middleware.spider_closed(spider, "finished")
+        assert [state.listing_id for state in store.disappeared()] == [LISTING_ID]
+
+
+class TestListingStateSpiderMiddleware:
+    def test_process_spider_output(self, store: ListingStateStore):
+        crawler = get_crawler(GoudenGidsSpider)
+        middleware = ListingStateSpiderMiddleware(store, crawler.stats)  # pyright: ignore[reportArgumentType]
+        spider = GoudenGidsSpider()
+        item = BusinessItem(listing_id=LISTING_ID, name="Baker & McKenzie")
+        request = Request(BUSINESS_URL)
+        response = Response(BUSINESS_URL)
+
+        def output() -> list:
+            return list(
+                middleware.process_spider_output(response, [item, request], spider)
+            )
+
+        assert output() == [item, request]
+        # The same item isn't passed on again, other results are
+        assert output() == [request]
+        item["name"] = "Baker McKenzie"
+        assert output() == [item, request]
+
+    def test_process_spider_output_fields(self, store: ListingStateStore):
+        crawler = get_crawler(GoudenGidsSpider)
+        middleware = ListingStateSpiderMiddleware(store, crawler.stats)  # pyright: ignore[reportArgumentType]
+        item = BusinessItem(listing_id=LISTING_ID, name="Baker & McKenzie")
+        response = Response(BUSINESS_URL)
+        list(middleware.process_spider_output(response, [item], GoudenGidsSpider()))
+        content_hash = store.get(LISTING_ID).content_hash  # pyright: ignore[reportOptionalMemberAccess]
+        # The items of a few fields are all passed on, without touching the state
+        spider = GoudenGidsSpider(fields="leads")
+        for _ in range(2):
+            assert list(middleware.process_spider_output(response, [item], spider)) == [
+                item
+            ]
+        assert store.get(LISTING_ID).content_hash == content_hash  # pyright: ignore[reportOptionalMemberAccess]
+
+    def test_newest_review(self, store: ListingStateStore):
+        crawler = get_crawler(GoudenGidsSpider)
+        middleware = ListingStateSpiderMiddleware(store, crawler.stats)  # pyright: ignore[reportArgumentType]
+        spider = GoudenGidsSpider()
+        item = BusinessItem(listing_id=LISTING_ID, review_count=45)
+        reviews = [
+            ReviewItem(listing_id=LISTING_ID, review_id=review_id)
+            for review_id in ("R3", "R2")
+        ]
+        # The reviews come with their business, from its page
+        result = [item, *reviews]
+        response = Response(BUSINESS_URL)
+        assert (
+            list(middleware.process_spider_output(response, result, spider)) == result
+        )
+        state = store.get(LISTING_ID)
+        assert state is not None
+        # The first review on the page
+        assert (state.review_count, state.newest_review_id) == (45, "R3")
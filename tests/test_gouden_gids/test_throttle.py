@@ -0,0 +1,125 @@
+from pathlib import Path
+
+import pytest
+from scrapy import Request
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import HtmlResponse, Response
+from scrapy.utils.test import get_crawler
+from twisted.internet.error import TimeoutError as TwistedTimeoutError
+
+from tests.utils import read_response_from_file
+from trustoo_crawler.spiders.gouden_gids import GoudenGidsSpider
+from trustoo_crawler.throttle import AdaptiveThrottleMiddleware, is_blocked
+
+URL = "https://www.goudengids.nl/nl/zoeken/advocaten/1/"
+SLOT = "www.goudengids.nl"
+
+
+@pytest.fixture()
+def middleware(spider: GoudenGidsSpider) -> AdaptiveThrottleMiddleware:
+    crawler = get_crawler(
+        GoudenGidsSpider,
+        {
+            "ADAPTIVE_THROTTLE_ENABLED": True,
+            "ADAPTIVE_THROTTLE_START_DELAY": 1,
+            "ADAPTIVE_THROTTLE_MIN_DELAY": 0.6,
+            "ADAPTIVE_THROTTLE_MAX_CONCURRENCY": 3,
+            "ADAPTIVE_THROTTLE_SLOTS": {"__splash__": {"max_concurrency": 1}},
+        },
+    )
+    crawler.stats.open_spider(spider)  # pyright: ignore[reportOptionalMemberAccess]
+    return AdaptiveThrottleMiddleware.from_crawler(crawler)
+
+
+def respond(
+    middleware: AdaptiveThrottleMiddleware,
+    spider: GoudenGidsSpider,
+    *,
+    status: int = 200,
+    latency: float = 0.1,
+    slot: str = SLOT,
+    headers: dict[str, str] | None = None,
+) -> None:
+    request = Request(URL, meta={"download_slot": slot, "download_latency": latency})
+    response = Response(URL, status=status, headers=headers, request=request)
+    assert middleware.process_response(request, response, spider) is response
+
+
+def test_not_configured():
+    with pytest.raises(NotConfigured):
+        AdaptiveThrottleMiddleware.from_crawler(get_crawler(GoudenGidsSpider))
+
+
+def test_speed_up(middleware: AdaptiveThrottleMiddleware, spider: GoudenGidsSpider):
+    respond(middleware, spider)
+    assert middleware.rates[SLOT].delay == 0.75
+    respond(middleware, spider)
+    # Below the minimum delay, the concurrency takes over
+    assert middleware.rates[SLOT].delay == 0
+    assert middleware.rates[SLOT].concurrency == 1
+    for _ in range(1 + 2 + 3):
+        respond(middleware, spider)
+    assert middleware.rates[SLOT].concurrency == 3
+    stats = middleware.stats
+    assert stats.get_value(f"adaptive_throttle/{SLOT}/concurrency") == 3
+    assert stats.get_value(f"adaptive_throttle/{SLOT}/rate") == pytest.approx(30)
+
+
+def test_slot_budget(middleware: AdaptiveThrottleMiddleware, spider: GoudenGidsSpider):
+    for _ in range(10):
+        respond(middleware, spider, slot="__splash__")
+    assert middleware.rates["__splash__"].concurrency == 1
+    # Each instance of a Splash pool has the budget of `__splash__`
+    for _ in range(10):
+        respond(middleware, spider, slot="__splash__/splash-1:8050")
+    assert middleware.rates["__splash__/splash-1:8050"].concurrency == 1
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_back_off(
+    middleware: AdaptiveThrottleMiddleware, spider: GoudenGidsSpider, status: int
+):
+    middleware.rate(SLOT).delay = 0
+    middleware.rate(SLOT).concurrency = 3
+    respond(middleware, spider, status=status, headers={"Retry-After": "10"})
+    assert middleware.rates[SLOT].concurrency == 1
+    assert middleware.rates[SLOT].delay == 10
+    assert middleware.stats.get_value("adaptive_throttle/backoffs") == 1
+
+
+def test_slow_down(middleware: AdaptiveThrottleMiddleware, spider: GoudenGidsSpider):
+    middleware.rate(SLOT).delay = 0
+    middleware.rate(SLOT).concurrency = 3
+    respond(middleware, spider, latency=10)
+    assert middleware.rates[SLOT].concurrency == 2
+
+
+def test_exception(middleware: AdaptiveThrottleMiddleware, spider: GoudenGidsSpider):
+    request = Request(URL, meta={"download_slot": SLOT})
+    middleware.process_exception(request, IgnoreRequest(), spider)
+    assert SLOT not in middleware.rates
+    middleware.process_exception(request, TwistedTimeoutError(), spider)
+    assert middleware.rates[SLOT].delay == 2
+
+
+def test_is_blocked():
+    assert is_blocked(HtmlResponse(URL, body=b"<div class='g-recaptcha'></div>"))
+    assert is_blocked(
+        HtmlResponse(
+            URL,
+            body=b"<title>Just a moment...</title><body>%s</body>" % (b" " * 100_000),
+        )
+    )
+    assert is_blocked(HtmlResponse("https://www.goudengids.nl/captcha/?r=1", body=b""))
+    assert not is_blocked(HtmlResponse(URL, body=b"<h1>Advocaten</h1>"))
+
+
+def test_is_blocked_page_with_recaptcha():
+    # A normal business page whose contact form is protected by reCAPTCHA
+    page = read_response_from_file(
+        Path("test_gouden_gids/responses/hendricks_short_description.html"), URL
+    )
+    script = b'<script src="https://www.google.com/recaptcha/api.js"></script>'
+    response = page.replace(body=page.body.replace(b"</body>", script + b"</body>"))
+    assert b"recaptcha" in response.body
+    assert not is_blocked(response)
@@ -1,19 +1,34 @@
 from pathlib import Path
+from typing import overload
 
-from scrapy.http import HtmlResponse, Request
+from scrapy.http import HtmlResponse, Request, TextResponse
 
 
-def read_response_from_file(file_path: Path, url: str):
+@overload
+def read_response_from_file(file_path: Path, url: str) -> HtmlResponse: ...
+
+
+@overload
+def read_response_from_file[ResponseT: TextResponse](
+    file_path: Path, url: str, response_class: type[ResponseT]
+) -> ResponseT: ...
+
+
+def read_response_from_file(
+    file_path: Path, url: str, response_class: type[TextResponse] = HtmlResponse
+) -> TextResponse:
     """Create a Scrapy fake HTTP response from a HTML file.
 
     :param file_name: The relative filename from the responses directory,
                       but absolute paths are also accepted.
     :param url: The URL of the response.
+    :param response_class: The type of response to create, e.g. `TextResponse`
+                           for JSON files.
     :return: A scrapy HTTP response which can be used for unittesting.
     """
     if not file_path.is_absolute():
         file_path = Path(__file__).parent.resolve() / file_path
-    return HtmlResponse(
+    return response_class(
         url=url,
         request=Request(url=url),
         body=file_path.read_text(),
@@ -0,0 +1,118 @@
+from collections.abc import AsyncIterator, Iterable
+from typing import Any, Self
+
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DontCloseSpider, NotConfigured
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+
+
+class BackpressureMiddleware:
+    """Spider middleware that holds new search pages back while enough work is pending.
+
+    Every search page adds a whole page of business pages to the queue, so
+    scheduling search pages as soon as they are found fills the queue with requests
+    that won't be downloaded for a long time. Instead, the requests to the callbacks
+    listed in the spider's `backpressure_callbacks` (e.g. `parse_page`) are kept
+    aside and released one at a time, once fewer than `BACKPRESSURE_WATERMARK`
+    requests are queued or being downloaded. At most `BACKPRESSURE_IN_FLIGHT` of the
+    released requests are pending at any time.
+
+    Together with a priority per callback, so that business pages are downloaded
+    before the search pages, this keeps the queue bounded and the items flowing
+    from the start of the crawl. Set `BACKPRESSURE_WATERMARK` to 0 to disable it.
+
+    :param watermark: Number of pending requests below which requests are released.
+    :param max_in_flight: Maximum number of released requests pending at a time.
+    """
+
+    def __init__(self, watermark: int, max_in_flight: int, crawler: Crawler):
+        self.watermark = watermark
+        self.max_in_flight = max_in_flight
+        self.crawler = crawler
+        self.stats: StatsCollector = crawler.stats  # pyright: ignore[reportAttributeAccessIssue]
+        # Held requests by URL, the same page is often linked to from several pages
+        self.held: dict[str, Request] = {}
+        self.in_flight: set[Request] = set()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if (watermark := settings.getint("BACKPRESSURE_WATERMARK")) <= 0:
+            raise NotConfigured
+        middleware = cls(
+            watermark, settings.getint("BACKPRESSURE_IN_FLIGHT", 2), crawler
+        )
+        for handler, signal in (
+            (middleware.request_done, signals.request_left_downloader),
+            (middleware.request_done, signals.request_dropped),
+            (middleware.spider_idle, signals.spider_idle),
+        ):
+            crawler.signals.connect(handler, signal=signal)
+        return middleware
+
+    def process_spider_output(
+        self, response: Response, result: Iterable[Any], spider: Spider
+    ) -> Iterable[Any]:
+        for element in result:
+            if self.is_held(element, spider):
+                self.hold(element)
+            else:
+                yield element
+        self.release()
+
+    async def process_spider_output_async(
+        self, response: Response, result: AsyncIterator[Any], spider: Spider
+    ) -> AsyncIterator[Any]:
+        async for element in result:
+            if self.is_held(element, spider):
+                self.hold(element)
+            else:
+                yield element
+        self.release()
+
+    @staticmethod
+    def is_held(element: Any, spider: Spider) -> bool:
+        callback = getattr(element, "callback", None)
+        return isinstance(element, Request) and (
+            getattr(callback, "__name__", None)
+            in getattr(spider, "backpressure_callbacks", ())
+        )
+
+    def hold(self, request: Request) -> None:
+        self.held.setdefault(request.url, request)
+        self.stats.max_value("backpressure/max_held", len(self.held))
+
+    def pending(self) -> int:
+        """Return the number of requests that are queued or being downloaded."""
+        engine: Any = self.crawler.engine
+        if engine is None or engine.slot is None:
+            return 0
+        return len(engine.slot.scheduler) + len(engine.downloader.active)
+
+    def release(self) -> None:
+        """Schedule the oldest held request, if there is room for it."""
+        if (
+            not self.held
+            or len(self.in_flight) >= self.max_in_flight
+            or self.pending() >= self.watermark
+        ):
+            return
+        request = self.held.pop(next(iter(self.held)))
+        self.in_flight.add(request)
+        self.stats.inc_value("backpressure/released")
+        self.crawler.engine.crawl(request)  # pyright: ignore[reportOptionalMemberAccess]
+
+    def request_done(self, request: Request, spider: Spider) -> None:
+        self.in_flight.discard(request)
+        # Every business page that leaves the downloader makes room for more
+        self.release()
+
+    def spider_idle(self, spider: Spider) -> None:
+        # Nothing is pending anymore, so whatever is still in flight was lost on
+        # the way, e.g. to a downloader middleware
+        self.in_flight.clear()
+        if self.held:
+            self.release()
+            raise DontCloseSpider
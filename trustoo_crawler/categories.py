@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import Any
+
+import yaml
+
+# Maps the name of a category to the number of pages to crawl in it.
+# `None` means that all pages of the category are crawled.
+Categories = dict[str, int | None]
+
+
+def parse_max_page(max_page: Any) -> int | None:
+    """Convert a page limit provided by the user to an integer."""
+    if max_page is None or max_page == "":
+        return None
+    max_page = int(max_page)
+    if max_page < 1:
+        msg = f"The number of pages to crawl must be positive, got {max_page}"
+        raise ValueError(msg)
+    return max_page
+
+
+def parse_categories(categories: str) -> Categories:
+    """Parse categories passed as a spider argument.
+
+    :param categories: Comma-separated categories, each optionally followed by a
+        colon and the number of pages to crawl, e.g. "advocaten:3,notarissen".
+    :return: The categories and their page limits.
+    """
+    parsed: Categories = {}
+    for category in categories.split(","):
+        name, _, max_page = category.strip().partition(":")
+        if name:
+            parsed[name] = parse_max_page(max_page.strip())
+    return parsed
+
+
+def load_categories(file_path: Path) -> Categories:
+    """Load categories from a YAML file.
+
+    The file contains either a list of categories, where each entry is a name or a
+    mapping with a `name` and an optional `max_page`, or a mapping of names to
+    page limits::
+
+        - advocaten
+        - name: notarissen
+          max_page: 5
+
+    :param file_path: Path to the YAML file.
+    :return: The categories and their page limits.
+    """
+    content = yaml.safe_load(file_path.read_text()) or []
+    if isinstance(content, dict):
+        return {
+            str(name): parse_max_page(max_page) for name, max_page in content.items()
+        }
+    categories: Categories = {}
+    for entry in content:
+        if isinstance(entry, dict):
+            categories[str(entry["name"])] = parse_max_page(entry.get("max_page"))
+        else:
+            categories[str(entry)] = None
+    return categories
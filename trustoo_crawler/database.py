@@ -0,0 +1,301 @@
+import json
+import sqlite3
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from functools import cache
+from pathlib import Path
+from typing import Any, NamedTuple, Protocol, Self
+
+from itemadapter import ItemAdapter
+from scrapy.settings import BaseSettings
+
+from trustoo_crawler.extraction import FIELDS
+from trustoo_crawler.items import WorkingTimes, serialize_working_times
+
+# The columns of the `businesses` table, the nested fields are stored as JSON
+BUSINESS_COLUMNS = (
+    "listing_id",
+    "name",
+    "location",
+    "description",
+    "phone",
+    "website",
+    "email",
+    "payment_options",
+    "certificates",
+    "parking_info",
+    "economic_data",
+    "logo",
+    "pictures",
+    "logo_file",
+    "picture_files",
+    "rating",
+    "review_count",
+    "phone_e164",
+    "address",
+    "opening_hours",
+    "updated_at",
+)
+JSON_COLUMNS = {
+    "payment_options",
+    "parking_info",
+    "economic_data",
+    "pictures",
+    "picture_files",
+    "address",
+    "opening_hours",
+}
+
+# Works on PostgreSQL as well, apart from the placeholders and `WITHOUT ROWID`, which
+# stores the rows of the child tables in their primary key instead of next to it
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS businesses (
+    listing_id TEXT PRIMARY KEY,
+    name TEXT,
+    location TEXT,
+    description TEXT,
+    phone TEXT,
+    website TEXT,
+    email TEXT,
+    payment_options TEXT,
+    certificates TEXT,
+    parking_info TEXT,
+    economic_data TEXT,
+    logo TEXT,
+    pictures TEXT,
+    logo_file TEXT,  -- See `AssetPipeline`
+    picture_files TEXT,
+    rating REAL,
+    review_count INTEGER,
+    phone_e164 TEXT,  -- See `NormalizationPipeline`
+    address TEXT,
+    opening_hours TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS working_times (
+    listing_id TEXT NOT NULL,
+    day TEXT NOT NULL,  -- e.g. "monday"
+    hours TEXT NOT NULL,
+    PRIMARY KEY (listing_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS social_media (
+    listing_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (listing_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS other_information (
+    listing_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    position INTEGER NOT NULL,  -- Of the value among the values of the name
+    value TEXT NOT NULL,
+    PRIMARY KEY (listing_id, name, position)
+) WITHOUT ROWID;
+"""
+# The columns of `businesses` that were added after the table was first created,
+# with their types. They are added to the databases of older crawls when these are
+# opened.
+ADDED_COLUMNS = {
+    "logo_file": "TEXT",
+    "picture_files": "TEXT",
+    "rating": "REAL",
+    "review_count": "INTEGER",
+    "phone_e164": "TEXT",
+    "address": "TEXT",
+    "opening_hours": "TEXT",
+}
+# The child tables, with their columns after `listing_id`
+CHILD_TABLES = {
+    "working_times": ("day", "hours"),
+    "social_media": ("position", "url"),
+    "other_information": ("name", "position", "value"),
+}
+# The field that a column or child table is filled in from, if it isn't the field of
+# the same name, e.g. by `NormalizationPipeline` or `AssetPipeline`
+SOURCE_FIELDS = {
+    "logo_file": "logo",
+    "picture_files": "pictures",
+    "phone_e164": "phone",
+    "address": "location",
+    "opening_hours": "working_time",
+    "working_times": "working_time",
+}
+
+
+class BusinessRows(NamedTuple):
+    """The rows of a business in each table of a `BusinessDatabase`.
+
+    The rows of a child table are `None` when its field wasn't scraped, the rows
+    that the database has already are kept then.
+    """
+
+    business: tuple[Any, ...]  # In the order of `columns`
+    working_times: list[tuple[Any, ...]] | None
+    social_media: list[tuple[Any, ...]] | None
+    other_information: list[tuple[Any, ...]] | None
+    columns: tuple[str, ...] = BUSINESS_COLUMNS  # The columns of `business`
+
+    @property
+    def listing_id(self) -> str:
+        return self.business[0]
+
+
+def is_selected(name: str, fields: tuple[str, ...]) -> bool:
+    """Return whether a column or child table is filled in by the selected fields."""
+    return SOURCE_FIELDS.get(name, name) in fields
+
+
+@cache
+def business_columns(fields: tuple[str, ...]) -> tuple[str, ...]:
+    """Return the columns of `businesses` that a selection of fields fills in."""
+    return tuple(
+        column
+        for column in BUSINESS_COLUMNS
+        if column in ("listing_id", "updated_at") or is_selected(column, fields)
+    )
+
+
+def business_rows(
+    business_item: Any, fields: tuple[str, ...] = FIELDS
+) -> BusinessRows | None:
+    """Return the rows of a business, `None` if it has no listing ID to key it on.
+
+    Takes a `BusinessItem` as well as a `BusinessRecord`.
+
+    :param fields: The fields that were scraped, see `select_fields`. The columns
+        and child tables of the other fields are left out, so that a crawl of a few
+        fields doesn't overwrite the rest of a business with empty values.
+    """
+    adapter = ItemAdapter(business_item)
+    if not (listing_id := adapter.get("listing_id")):
+        return None
+    columns = business_columns(fields)
+    values = {column: adapter.get(column) for column in columns}
+    for column in JSON_COLUMNS.intersection(columns):
+        values[column] = json.dumps(values[column], ensure_ascii=False)
+    values["updated_at"] = time.time()
+    working_time = adapter.get("working_time") or {}
+    days = (
+        serialize_working_times(working_time)
+        if isinstance(working_time, WorkingTimes)
+        else dict(working_time)
+    )
+    other_information = []
+    for name, entries in (adapter.get("other_information") or {}).items():
+        for position, value in enumerate(
+            [entries] if isinstance(entries, str) else entries
+        ):
+            other_information.append((listing_id, name, position, value))
+    child_rows = {
+        "working_times": [
+            (listing_id, day, hours) for day, hours in days.items() if hours
+        ],
+        "social_media": [
+            (listing_id, position, url)
+            for position, url in enumerate(adapter.get("social_media") or [])
+        ],
+        "other_information": other_information,
+    }
+    return BusinessRows(
+        business=tuple(values.values()),
+        columns=columns,
+        **{
+            table: table_rows if is_selected(table, fields) else None
+            for table, table_rows in child_rows.items()
+        },
+    )
+
+
+class BusinessDatabase(Protocol):
+    """The database that `DatabasePipeline` writes the businesses to.
+
+    Businesses are keyed on their listing ID: writing a business that is in the
+    database already replaces the columns and the child tables that its rows have.
+    Both methods are called from a thread of the pipeline, one call at a time.
+    """
+
+    def write(self, batch: list[BusinessRows]) -> None:
+        """Upsert a batch of businesses, in a single transaction."""
+        ...
+
+    def close(self) -> None: ...
+
+
+@cache
+def upsert_statement(
+    placeholder: str, columns: tuple[str, ...] = BUSINESS_COLUMNS
+) -> str:
+    """Return the upsert of some columns of a business, with the placeholder of the driver."""
+    values = ", ".join([placeholder] * len(columns))
+    updates = ", ".join(f"{column} = excluded.{column}" for column in columns)
+    return (
+        f"INSERT INTO businesses ({', '.join(columns)}) VALUES ({values}) "
+        f"ON CONFLICT (listing_id) DO UPDATE SET {updates}"
+    )
+
+
+class SQLiteBusinessDatabase:
+    """`BusinessDatabase` in a SQLite file.
+
+    :param path: Path to the database file, created if it doesn't exist.
+    """
+
+    def __init__(self, path: Path | str):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit, each batch is an explicit transaction. Created in the reactor
+        # thread, used by the thread of the pipeline.
+        self.connection = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        existing = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(businesses)")
+        }
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.connection.execute(
+                    f"ALTER TABLE businesses ADD COLUMN {column} {column_type}"
+                )
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self:
+        return cls(settings["DATABASE_PATH"])
+
+    def write(self, batch: list[BusinessRows]) -> None:
+        # A business that is in a batch twice is written once, as it was last
+        batch = list({rows.listing_id: rows for rows in batch}.values())
+        # The businesses of a batch usually all have the same columns
+        businesses: dict[tuple[str, ...], list[tuple[Any, ...]]] = {}
+        for rows in batch:
+            businesses.setdefault(rows.columns, []).append(rows.business)
+        with self.transaction():
+            for columns, values in businesses.items():
+                self.connection.executemany(upsert_statement("?", columns), values)
+            for table, columns in CHILD_TABLES.items():
+                replaced = [rows for rows in batch if getattr(rows, table) is not None]
+                self.connection.executemany(
+                    f"DELETE FROM {table} WHERE listing_id = ?",
+                    [(rows.listing_id,) for rows in replaced],
+                )
+                self.connection.executemany(
+                    f"INSERT INTO {table} (listing_id, {', '.join(columns)}) "
+                    f"VALUES (?, {', '.join('?' * len(columns))})",
+                    (row for rows in replaced for row in getattr(rows, table)),
+                )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        self.connection.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
@@ -0,0 +1,165 @@
+import hashlib
+import math
+import mmap
+import struct
+from pathlib import Path
+from typing import Self
+
+from scrapy import Request
+from scrapy.settings import BaseSettings
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import RequestFingerprinterProtocol
+from scrapy_splash import SplashAwareDupeFilter
+
+from trustoo_crawler.utils import get_listing_id
+
+
+class ListingIndex:
+    """Bloom filter of the listing IDs that have been seen, stored in a memory-mapped file.
+
+    Its size is fixed by the capacity and error rate, no matter how many IDs are
+    added, e.g. 10 million IDs at an error rate of one in a million take ~34 MiB.
+    A false positive means that a business is skipped, which is why the default
+    error rate is that low.
+
+    :param capacity: Number of IDs that the index is sized for.
+    :param error_rate: Probability of a false positive once `capacity` IDs are added.
+    :param path: File to store the index in, so that it can be reopened later.
+        Without one, the index only lives in (anonymous) memory.
+    """
+
+    # Magic bytes, number of bits and number of hashes
+    HEADER = struct.Struct("<8sQQ")
+    MAGIC = b"LSTINDEX"
+
+    def __init__(
+        self,
+        capacity: int = 10_000_000,
+        error_rate: float = 1e-6,
+        path: Path | None = None,
+    ):
+        self.bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.file = None
+        if path is None:
+            self.map = mmap.mmap(-1, self.size)
+            self.map[: self.HEADER.size] = self.header
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        exists = path.exists() and path.stat().st_size >= self.HEADER.size
+        self.file = path.open("r+b" if exists else "w+b")
+        if exists:
+            # An existing index keeps its own dimensions, otherwise the
+            # positions of the IDs that it already contains would change
+            magic, self.bits, self.hashes = self.HEADER.unpack(
+                self.file.read(self.HEADER.size)
+            )
+            if magic != self.MAGIC:
+                msg = f"{path} is not a listing index"
+                raise ValueError(msg)
+        else:
+            self.file.write(self.header)
+            self.file.truncate(self.size)
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), self.size)
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self:
+        """Create the index configured by the settings.
+
+        It is stored in `LISTING_INDEX_PATH` if set, otherwise in the job directory
+        if there is one, so that a resumed crawl remembers the listings.
+        """
+        path = settings.get("LISTING_INDEX_PATH")
+        if not path and (directory := job_dir(settings)):
+            path = Path(directory) / "listings.index"
+        return cls(
+            capacity=settings.getint("LISTING_INDEX_CAPACITY", 10_000_000),
+            error_rate=settings.getfloat("LISTING_INDEX_ERROR_RATE", 1e-6),
+            path=Path(path) if path else None,
+        )
+
+    @property
+    def header(self) -> bytes:
+        return self.HEADER.pack(self.MAGIC, self.bits, self.hashes)
+
+    @property
+    def size(self) -> int:
+        return self.HEADER.size + math.ceil(self.bits / 8)
+
+    def positions(self, listing_id: str) -> list[int]:
+        """Return the bits that represent an ID, using double hashing."""
+        digest = hashlib.blake2b(listing_id.encode(), digest_size=16).digest()
+        first, second = struct.unpack("<QQ", digest)
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, listing_id: str) -> bool:
+        offset = self.HEADER.size
+        return all(
+            self.map[offset + position // 8] & (1 << position % 8)
+            for position in self.positions(listing_id)
+        )
+
+    def add(self, listing_id: str) -> bool:
+        """Add an ID to the index.
+
+        :return: Whether the ID was (probably) in the index already.
+        """
+        offset = self.HEADER.size
+        seen = True
+        for position in self.positions(listing_id):
+            byte = offset + position // 8
+            bit = 1 << position % 8
+            if not self.map[byte] & bit:
+                seen = False
+                self.map[byte] |= bit
+        return seen
+
+    def close(self) -> None:
+        self.map.flush()
+        self.map.close()
+        if self.file:
+            self.file.close()
+
+
+class ListingDupeFilter(SplashAwareDupeFilter):
+    """Filter out duplicate business pages by their listing ID.
+
+    A business that is listed under several categories or on several search pages is
+    fetched only once per crawl, regardless of how it is requested (e.g. rendered or not).
+    All other requests are filtered by their fingerprint, like `SplashAwareDupeFilter` does.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        debug: bool = False,
+        *,
+        fingerprinter: RequestFingerprinterProtocol | None = None,
+        index: ListingIndex | None = None,
+    ):
+        super().__init__(path, debug, fingerprinter=fingerprinter)
+        self.index = index or ListingIndex()
+
+    @classmethod
+    def from_settings(
+        cls,
+        settings: BaseSettings,
+        *,
+        fingerprinter: RequestFingerprinterProtocol | None = None,
+    ) -> Self:
+        return cls(
+            job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=fingerprinter,
+            index=ListingIndex.from_settings(settings),
+        )
+
+    def request_seen(self, request: Request) -> bool:
+        if (listing_id := get_listing_id(request.url)) is not None:
+            return self.index.add(listing_id)
+        return super().request_seen(request)
+
+    def close(self, reason: str) -> None:
+        super().close(reason)
+        self.index.close()
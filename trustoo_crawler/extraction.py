@@ -0,0 +1,514 @@
+import json
+import re
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import MISSING, Field
+from dataclasses import fields as dataclass_fields
+from functools import cache
+from typing import Any, NamedTuple
+
+from itemadapter import ItemAdapter
+from lxml.html import HtmlElement
+from scrapy import Selector
+
+from trustoo_crawler.items import (
+    AnyBusinessItem,
+    BusinessItem,
+    BusinessRecord,
+    WorkingTimeItem,
+    WorkingTimes,
+)
+from trustoo_crawler.utils import DutchWeekDay
+
+# The characters that XPath 1.0 considers whitespace. Python's `str.split()` also
+# splits on things like non-breaking spaces, which `normalize-space()` keeps.
+XML_WHITESPACE = " \t\r\n"
+XML_WHITESPACE_RUN = re.compile(f"[{XML_WHITESPACE}]+")
+
+
+def normalize_space(text: str | None) -> str:
+    """Python equivalent of XPath's `normalize-space()`."""
+    if not text:
+        return ""
+    return XML_WHITESPACE_RUN.sub(" ", text).strip(XML_WHITESPACE)
+
+
+def string_value(element: HtmlElement) -> str:
+    """Return the XPath string-value of an element, i.e. all of its descendant text."""
+    return "".join(element.itertext())
+
+
+def text_nodes(element: HtmlElement) -> list[str]:
+    """Return the text nodes that are direct children of an element, the same as `text()`."""
+    texts = [element.text, *(child.tail for child in element)]
+    return [text for text in texts if text is not None]
+
+
+def first_child(element: HtmlElement, tag: str) -> HtmlElement | None:
+    """Return the first child of an element with a given tag."""
+    for child in element:
+        if child.tag == tag:
+            return child
+    return None
+
+
+@cache
+def attribute(name: str) -> Callable[[HtmlElement], str | None]:
+    """Probe that reads an attribute, the same as `@name`."""
+
+    def probe(element: HtmlElement) -> str | None:
+        return element.get(name)
+
+    return probe
+
+
+@cache
+def child_text(tag: str) -> Callable[[HtmlElement], str | None]:
+    """Probe that reads the first text node of the children with a tag, the same as `tag/text()`."""
+
+    def probe(element: HtmlElement) -> str | None:
+        for child in element:
+            if child.tag == tag and (texts := text_nodes(child)):
+                return texts[0]
+        return None
+
+    return probe
+
+
+@cache
+def child_string(tag: str) -> Callable[[HtmlElement], str | None]:
+    """Probe that reads the string-value of the first child with a tag, the same as `tag`."""
+
+    def probe(element: HtmlElement) -> str | None:
+        child = first_child(element, tag)
+        return None if child is None else string_value(child)
+
+    return probe
+
+
+@cache
+def child_attribute(tag: str, name: str) -> Callable[[HtmlElement], str | None]:
+    """Probe that reads the first attribute of the children with a tag, the same as `tag/@name`."""
+
+    def probe(element: HtmlElement) -> str | None:
+        for child in element:
+            if child.tag == tag and (value := child.get(name)) is not None:
+                return value
+        return None
+
+    return probe
+
+
+class Anchor(NamedTuple):
+    """Describes an element that a field of `BusinessItem` is extracted from.
+
+    Mirrors the `XPATH_CONTAINS` construction used by `GoudenGidsXPaths`.
+
+    :param tag: Tag of the element.
+    :param probe: Reads the value that the predicate is applied on.
+    :param value: Value that the probed value should contain.
+    """
+
+    tag: str
+    probe: Callable[[HtmlElement], str | None]
+    value: str
+
+    def matches(self, element: HtmlElement) -> bool:
+        """Evaluate `contains(concat(' ', normalize-space(probe), ' '), value)`."""
+        return self.matches_probed(self.probe(element))
+
+    def matches_probed(self, probed: str | None) -> bool:
+        """Evaluate the predicate on an already probed value."""
+        # A missing value is normalized to "  ", which none of the values can be part of
+        return probed is not None and self.value in f" {normalize_space(probed)} "
+
+
+# Each key is the section of the page that the anchored element stands for.
+# Together they cover every absolute lookup done by the XPaths in `GoudenGidsXPaths`.
+ANCHORS: dict[str, Anchor] = {
+    "name": Anchor("h1", attribute("itemprop"), "name"),
+    "location": Anchor("span", attribute("itemprop"), "address"),
+    "description": Anchor("div", child_text("h3"), "Beschrijving"),
+    "phone": Anchor("a", attribute("data-ta"), "PhoneButtonClick"),
+    "website": Anchor("div", attribute("data-ta"), "WebsiteActionClick"),
+    "email": Anchor("div", attribute("data-ta"), "EmailActionClick"),
+    "social_media": Anchor(
+        "div", attribute("class"), "flex flex-wrap social-media-wrap"
+    ),
+    "payment_options": Anchor("div", child_string("h3"), "Betaalmogelijkheden"),
+    "certificates": Anchor("div", child_string("h3"), "Certificeringen"),
+    "other_information": Anchor("div", child_string("h3"), "Overige informatie"),
+    "working_time": Anchor("div", child_string("h3"), "Openingsuren"),
+    "parking_info": Anchor("div", attribute("id"), "parking-info"),
+    "economic_data": Anchor("div", attribute("id"), "economic-data"),
+    "logo": Anchor("img", attribute("data-yext"), "logo"),
+    "pictures": Anchor("div", attribute("class"), "gallery flex flex-wrap"),
+    # Holds the rating of the business and its number of reviews in attributes
+    "profile": Anchor("div", attribute("id"), "profile"),
+}
+# The sections that JavaScript fills in after the page has loaded. Until then they
+# contain placeholders, such as "{0}", instead of the values.
+DYNAMIC_SECTIONS = ("parking_info", "economic_data")
+PLACEHOLDER = re.compile(r"\{\d+\}")
+# Anchors that are looked up relative to the sections above
+OTHER_INFORMATION_SUBSECTION = Anchor(
+    "div", child_attribute("span", "class"), "tab__subtitle"
+)
+GALLERY_ITEM = Anchor("img", attribute("class"), "gallery__item")
+# The fields of a business page, in the order of `BusinessItem`
+FIELDS = (
+    "name",
+    "location",
+    "description",
+    "phone",
+    "website",
+    "email",
+    "social_media",
+    "payment_options",
+    "certificates",
+    "other_information",
+    "working_time",
+    "parking_info",
+    "economic_data",
+    "logo",
+    "pictures",
+    "rating",
+    "review_count",
+)
+# The sections that a field is extracted from, if not the section of its own name
+FIELD_SECTIONS = {"rating": ("profile",), "review_count": ("profile",)}
+# Named selections of fields, e.g. `-a fields=leads`
+FIELD_PROFILES: dict[str, tuple[str, ...]] = {
+    "full": FIELDS,
+    # Enough to match businesses with the leads of a CRM
+    "leads": ("name", "phone", "website"),
+    "contact": ("name", "location", "phone", "website", "email", "working_time"),
+    # Everything in the plain HTML, so the pages are never rendered
+    "static": tuple(field for field in FIELDS if field not in DYNAMIC_SECTIONS),
+}
+
+
+def select_fields(selection: str) -> tuple[str, ...]:
+    """Parse a selection of fields passed as a spider argument.
+
+    :param selection: The name of a profile of `FIELD_PROFILES`, or comma-separated
+        fields, e.g. "name,phone,website".
+    :return: The selected fields, in the order of `FIELDS`.
+    """
+    if (profile := FIELD_PROFILES.get(selection.strip())) is not None:
+        return profile
+    selected = {field.strip() for field in selection.split(",")} - {""}
+    if unknown := selected.difference(FIELDS):
+        msg = f"Unknown fields: {', '.join(sorted(unknown))}"
+        raise ValueError(msg)
+    if not selected:
+        msg = "No fields selected"
+        raise ValueError(msg)
+    return tuple(field for field in FIELDS if field in selected)
+
+
+@cache
+def anchors_by_tag(fields: tuple[str, ...]) -> dict[str, list[tuple[str, Anchor]]]:
+    """Return the anchors of the sections of some fields, grouped by tag.
+
+    Each element of the walk is then only tested against the anchors that can
+    actually match it, and the sections of the other fields are never looked for.
+    """
+    sections = {
+        section for field in fields for section in FIELD_SECTIONS.get(field, (field,))
+    }
+    grouped: dict[str, list[tuple[str, Anchor]]] = {}
+    for section, anchor in ANCHORS.items():
+        if section in sections:
+            grouped.setdefault(anchor.tag, []).append((section, anchor))
+    return grouped
+
+
+class BusinessPageExtractor:
+    """Extract a `BusinessItem` from a business page while walking its tree only once.
+
+    The walk collects an anchor element for every section of the page. Each field is
+    then extracted from its anchors alone instead of searching the whole document again.
+    The output is identical to the one of the XPaths in `GoudenGidsXPaths`.
+
+    :param root: Root of the parsed business page, e.g. `response.selector.root`.
+    :param fields: The fields to extract, in the order of `FIELDS`. The sections of
+        the other fields are neither looked for nor extracted.
+    """
+
+    def __init__(self, root: HtmlElement, fields: tuple[str, ...] = FIELDS):
+        self.selected_fields = fields
+        self.anchors: dict[str, list[HtmlElement]] = {
+            section: [] for section in ANCHORS
+        }
+        # `OTHER_INFORMATION_SECTION_VALUE` is an absolute XPath (`//li/span/text()`),
+        # so every subsection of "Overige informatie" gets the same values.
+        # We collect them during the walk instead of once per subsection.
+        self.list_span_texts: list[str] = []
+        grouped = anchors_by_tag(fields)
+        tags = [*grouped, "li"] if "other_information" in fields else list(grouped)
+        if not tags:
+            return
+        for element in root.iter(*tags):
+            tag = element.tag
+            if tag == "li":
+                for child in element:
+                    if child.tag == "span":
+                        self.list_span_texts.extend(text_nodes(child))
+                continue
+            # Several anchors share a probe (e.g. the `h3` title of a `div`), so each
+            # probe is evaluated at most once per element
+            probed: dict[Callable[[HtmlElement], str | None], str | None] = {}
+            for section, anchor in grouped[tag]:
+                if anchor.probe not in probed:
+                    probed[anchor.probe] = anchor.probe(element)
+                if anchor.matches_probed(probed[anchor.probe]):
+                    self.anchors[section].append(element)
+
+    def extract(self) -> BusinessItem:
+        """Return a `BusinessItem` with the selected fields of the page."""
+        return to_item(self.fields())
+
+    def extract_record(self) -> BusinessRecord:
+        """Return a `BusinessRecord` with the selected fields of the page."""
+        return to_record(self.fields())
+
+    def field_extractors(self) -> dict[str, Callable[[], Any]]:
+        """Return the function that extracts each field, in the order of `BusinessItem`."""
+        return {
+            "name": lambda: self.first_text("name"),
+            "location": lambda: self.first_text("location"),
+            "description": self.description,
+            "phone": lambda: self.first_text("phone"),
+            "website": lambda: self.first_attribute("website", "data-js-value"),
+            "email": lambda: self.first_attribute("email", "data-js-value"),
+            "social_media": self.social_media,
+            "payment_options": self.payment_options,
+            "certificates": self.certificates,
+            "other_information": self.other_information,
+            "working_time": self.working_time,
+            "parking_info": lambda: self.list_information("parking_info"),
+            "economic_data": lambda: self.list_information("economic_data"),
+            "logo": lambda: self.first_attribute("logo", "src"),
+            "pictures": self.pictures,
+            "rating": self.rating,
+            "review_count": self.review_count,
+        }
+
+    def fields(
+        self, observe: Callable[[str, float], None] | None = None
+    ) -> dict[str, Any]:
+        """Return the selected fields of the page as plain values, in the order of `BusinessItem`.
+
+        :param observe: Called with the name of each field and the seconds that its
+            extraction took, e.g. `Timings.observe`.
+        """
+        extractors = self.field_extractors()
+        if self.selected_fields is not FIELDS:
+            extractors = {field: extractors[field] for field in self.selected_fields}
+        if observe is None:
+            return {field: extract() for field, extract in extractors.items()}
+        fields = {}
+        for field, extract in extractors.items():
+            started = time.perf_counter()
+            fields[field] = extract()
+            observe(field, time.perf_counter() - started)
+        return fields
+
+    def descendants(self, section: str, tag: str) -> Iterator[HtmlElement]:
+        """Yield the unique descendants of a section's anchors, the same as `//anchor//tag`."""
+        seen: set[HtmlElement] = set()
+        for anchor in self.anchors[section]:
+            for element in anchor.iterdescendants(tag):
+                if element not in seen:
+                    seen.add(element)
+                    yield element
+
+    def first_text(self, section: str) -> str:
+        """Return the normalized text of a section's first anchor."""
+        anchors = self.anchors[section]
+        return normalize_space(string_value(anchors[0])) if anchors else ""
+
+    def first_attribute(self, section: str, name: str) -> str:
+        """Return the normalized value of an attribute of a section's first anchor."""
+        for anchor in self.anchors[section]:
+            if (value := anchor.get(name)) is not None:
+                return normalize_space(value)
+        return ""
+
+    def description(self) -> str:
+        for anchor in self.anchors["description"]:
+            if (child := first_child(anchor, "div")) is not None:
+                return normalize_space(string_value(child))
+        return ""
+
+    def social_media(self) -> list[str]:
+        return stripped(
+            link.get("href")
+            for anchor in self.anchors["social_media"]
+            for link in anchor
+            if link.tag == "a"
+        )
+
+    def payment_options(self) -> list[str]:
+        return stripped(
+            option.get("title") for option in self.descendants("payment_options", "li")
+        )
+
+    def certificates(self) -> str:
+        for option in self.descendants("certificates", "li"):
+            for child in option:
+                if child.tag == "span" and (texts := text_nodes(child)):
+                    return normalize_space(texts[0])
+        return ""
+
+    def other_information(self) -> dict[str, Any]:
+        return {
+            normalize_space(string_value(title))
+            if (title := first_child(subsection, "span")) is not None
+            else "": [text.strip() for text in self.list_span_texts]
+            for subsection in self.descendants("other_information", "div")
+            if OTHER_INFORMATION_SUBSECTION.matches(subsection)
+        }
+
+    def working_time(self) -> dict[str, str]:
+        """Return the working time of each day, by the English name of the day."""
+        # Visit the days of the week in a single walk over the "Openingsuren"
+        # section, keeping the first element that matches each one
+        days = {day: "" for day in DutchWeekDay}
+        pending = set(DutchWeekDay)
+        probe = child_text("div")
+        for element in self.descendants("working_time", "div"):
+            if not pending:
+                break
+            text = f" {normalize_space(probe(element))} "
+            for day in [day for day in pending if day in text]:
+                days[day] = normalize_space(string_value(element))
+                pending.discard(day)
+        return {day.name.lower(): value for day, value in days.items()}
+
+    def list_information(self, section: str) -> dict[str, Any]:
+        """Return the mapping of names and values of a section made of `li` elements."""
+        return {
+            normalize_space(string_value(name))
+            if (name := first_child(entry, "span")) is not None
+            else "": [text.strip() for text in text_nodes(entry)]
+            for entry in self.descendants(section, "li")
+        }
+
+    def parking_info_parameters(self) -> dict[str, Any] | None:
+        """Return the parameters that the parking info widget requests its data with."""
+        for anchor in self.anchors["parking_info"]:
+            if (parameters := anchor.get("data-parking-info")) is not None:
+                try:
+                    return json.loads(parameters)
+                except json.JSONDecodeError:
+                    return None
+        return None
+
+    def rating(self) -> float | None:
+        if not self.review_count():
+            return None
+        return parse_rating(self.first_attribute("profile", "data-rating-avg"))
+
+    def review_count(self) -> int:
+        return parse_review_count(self.first_attribute("profile", "data-rating-cnt"))
+
+    def pictures(self) -> list[str]:
+        return stripped(
+            picture.get("src")
+            for picture in self.descendants("pictures", "img")
+            if GALLERY_ITEM.matches(picture)
+        )
+
+
+def field_default(record_field: Field) -> Any:
+    """Return the default of a dataclass field, `None` if it has none."""
+    if record_field.default_factory is not MISSING:
+        return record_field.default_factory()
+    if record_field.default is not MISSING:
+        return record_field.default
+    return None
+
+
+def unselected_defaults(fields: dict[str, Any]) -> dict[str, Any]:
+    """Return the defaults of `BusinessRecord` for the fields that weren't selected."""
+    return {
+        record_field.name: field_default(record_field)
+        for record_field in dataclass_fields(BusinessRecord)
+        if record_field.name in FIELDS and record_field.name not in fields
+    }
+
+
+def to_item(fields: dict[str, Any]) -> BusinessItem:
+    """Return a `BusinessItem` with the fields of `BusinessPageExtractor.fields`.
+
+    The fields that weren't selected are empty, like those of `to_record`.
+    """
+    if len(fields) < len(FIELDS):
+        defaults = unselected_defaults(fields)
+        if "working_time" in defaults:
+            defaults["working_time"] = defaults["working_time"]._asdict()
+        # In the order of `FIELDS`, which the exports of the first item keep
+        fields = {field: fields.get(field, defaults.get(field)) for field in FIELDS}
+    return BusinessItem(
+        **{**fields, "working_time": WorkingTimeItem(fields["working_time"])}
+    )
+
+
+def to_record(fields: dict[str, Any]) -> BusinessRecord:
+    """Return a `BusinessRecord` with the fields of `BusinessPageExtractor.fields`.
+
+    The fields that weren't selected keep their defaults.
+    """
+    if "working_time" not in fields:
+        return BusinessRecord(**fields)
+    return BusinessRecord(
+        **{**fields, "working_time": WorkingTimes(**fields["working_time"])}
+    )
+
+
+def extract_page(
+    text: str, fields: tuple[str, ...] = FIELDS
+) -> tuple[dict[str, Any], dict[str, Any] | None]:
+    """Return the fields and the parking info parameters of a business page.
+
+    Runs in the processes of a `ParsePool`, so it only takes and returns plain values.
+
+    :param text: The decoded body of the page, e.g. `response.text`.
+    :param fields: The fields to extract, see `BusinessPageExtractor`.
+    """
+    extractor = BusinessPageExtractor(Selector(text=text, type="html").root, fields)
+    return extractor.fields(), extractor.parking_info_parameters()
+
+
+def parse_rating(text: str) -> float | None:
+    """Parse a rating, e.g. "4.5" or "4,5", `None` if there is none."""
+    try:
+        return float(text.replace(",", "."))
+    except ValueError:
+        return None
+
+
+def parse_review_count(text: str) -> int:
+    """Parse a number of reviews, 0 if there is none."""
+    return int(text) if text.isdigit() else 0
+
+
+def stripped(values: Iterable[str | None]) -> list[str]:
+    """Strip the present values, the same as `get_element_texts` does with attributes."""
+    return [value.strip() for value in values if value is not None]
+
+
+def unresolved_sections(business_item: AnyBusinessItem) -> list[str]:
+    """Return the dynamic sections of an item that still contain placeholders."""
+    adapter = ItemAdapter(business_item)
+    return [
+        section
+        for section in DYNAMIC_SECTIONS
+        if any(
+            PLACEHOLDER.fullmatch(value)
+            for values in (adapter.get(section) or {}).values()
+            for value in values
+        )
+    ]
@@ -0,0 +1,383 @@
+import os
+import pickle
+import socket
+import sqlite3
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, NamedTuple, Protocol, Self
+
+from scrapy import Request, Spider, signals
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.crawler import Crawler
+from scrapy.exceptions import DontCloseSpider
+from scrapy.settings import BaseSettings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+from twisted.internet import task
+
+from trustoo_crawler.utils import get_listing_id
+
+# Number of requests that a worker leases from the frontier at once
+DEFAULT_LEASE_SIZE = 8
+# Seconds without a heartbeat after which a worker is considered gone
+DEFAULT_WORKER_TIMEOUT = 60.0
+# Seconds between the checks of an idle worker for new requests
+POLL_INTERVAL = 0.5
+# The key of `Request.meta` with the ID of the entry that a request was leased as
+ENTRY_ID_META = "frontier_entry_id"
+
+
+class FrontierEntry(NamedTuple):
+    """A request as it is stored in the frontier."""
+
+    key: str | None  # Deduplication key, `None` for requests that aren't filtered
+    priority: int
+    data: bytes  # The pickled request
+
+
+class Frontier(Protocol):
+    """The requests to crawl and the ones that were crawled, shared by several workers.
+
+    Each request is leased by a single worker, the one that downloads it, until it
+    is acknowledged once downloaded. The requests leased by a worker that stops
+    sending heartbeats, e.g. because it crashed mid-download, are leased again by
+    the other workers.
+    """
+
+    def push(self, entry: FrontierEntry) -> bool:
+        """Add a request, return `False` if a request with the same key was seen."""
+        ...
+
+    def lease(self, worker: str, count: int) -> list[tuple[int, bytes]]:
+        """Lease the requests with the highest priority, oldest first."""
+        ...
+
+    def ack(self, entry_id: int) -> None:
+        """Mark a leased request as done, once it was downloaded or failed to be."""
+        ...
+
+    def release(self, worker: str) -> None:
+        """Put the requests that a worker leased but didn't handle back in the queue."""
+        ...
+
+    def heartbeat(self, worker: str, *, idle: bool) -> None:
+        """Tell that a worker is alive and whether it has nothing left to do."""
+        ...
+
+    def busy_workers(self, exclude: str) -> int:
+        """Return the number of live workers that aren't idle, other than `exclude`."""
+        ...
+
+    def queued(self) -> int:
+        """Return the number of requests that are waiting to be leased."""
+        ...
+
+    def pending(self) -> int:
+        """Return the number of requests that weren't downloaded yet, leased or not."""
+        ...
+
+    def close(self) -> None: ...
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE,
+    priority INTEGER NOT NULL,
+    -- The pickled request, NULL once it was downloaded
+    data BLOB,
+    -- The worker that leased the request, NULL while it is queued
+    worker TEXT
+);
+CREATE INDEX IF NOT EXISTS requests_queued
+    ON requests (priority DESC, id) WHERE data IS NOT NULL AND worker IS NULL;
+CREATE INDEX IF NOT EXISTS requests_leased ON requests (worker) WHERE worker IS NOT NULL;
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL,
+    idle INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteFrontier:
+    """Frontier in a SQLite database, shared by the workers of a single host.
+
+    SQLite locks the database file while writing, which is all the coordination
+    that the workers need. The keys of the requests that were downloaded stay in
+    the database, they are the shared deduplication set.
+
+    :param path: Path to the database file, created if it doesn't exist.
+    :param worker_timeout: Seconds without a heartbeat after which a worker is
+        considered gone.
+    """
+
+    def __init__(
+        self, path: Path | str, worker_timeout: float = DEFAULT_WORKER_TIMEOUT
+    ):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.worker_timeout = worker_timeout
+        # Autocommit, the leases are explicit transactions. Other workers may hold
+        # the lock for a moment, hence the generous timeout.
+        self.connection = sqlite3.connect(path, isolation_level=None, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self:
+        return cls(
+            settings.get("FRONTIER_PATH") or "frontier.sqlite",
+            settings.getfloat("FRONTIER_WORKER_TIMEOUT", DEFAULT_WORKER_TIMEOUT),
+        )
+
+    def push(self, entry: FrontierEntry) -> bool:
+        cursor = self.connection.execute(
+            "INSERT OR IGNORE INTO requests (key, priority, data) VALUES (?, ?, ?)",
+            entry,
+        )
+        return cursor.rowcount > 0
+
+    def lease(self, worker: str, count: int) -> list[tuple[int, bytes]]:
+        with self.transaction():
+            # Take over the requests of the workers that are gone
+            self.connection.execute(
+                "UPDATE requests SET worker = NULL WHERE data IS NOT NULL AND worker IN "
+                "(SELECT name FROM workers WHERE heartbeat < ?)",
+                (time.time() - self.worker_timeout,),
+            )
+            rows = self.connection.execute(
+                "SELECT id, data FROM requests WHERE data IS NOT NULL AND worker IS NULL "
+                "ORDER BY priority DESC, id LIMIT ?",
+                (count,),
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE requests SET worker = ? WHERE id = ?",
+                [(worker, entry_id) for entry_id, _ in rows],
+            )
+        return rows
+
+    def ack(self, entry_id: int) -> None:
+        # Only the key is kept, the requests without one are of no use anymore
+        with self.transaction():
+            self.connection.execute(
+                "DELETE FROM requests WHERE id = ? AND key IS NULL", (entry_id,)
+            )
+            self.connection.execute(
+                "UPDATE requests SET data = NULL WHERE id = ?", (entry_id,)
+            )
+
+    def release(self, worker: str) -> None:
+        self.connection.execute(
+            "UPDATE requests SET worker = NULL WHERE worker = ? AND data IS NOT NULL",
+            (worker,),
+        )
+
+    def heartbeat(self, worker: str, *, idle: bool) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO workers (name, heartbeat, idle) VALUES (?, ?, ?)",
+            (worker, time.time(), idle),
+        )
+
+    def busy_workers(self, exclude: str) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM workers WHERE name != ? AND NOT idle "
+            "AND heartbeat >= ?",
+            (exclude, time.time() - self.worker_timeout),
+        ).fetchone()[0]
+
+    def queued(self) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM requests WHERE data IS NOT NULL AND worker IS NULL"
+        ).fetchone()[0]
+
+    def pending(self) -> int:
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM requests WHERE data IS NOT NULL"
+        ).fetchone()[0]
+
+    def close(self) -> None:
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        # Takes the write lock right away, so that two workers never lease the
+        # same requests
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+
+class FrontierScheduler(BaseScheduler):
+    """Scheduler that shares its queue and deduplication with other workers.
+
+    Every request that a worker schedules is added to a `Frontier`, unless a
+    request with the same key was seen by any of the workers. The key of a business
+    page is its listing ID, so a business is fetched once no matter the category
+    or the worker it was found by. Each worker then leases a few requests at a
+    time, the ones with the highest priority first, so the search pages and
+    business pages are spread over the workers as they become available.
+
+    A leased request is only acknowledged once it left the downloader, so the
+    requests of a worker that crashes or is killed mid-download are leased again by
+    the other workers, once its heartbeats stop.
+
+    A worker only stops once the frontier is empty and every other worker is idle
+    too, since those may still find new pages.
+
+    Enable it with `SCHEDULER` and pick the backend with `FRONTIER_BACKEND`, e.g.
+    `scrapy crawl gouden_gids -s SCHEDULER=trustoo_crawler.frontier.FrontierScheduler`.
+    `python -m trustoo_crawler.workers` runs several workers at once.
+
+    :param frontier: The frontier shared by the workers.
+    :param worker: Name of this worker, unique among the workers.
+    :param lease_size: Number of requests to lease at once.
+    """
+
+    def __init__(
+        self,
+        frontier: Frontier,
+        worker: str,
+        crawler: Crawler,
+        lease_size: int = DEFAULT_LEASE_SIZE,
+        heartbeat_interval: float = DEFAULT_WORKER_TIMEOUT / 4,
+    ):
+        self.frontier = frontier
+        self.worker = worker
+        self.crawler = crawler
+        self.lease_size = lease_size
+        self.heartbeat_interval = heartbeat_interval
+        self.stats: StatsCollector = crawler.stats  # pyright: ignore[reportAttributeAccessIssue]
+        self.leased: deque[tuple[int, bytes]] = deque()
+        # The leased requests that were handed over to the engine, not acked yet
+        self.in_progress: set[int] = set()
+        self.idle = False
+        self.heartbeats = task.LoopingCall(self.heartbeat)
+        self.polls = task.LoopingCall(self.poll)
+        self.spider: Spider | None = None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        backend = load_object(
+            settings.get("FRONTIER_BACKEND", "trustoo_crawler.frontier.SQLiteFrontier")
+        )
+        scheduler = cls(
+            backend.from_settings(settings),
+            settings.get("FRONTIER_WORKER") or f"{socket.gethostname()}-{os.getpid()}",
+            crawler,
+            lease_size=settings.getint("FRONTIER_LEASE_SIZE", DEFAULT_LEASE_SIZE),
+            heartbeat_interval=settings.getfloat(
+                "FRONTIER_WORKER_TIMEOUT", DEFAULT_WORKER_TIMEOUT
+            )
+            / 4,
+        )
+        crawler.signals.connect(scheduler.spider_idle, signal=signals.spider_idle)
+        # A download that fails leaves the downloader without a response
+        crawler.signals.connect(
+            scheduler.request_done, signal=signals.request_left_downloader
+        )
+        crawler.signals.connect(
+            scheduler.request_done, signal=signals.response_received
+        )
+        return scheduler
+
+    def open(self, spider: Spider) -> None:
+        self.spider = spider
+        self.heartbeats.start(self.heartbeat_interval)
+        self.polls.start(POLL_INTERVAL, now=False)
+
+    def close(self, reason: str) -> None:
+        for loop in (self.heartbeats, self.polls):
+            if loop.running:
+                loop.stop()
+        # The engine waits for the downloads in progress before closing, so the
+        # requests that are left were dropped before reaching the downloader, e.g.
+        # by a downloader middleware
+        for entry_id in self.in_progress:
+            self.frontier.ack(entry_id)
+        self.in_progress.clear()
+        # Whatever this worker didn't get to is left to the others
+        self.frontier.release(self.worker)
+        self.frontier.heartbeat(self.worker, idle=True)
+        self.frontier.close()
+
+    def heartbeat(self) -> None:
+        self.frontier.heartbeat(self.worker, idle=self.idle)
+
+    def poll(self) -> None:
+        """Wake the engine of an idle worker up as soon as the others added requests."""
+        # Otherwise the engine only checks the scheduler every 5 seconds while idle
+        engine: Any = self.crawler.engine
+        if (
+            self.idle
+            and engine is not None
+            and engine.slot is not None
+            and self.frontier.queued()
+        ):
+            engine.slot.nextcall.schedule()
+
+    def has_pending_requests(self) -> bool:
+        return bool(self.leased) or self.frontier.queued() > 0
+
+    def enqueue_request(self, request: Request) -> bool:
+        entry = FrontierEntry(
+            None if request.dont_filter else self.key(request),
+            request.priority,
+            pickle.dumps(request.to_dict(spider=self.spider), protocol=5),
+        )
+        if not self.frontier.push(entry):
+            self.stats.inc_value("frontier/filtered")
+            return False
+        self.stats.inc_value("frontier/enqueued")
+        return True
+
+    def next_request(self) -> Request | None:
+        if not self.leased:
+            self.leased.extend(self.frontier.lease(self.worker, self.lease_size))
+            if not self.leased:
+                return None
+        if self.idle:
+            self.idle = False
+            self.heartbeat()
+        entry_id, data = self.leased.popleft()
+        request = request_from_dict(pickle.loads(data), spider=self.spider)
+        # Copies of the request, e.g. the one sent to Splash, keep the meta
+        request.meta[ENTRY_ID_META] = entry_id
+        self.in_progress.add(entry_id)
+        self.stats.inc_value("frontier/dequeued")
+        return request
+
+    def request_done(self, request: Request, **kwargs) -> None:
+        """Acknowledge a leased request once it was downloaded, or failed to be."""
+        entry_id = request.meta.get(ENTRY_ID_META)
+        if entry_id in self.in_progress:
+            self.in_progress.discard(entry_id)
+            self.frontier.ack(entry_id)
+
+    def key(self, request: Request) -> str:
+        """Return the deduplication key of a request."""
+        if (listing_id := get_listing_id(request.url)) is not None:
+            return listing_id
+        fingerprinter: Any = self.crawler.request_fingerprinter
+        return fingerprinter.fingerprint(request).hex()
+
+    def spider_idle(self, spider: Spider) -> None:
+        self.idle = True
+        self.heartbeat()
+        # The other workers may still add requests to the frontier
+        if self.frontier.busy_workers(exclude=self.worker):
+            raise DontCloseSpider
+
+    def __len__(self) -> int:
+        # All the requests that are waiting, not only the ones of this worker
+        return len(self.leased) + self.frontier.queued()
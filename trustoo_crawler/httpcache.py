@@ -0,0 +1,361 @@
+import gzip
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from scrapy import Request, Spider
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.settings import BaseSettings
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+from w3lib.url import canonicalize_url
+
+# `zstandard` is an optional dependency, the bodies are compressed with gzip without it.
+# Install it with `poetry install --extras zstd`.
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Arguments of a render that don't change the page that Splash returns. The URL is
+# part of the key on its own.
+VOLATILE_SPLASH_ARGS = {"url", "headers", "cookies", "load_args", "save_args"}
+# The extension of the stored bodies per compression
+EXTENSIONS = {"zstd": ".zst", "gzip": ".gz"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,  -- The URL of the page, also for renders
+    render TEXT,  -- The endpoint and arguments of a render, NULL for plain requests
+    status INTEGER NOT NULL,
+    headers BLOB NOT NULL,
+    digest TEXT NOT NULL,
+    stored_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_url ON responses (url);
+CREATE INDEX IF NOT EXISTS responses_digest ON responses (digest);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE TABLE IF NOT EXISTS bodies (
+    digest TEXT PRIMARY KEY,
+    compression TEXT NOT NULL,
+    size INTEGER NOT NULL  -- Once compressed
+);
+"""
+
+
+class CachedResponse(NamedTuple):
+    """A response as stored in a `ResponseCache`."""
+
+    key: str
+    url: str
+    render: str | None
+    status: int
+    headers: bytes
+    digest: str
+    stored_at: float
+
+
+COLUMNS = ", ".join(CachedResponse._fields)
+
+
+def default_compression() -> str:
+    return "gzip" if zstandard is None else "zstd"
+
+
+def compress(body: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        if zstandard is None:
+            msg = "Compressing with zstd requires zstandard, install the 'zstd' extra"
+            raise RuntimeError(msg)
+        return zstandard.ZstdCompressor().compress(body)
+    # A fixed timestamp keeps the same body identical once compressed
+    return gzip.compress(body, mtime=0)
+
+
+def decompress(data: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        if zstandard is None:
+            msg = "The cache is compressed with zstd, install the 'zstd' extra"
+            raise RuntimeError(msg)
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def cache_target(request: Request) -> tuple[str, str | None]:
+    """Return the URL of the page that a request fetches and its render, if any.
+
+    Renders are identified by the page and the arguments that change what Splash
+    returns, not by the Splash instance that rendered them or the user agent.
+    """
+    if not (splash := request.meta.get("splash")):
+        return request.url, None
+    args = {
+        name: value
+        for name, value in splash.get("args", {}).items()
+        if name not in VOLATILE_SPLASH_ARGS
+    }
+    # `SplashDeduplicateArgsMiddleware` sends the Lua script only once per Splash
+    # instance, so the script is identified by its fingerprint
+    args.update(splash.get("_local_arg_fingerprints", {}))
+    render = json.dumps(
+        {"endpoint": splash.get("endpoint", "render.json"), "args": args},
+        sort_keys=True,
+    )
+    return splash.get("args", {}).get("url", request.url), render
+
+
+def cache_key(request: Request) -> str:
+    """Return the key of a request in a `ResponseCache`."""
+    url, render = cache_target(request)
+    key = hashlib.blake2b(digest_size=20)
+    if render is None:
+        key.update(request.method.encode())
+        key.update(b"\0" + canonicalize_url(url).encode())
+        key.update(b"\0" + request.body)
+    else:
+        key.update(b"SPLASH\0" + canonicalize_url(url).encode())
+        key.update(b"\0" + render.encode())
+    return key.hexdigest()
+
+
+class ResponseCache:
+    """Content-addressed store of responses, with an SQLite index.
+
+    Each body is stored once, compressed, in a file named after its hash, no matter
+    how many responses have it. The index maps the requests to the bodies, by the
+    URL of the page and the render arguments for the responses of Splash.
+
+    :param path: Directory of the cache, created if it doesn't exist.
+    :param compression: How new bodies are compressed, "zstd" or "gzip".
+    """
+
+    def __init__(self, path: Path, compression: str | None = None):
+        self.path = path
+        self.compression = compression or default_compression()
+        if self.compression not in EXTENSIONS:
+            msg = f"Unknown compression {self.compression}, use zstd or gzip"
+            raise ValueError(msg)
+        (path / "bodies").mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path / "index.sqlite", isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def body_path(self, digest: str, compression: str) -> Path:
+        return self.path / "bodies" / digest[:2] / f"{digest}{EXTENSIONS[compression]}"
+
+    def get(self, key: str, max_age: float = 0) -> CachedResponse | None:
+        """Return the response stored for a key, `None` if it is missing or expired.
+
+        :param max_age: Seconds after which a response is expired, 0 for never.
+        """
+        row = self.connection.execute(
+            f"SELECT {COLUMNS} FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        cached = CachedResponse(*row)
+        if max_age and time.time() - cached.stored_at > max_age:
+            return None
+        self.connection.execute(
+            "UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key)
+        )
+        return cached
+
+    def find(self, url: str, *, rendered: bool = False) -> list[CachedResponse]:
+        """Return the responses stored for a page, the most recent first."""
+        rows = self.connection.execute(
+            f"""
+            SELECT {COLUMNS} FROM responses
+            WHERE url = ? AND (render IS NOT NULL) = ?
+            ORDER BY stored_at DESC
+            """,
+            (url, rendered),
+        )
+        return [CachedResponse(*row) for row in rows]
+
+    def responses(self) -> Iterator[CachedResponse]:
+        """Yield every stored response, the most recent first."""
+        rows = self.connection.execute(
+            f"SELECT {COLUMNS} FROM responses ORDER BY stored_at DESC"
+        )
+        for row in rows:
+            yield CachedResponse(*row)
+
+    def body(self, digest: str) -> bytes:
+        (compression,) = self.connection.execute(
+            "SELECT compression FROM bodies WHERE digest = ?", (digest,)
+        ).fetchone()
+        return decompress(self.body_path(digest, compression).read_bytes(), compression)
+
+    def put(
+        self,
+        key: str,
+        url: str,
+        render: str | None,
+        status: int,
+        headers: bytes,
+        body: bytes,
+    ) -> None:
+        digest = hashlib.sha256(body).hexdigest()
+        stored = self.connection.execute(
+            "SELECT 1 FROM bodies WHERE digest = ?", (digest,)
+        ).fetchone()
+        if stored is None:
+            data = compress(body, self.compression)
+            path = self.body_path(digest, self.compression)
+            path.parent.mkdir(exist_ok=True)
+            # Written aside first, so that a crash never leaves half a body behind
+            partial = path.with_name(f"{path.name}.partial")
+            partial.write_bytes(data)
+            partial.replace(path)
+            self.connection.execute(
+                "INSERT OR REPLACE INTO bodies VALUES (?, ?, ?)",
+                (digest, self.compression, len(data)),
+            )
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, render, status, headers, digest, now, now),
+        )
+
+    def size(self) -> int:
+        """Return the size of the stored bodies, in bytes."""
+        (size,) = self.connection.execute(
+            "SELECT coalesce(sum(size), 0) FROM bodies"
+        ).fetchone()
+        return size
+
+    def expire(self, max_age: float) -> int:
+        """Remove the responses older than a number of seconds.
+
+        :return: The number of responses that were removed.
+        """
+        cursor = self.connection.execute(
+            "DELETE FROM responses WHERE stored_at < ?", (time.time() - max_age,)
+        )
+        self.remove_orphans()
+        return cursor.rowcount
+
+    def evict(self, max_size: int) -> int:
+        """Remove the least recently used responses until the bodies fit in a size.
+
+        :param max_size: The size that the bodies may take, in bytes.
+        :return: The number of responses that were removed.
+        """
+        if (excess := self.size() - max_size) <= 0:
+            return 0
+        references = dict(
+            self.connection.execute(
+                "SELECT digest, count(*) FROM responses GROUP BY digest"
+            )
+        )
+        sizes = dict(self.connection.execute("SELECT digest, size FROM bodies"))
+        evicted: list[str] = []
+        # A body is only freed once none of the responses that share it are left
+        for key, digest in self.connection.execute(
+            "SELECT key, digest FROM responses ORDER BY accessed_at"
+        ).fetchall():
+            if excess <= 0:
+                break
+            evicted.append(key)
+            references[digest] -= 1
+            if not references[digest]:
+                excess -= sizes.get(digest, 0)
+        self.connection.executemany(
+            "DELETE FROM responses WHERE key = ?", [(key,) for key in evicted]
+        )
+        self.remove_orphans()
+        return len(evicted)
+
+    def remove_orphans(self) -> None:
+        """Remove the bodies that no response refers to anymore."""
+        orphans = self.connection.execute(
+            """
+            SELECT digest, compression FROM bodies
+            WHERE NOT EXISTS (
+                SELECT 1 FROM responses WHERE responses.digest = bodies.digest
+            )
+            """
+        ).fetchall()
+        for digest, compression in orphans:
+            self.body_path(digest, compression).unlink(missing_ok=True)
+        self.connection.executemany(
+            "DELETE FROM bodies WHERE digest = ?", [(digest,) for digest, _ in orphans]
+        )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class ContentAddressedCacheStorage:
+    """Storage of Scrapy's HTTP cache in a `ResponseCache`.
+
+    Caches plain responses as well as renders of Splash, so that a crawl can be
+    repeated, or its business pages extracted again with `trustoo_crawler.reparse`,
+    without fetching anything. Enable it with e.g.
+    `scrapy crawl gouden_gids -s HTTPCACHE_ENABLED=True`.
+
+    Responses expire after `HTTPCACHE_EXPIRATION_SECS` and, once the crawl is done,
+    the least recently used ones are evicted until the cache takes at most
+    `HTTPCACHE_MAX_SIZE` bytes. `HTTPCACHE_COMPRESSION` is either "zstd" or "gzip".
+    """
+
+    def __init__(self, settings: BaseSettings):
+        self.cachedir = Path(data_path(settings["HTTPCACHE_DIR"], createdir=True))
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS")
+        self.max_size = settings.getint("HTTPCACHE_MAX_SIZE")
+        self.compression = settings.get("HTTPCACHE_COMPRESSION")
+        self.cache: ResponseCache | None = None
+
+    def open_spider(self, spider: Spider) -> None:
+        self.cache = ResponseCache(self.cachedir / spider.name, self.compression)
+        logger.debug("Using the HTTP cache in %s", self.cache.path)
+
+    def close_spider(self, spider: Spider) -> None:
+        assert self.cache is not None
+        if self.expiration_secs:
+            self.cache.expire(self.expiration_secs)
+        if self.max_size:
+            evicted = self.cache.evict(self.max_size)
+            if (stats := spider.crawler.stats) is not None:
+                stats.set_value("httpcache/evicted", evicted)
+        self.cache.close()
+
+    def retrieve_response(self, spider: Spider, request: Request) -> Response | None:
+        assert self.cache is not None
+        cached = self.cache.get(cache_key(request), self.expiration_secs)
+        if cached is None:
+            return None
+        body = self.cache.body(cached.digest)
+        headers = Headers(headers_raw_to_dict(cached.headers))
+        response_class = responsetypes.from_args(
+            headers=headers, url=request.url, body=body
+        )
+        return response_class(
+            url=request.url, headers=headers, status=cached.status, body=body
+        )
+
+    def store_response(
+        self, spider: Spider, request: Request, response: Response
+    ) -> None:
+        assert self.cache is not None
+        url, render = cache_target(request)
+        self.cache.put(
+            cache_key(request),
+            url,
+            render,
+            response.status,
+            headers_dict_to_raw(response.headers) or b"",
+            response.body,
+        )
@@ -0,0 +1,287 @@
+import bisect
+import json
+import logging
+import math
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, Self
+
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+from twisted.internet import task
+from twisted.web.resource import Resource
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the buckets of the histograms, in seconds. They span the extraction
+# of a single field up to a render that times out.
+BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    math.inf,
+)
+# Published in the stats, e.g. `timing/download/p95`
+QUANTILES = {"p50": 0.5, "p95": 0.95, "p99": 0.99}
+# Set on each request when it is scheduled, to time how long it waits in the queue
+SCHEDULED_AT = "instrumentation_scheduled_at"
+DEFAULT_INTERVAL = 60.0
+
+
+class Histogram:
+    """Distribution of durations, counted in the fixed `BUCKETS`."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket of a quantile, the maximum at most."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts, strict=True):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "max": self.max,
+            **{name: self.quantile(q) for name, q in QUANTILES.items()},
+        }
+
+
+class Timings:
+    """Histograms of the durations of the stages of a crawl, by name."""
+
+    def __init__(self):
+        self.histograms: dict[str, Histogram] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        if (histogram := self.histograms.get(name)) is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the summary and buckets of every histogram, as plain values."""
+        return {
+            name: {
+                **histogram.summary(),
+                "buckets": {
+                    str(bound): count
+                    for bound, count in zip(BUCKETS, histogram.counts, strict=True)
+                },
+            }
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+    def prometheus(self) -> str:
+        """Return the histograms in the text format of Prometheus."""
+        lines = [
+            "# HELP trustoo_crawler_stage_seconds Duration of the stages of the crawl.",
+            "# TYPE trustoo_crawler_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts, strict=True):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else repr(bound)
+                lines.append(
+                    f'trustoo_crawler_stage_seconds_bucket{{stage="{name}",le="{le}"}}'
+                    f" {cumulative}"
+                )
+            lines.append(
+                f'trustoo_crawler_stage_seconds_sum{{stage="{name}"}} {histogram.sum}'
+            )
+            lines.append(
+                f'trustoo_crawler_stage_seconds_count{{stage="{name}"}} {histogram.count}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+class MetricsResource(Resource):
+    """Serves the `Timings` of a crawl to Prometheus."""
+
+    isLeaf = True
+
+    def __init__(self, timings: Timings):
+        super().__init__()
+        self.timings = timings
+
+    def render_GET(self, request: Any) -> bytes:
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4")
+        return self.timings.prometheus().encode()
+
+
+class InstrumentationMiddleware:
+    """Spider middleware that times every stage of the crawl, to find what limits it.
+
+    Records in histograms:
+
+    - `download`: the latency of each plain request,
+    - `render`: the latency of each render of Splash,
+    - `queue_wait`: how long each request waited between being scheduled and
+      reaching the downloader,
+    - `callback/<name>`: the CPU time of each callback of the spider, e.g.
+      `callback/parse_business_page`,
+    - `extraction/walk` and `field/<name>`: the walk of each business page and the
+      extraction of each of its fields, unless the pages are extracted in a
+      `ParsePool`.
+
+    Their count, mean, quantiles and maximum are published in the stats
+    (`timing/*`) every `INSTRUMENTATION_INTERVAL` seconds and when the crawl ends.
+    With `INSTRUMENTATION_SNAPSHOT_PATH`, the histograms are written to that JSON
+    file as well. With `INSTRUMENTATION_PORT`, they are served at
+    `http://127.0.0.1:<port>/metrics` for Prometheus.
+
+    Must be the closest to the spider, so that the callbacks are timed without the
+    other middlewares.
+    """
+
+    def __init__(
+        self,
+        crawler: Crawler,
+        interval: float = DEFAULT_INTERVAL,
+        snapshot_path: Path | None = None,
+        port: int | None = None,
+    ):
+        self.crawler = crawler
+        self.stats: StatsCollector = crawler.stats  # pyright: ignore[reportAttributeAccessIssue]
+        self.interval = interval
+        self.snapshot_path = snapshot_path
+        self.port = port
+        self.timings = Timings()
+        self.publications = task.LoopingCall(self.publish)
+        self.listening_port: Any = None
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not settings.getbool("INSTRUMENTATION_ENABLED"):
+            raise NotConfigured
+        snapshot_path = settings.get("INSTRUMENTATION_SNAPSHOT_PATH")
+        middleware = cls(
+            crawler,
+            interval=settings.getfloat("INSTRUMENTATION_INTERVAL", DEFAULT_INTERVAL),
+            snapshot_path=Path(snapshot_path) if snapshot_path else None,
+            port=settings.getint("INSTRUMENTATION_PORT") or None,
+        )
+        for handler, signal in (
+            (middleware.spider_opened, signals.spider_opened),
+            (middleware.spider_closed, signals.spider_closed),
+            (middleware.request_scheduled, signals.request_scheduled),
+            (middleware.request_reached_downloader, signals.request_reached_downloader),
+            (middleware.response_received, signals.response_received),
+        ):
+            crawler.signals.connect(handler, signal=signal)
+        return middleware
+
+    def spider_opened(self, spider: Spider) -> None:
+        # The spider times the extraction of the business pages with these
+        spider.timings = self.timings  # pyright: ignore[reportAttributeAccessIssue]
+        if self.interval > 0:
+            self.publications.start(self.interval, now=False)
+        if self.port is not None:
+            from twisted.internet import reactor
+            from twisted.web.server import Site
+
+            root = Resource()
+            # `Resource` implements `IResource` through zope.interface, which pyright
+            # can't see
+            root.putChild(b"metrics", MetricsResource(self.timings))  # pyright: ignore[reportArgumentType]
+            self.listening_port = reactor.listenTCP(  # pyright: ignore[reportAttributeAccessIssue]
+                self.port, Site(root), interface="127.0.0.1"
+            )
+            logger.info("Serving the timings at http://127.0.0.1:%d/metrics", self.port)
+
+    def spider_closed(self, spider: Spider) -> None:
+        if self.publications.running:
+            self.publications.stop()
+        if self.listening_port is not None:
+            self.listening_port.stopListening()
+        self.publish()
+
+    def request_scheduled(self, request: Request, spider: Spider) -> None:
+        # Wall-clock time, since a resumed crawl reads the request back from disk
+        request.meta[SCHEDULED_AT] = time.time()
+
+    def request_reached_downloader(self, request: Request, spider: Spider) -> None:
+        if (scheduled_at := request.meta.get(SCHEDULED_AT)) is not None:
+            self.timings.observe("queue_wait", max(0.0, time.time() - scheduled_at))
+
+    def response_received(
+        self, response: Response, request: Request, spider: Spider
+    ) -> None:
+        if (latency := request.meta.get("download_latency")) is None:
+            # Served from the HTTP cache
+            return
+        stage = "render" if request.meta.get("_splash_processed") else "download"
+        self.timings.observe(stage, latency)
+
+    def process_spider_output(
+        self, response: Response, result: Iterable[Any], spider: Spider
+    ) -> Iterator[Any]:
+        callback = getattr(response.request, "callback", None)
+        name = getattr(callback, "__name__", "parse")
+        # The callbacks run lazily, one element at a time, in the reactor thread
+        cpu_time = 0.0
+        iterator = iter(result)
+        while True:
+            started = time.thread_time()
+            try:
+                element = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                cpu_time += time.thread_time() - started
+            yield element
+        self.timings.observe(f"callback/{name}", cpu_time)
+
+    def publish(self) -> None:
+        """Publish the summaries in the stats and write the snapshot, if enabled."""
+        snapshot = self.timings.snapshot()
+        for name, summary in snapshot.items():
+            for key, value in summary.items():
+                if key != "buckets":
+                    self.stats.set_value(f"timing/{name}/{key}", value)
+        if self.snapshot_path is None:
+            return
+        self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside first, so that a reader never sees half a snapshot
+        partial = self.snapshot_path.with_name(f"{self.snapshot_path.name}.partial")
+        partial.write_text(
+            json.dumps({"time": time.time(), "timings": snapshot}, indent=2),
+            encoding="utf-8",
+        )
+        partial.replace(self.snapshot_path)
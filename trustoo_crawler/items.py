@@ -1,5 +1,11 @@
+from dataclasses import dataclass, field
+from enum import StrEnum
+from typing import Any, NamedTuple
+
 from scrapy import Field, Item
 
+from trustoo_crawler.utils import DutchWeekDay
+
 
 class WorkingTimeItem(Item):
     """Item that contains the days of the week."""
@@ -16,6 +22,7 @@ class WorkingTimeItem(Item):
 class BusinessItem(Item):
     """Item that holds all information about a business."""
 
+    listing_id = Field()  # Stable ID of the business on Gouden Gids, e.g. "L119193538"
     name = Field()
     location = Field()
     description = Field()
@@ -31,3 +38,107 @@ class BusinessItem(Item):
     economic_data = Field()
     logo = Field()
     pictures = Field()
+    # Filled in by `AssetPipeline`: the file of each image in the `MEDIA_STORE`, e.g.
+    # "files/ab/ab12….webp". The ones of `picture_files` are in the order of
+    # `pictures`, `None` for a picture that couldn't be downloaded.
+    logo_file = Field()
+    picture_files = Field()
+    rating = Field()  # Average rating of the reviews, `None` without reviews
+    review_count = Field()
+    # Filled in by `NormalizationPipeline`, see `normalize_item`
+    phone_e164 = Field()  # e.g. "+31205517555"
+    address = Field()  # The components of `location`, see `Address`
+    opening_hours = Field()  # [start, end] pairs of minutes since Monday 00:00
+
+
+class ReviewItem(Item):
+    """Item that holds a review of a business.
+
+    Reviews are emitted next to the `BusinessItem` of their business, one by one,
+    instead of as a list in it. They are linked to it by its listing ID.
+    """
+
+    listing_id = Field()
+    review_id = Field()  # Stable ID of the review, see `review_id`
+    author = Field()
+    rating = Field()
+    date = Field()
+    text = Field()
+
+
+# The position of each day in `WorkingTimes`
+DAY_INDEX = {day: index for index, day in enumerate(DutchWeekDay)}
+
+
+class WorkingTimes(NamedTuple):
+    """The working time of a business on each day of the week, in a single tuple.
+
+    Compact alternative to `WorkingTimeItem`. Look a day up with `on`.
+    """
+
+    monday: str = ""
+    tuesday: str = ""
+    wednesday: str = ""
+    thursday: str = ""
+    friday: str = ""
+    saturday: str = ""
+    sunday: str = ""
+
+    def on(self, day: DutchWeekDay) -> str:
+        """Return the working time on a day."""
+        return self[DAY_INDEX[day]]
+
+
+def serialize_working_times(working_times: WorkingTimes) -> dict[str, str]:
+    """Export the working times with the names of the days, like `WorkingTimeItem`."""
+    return working_times._asdict()
+
+
+@dataclass(slots=True)
+class BusinessRecord:
+    """Compact alternative to `BusinessItem`, with the same fields.
+
+    A slotted dataclass has no `__dict__` per instance and the working times are a
+    single tuple instead of a nested item, so it takes a fraction of the memory.
+    Scrapy handles it through `itemadapter`, like any other item.
+    """
+
+    listing_id: str | None = None
+    name: str = ""
+    location: str = ""
+    description: str = ""
+    phone: str = ""
+    website: str = ""
+    email: str = ""
+    social_media: list[str] = field(default_factory=list)
+    payment_options: list[str] = field(default_factory=list)
+    certificates: str = ""
+    other_information: dict[str, Any] = field(default_factory=dict)
+    working_time: WorkingTimes = field(
+        default_factory=WorkingTimes,
+        # Exporters call the serializer of a field, if it has one
+        metadata={"serializer": serialize_working_times},
+    )
+    parking_info: dict[str, Any] = field(default_factory=dict)
+    economic_data: dict[str, Any] = field(default_factory=dict)
+    logo: str = ""
+    pictures: list[str] = field(default_factory=list)
+    # `None` until the images are downloaded, like the missing fields of an item
+    logo_file: str | None = None
+    picture_files: list[str | None] | None = None
+    rating: float | None = None
+    review_count: int = 0
+    phone_e164: str | None = None
+    address: dict[str, str] | None = None
+    opening_hours: list[list[int]] = field(default_factory=list)
+
+
+# Either of the models of a business
+AnyBusinessItem = BusinessItem | BusinessRecord
+
+
+class ItemModel(StrEnum):
+    """The class that the spider represents businesses with."""
+
+    ITEM = "item"  # `BusinessItem`
+    RECORD = "record"  # `BusinessRecord`
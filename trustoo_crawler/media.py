@@ -0,0 +1,254 @@
+import hashlib
+import mimetypes
+import multiprocessing
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+from typing import Any, NamedTuple
+from urllib.parse import urlparse
+
+from twisted.internet.defer import Deferred, DeferredSemaphore
+from w3lib.url import safe_url_string
+
+from trustoo_crawler.pool import deferred_from_future
+
+# `pillow` is an optional dependency, only needed for the thumbnails.
+# Install it with `poetry install --extras images`.
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,  -- SHA-256 of the content, which names the file
+    extension TEXT NOT NULL,
+    content_type TEXT,
+    fetched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS assets_digest ON assets (digest);
+"""
+# Quality of the JPEG thumbnails
+THUMBNAIL_QUALITY = 85
+
+
+class StoredAsset(NamedTuple):
+    """An image as stored in an `AssetStore`."""
+
+    url: str
+    digest: str
+    extension: str
+    content_type: str | None
+    fetched_at: float
+
+    @property
+    def file_name(self) -> str:
+        """The path of the file of the asset, relative to the directory of the store."""
+        return f"files/{self.digest[:2]}/{self.digest}{self.extension}"
+
+
+COLUMNS = ", ".join(StoredAsset._fields)
+
+
+def asset_extension(url: str, content_type: str | None) -> str:
+    """Return the extension of the file of an asset, e.g. ".webp"."""
+    if content_type and (
+        extension := mimetypes.guess_extension(content_type.split(";")[0].strip())
+    ):
+        return extension
+    return PurePosixPath(urlparse(url).path).suffix.lower()
+
+
+class AssetStore:
+    """Content-addressed store of the logos and pictures of the businesses.
+
+    Each image is stored once, in a file named after its hash, no matter how many
+    URLs it was downloaded from: chains share their logo between all of their
+    businesses. An SQLite index maps the URLs to the files, so that the assets that
+    were stored in a previous crawl aren't downloaded again.
+
+    Layout of the directory:
+
+    - `index.sqlite`: the index,
+    - `files/ab/<sha256>.<extension>`: the images,
+    - `thumbnails/<name>/ab/<sha256>.jpg`: their thumbnails.
+
+    :param path: Directory of the store, created if it doesn't exist.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        (path / "files").mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path / "index.sqlite", isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def file_path(self, asset: StoredAsset) -> Path:
+        return self.path / asset.file_name
+
+    def thumbnail_path(self, asset: StoredAsset, name: str) -> Path:
+        return (
+            self.path / "thumbnails" / name / asset.digest[:2] / f"{asset.digest}.jpg"
+        )
+
+    def get(self, url: str) -> StoredAsset | None:
+        """Return the asset stored for a URL, `None` if it isn't stored."""
+        row = self.connection.execute(
+            f"SELECT {COLUMNS} FROM assets WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None or not self.file_path(asset := StoredAsset(*row)).exists():
+            return None
+        return asset
+
+    def put(
+        self, url: str, body: bytes, content_type: str | None
+    ) -> tuple[StoredAsset, bool]:
+        """Store the content of a URL.
+
+        :return: The stored asset and whether its content is new to the store.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        # The content may have been stored for another URL, with another extension
+        row = self.connection.execute(
+            "SELECT extension FROM assets WHERE digest = ? LIMIT 1", (digest,)
+        ).fetchone()
+        extension = row[0] if row else asset_extension(url, content_type)
+        asset = StoredAsset(url, digest, extension, content_type, time.time())
+        path = self.file_path(asset)
+        if new := not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Written aside first, so that a crash never leaves half an image behind
+            partial = path.with_name(f"{path.name}.partial")
+            partial.write_bytes(body)
+            partial.replace(path)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO assets ({COLUMNS}) VALUES (?, ?, ?, ?, ?)", asset
+        )
+        return asset, new
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def can_make_thumbnails() -> bool:
+    """Return whether pillow, which makes the thumbnails, is installed."""
+    return Image is not None
+
+
+def make_thumbnails(source: Path, targets: dict[Path, tuple[int, int]]) -> int:
+    """Write JPEG thumbnails of an image, each fitting in a width and height.
+
+    Runs in a process of a `ThumbnailPool`.
+
+    :return: The number of thumbnails that were written.
+    """
+    if Image is None:
+        msg = "Making thumbnails requires pillow, install the 'images' extra"
+        raise ImportError(msg)
+    with Image.open(source) as image:
+        image.load()
+        if image.mode in {"RGBA", "LA", "P"}:
+            # JPEG has no transparency, logos are shown on white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        else:
+            image = image.convert("RGB")
+    for target, size in targets.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail(size)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        partial = target.with_name(f"{target.name}.partial")
+        thumbnail.save(partial, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        partial.replace(target)
+    return len(targets)
+
+
+class ThumbnailPool:
+    """Pool of processes that make thumbnails, so that the reactor stays free.
+
+    :param size: Number of processes.
+    """
+
+    def __init__(self, size: int):
+        # Forking a process with a running reactor and its threads is unsafe, so the
+        # processes start from scratch
+        self.executor = ProcessPoolExecutor(
+            size, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def make(self, source: Path, targets: dict[Path, tuple[int, int]]) -> Deferred[int]:
+        """Make thumbnails in another process, see `make_thumbnails`."""
+        return deferred_from_future(
+            self.executor.submit(make_thumbnails, source, targets)
+        )
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AssetFetcher:
+    """Downloads assets on a connection pool of its own, separate from Scrapy's.
+
+    The images are served by a CDN rather than by Gouden Gids, so they are neither
+    throttled nor counted in the concurrency of the crawl.
+
+    :param concurrency: Downloads at the same time, and connections kept per host.
+    :param timeout: Seconds after which a download is abandoned.
+    :param user_agent: Sent with every download.
+    """
+
+    def __init__(self, concurrency: int, timeout: float, user_agent: str):
+        from twisted.internet import reactor
+        from twisted.web.client import (
+            Agent,
+            BrowserLikeRedirectAgent,
+            HTTPConnectionPool,
+        )
+
+        self.pool = HTTPConnectionPool(reactor, persistent=True)
+        self.pool.maxPersistentPerHost = concurrency
+        # `Agent` implements `IAgent` through zope.interface, which pyright can't see
+        self.agent = BrowserLikeRedirectAgent(
+            Agent(reactor, connectTimeout=timeout, pool=self.pool)  # pyright: ignore[reportArgumentType]
+        )
+        self.semaphore = DeferredSemaphore(concurrency)
+        self.timeout = timeout
+        self.user_agent = user_agent
+
+    def fetch(self, url: str) -> Deferred[tuple[bytes, str | None]]:
+        """Download an asset, return its content and content type."""
+        return self.semaphore.run(self.download, url)
+
+    def download(self, url: str) -> Deferred[tuple[bytes, str | None]]:
+        from twisted.internet import reactor
+        from twisted.web.client import readBody
+        from twisted.web.http_headers import Headers
+
+        def read(response: Any) -> Deferred:
+            if response.code != 200:
+                msg = f"{url} answered with {response.code}"
+                raise ValueError(msg)
+            content_type = response.headers.getRawHeaders(b"Content-Type", [None])[0]
+            body = readBody(response)
+            body.addCallback(
+                lambda body: (body, content_type.decode() if content_type else None)
+            )
+            return body
+
+        download = self.agent.request(
+            b"GET",
+            safe_url_string(url).encode(),
+            Headers({b"User-Agent": [self.user_agent.encode()]}),
+        )
+        download.addCallback(read)
+        # Covers reading the body as well
+        download.addTimeout(self.timeout, reactor)  # pyright: ignore[reportArgumentType]
+        return download
+
+    def close(self) -> Deferred:
+        return self.pool.closeCachedConnections()
@@ -3,97 +3,172 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-# useful for handling different item types with a single interface
-from scrapy import signals
-
-
-class TrustooCrawlerSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
-
-    @classmethod
-    def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
-
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
-
-        # Should return None or raise an exception.
-        return None
-
-    def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
-
-        # Must return an iterable of Request, or item objects.
-        yield from result
+import time
+from collections.abc import Iterable, Iterator
+from typing import Any, Self
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
-
-        # Should return either None or an iterable of Request or item objects.
-        pass
-
-    def process_start_requests(self, start_requests, spider):
-        # Called with the start requests of the spider, and works
-        # similarly to the process_spider_output() method, except
-        # that it doesn't have a response associated.
-
-        # Must return only requests (not items).
-        yield from start_requests
-
-    def spider_opened(self, spider):
-        spider.logger.info(f"Spider opened: {spider.name}")
-
-
-class TrustooCrawlerDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+# useful for handling different item types with a single interface
+from itemadapter import ItemAdapter
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+
+from trustoo_crawler.extraction import FIELDS
+from trustoo_crawler.items import BusinessItem, BusinessRecord, ReviewItem
+from trustoo_crawler.state import ListingStateStore, item_hash
+from trustoo_crawler.utils import get_listing_id
+
+
+class ListingStateMiddleware:
+    """Downloader middleware that fetches only the business pages that may have changed.
+
+    Enabled by the `LISTING_STATE_PATH` setting, see `ListingStateStore`. Pages that
+    were fetched less than `LISTING_STATE_MAX_AGE` seconds ago are skipped and the
+    others are requested conditionally, with the validators of the previous crawl.
+    When a crawl finishes, the listings of the categories that were crawled
+    completely but weren't found anymore are marked as disappeared.
+
+    The previous state of a listing is passed on to the spider in the
+    `listing_state` meta key of its request.
+    """
+
+    def __init__(self, store: ListingStateStore, max_age: float, stats: StatsCollector):
+        self.store = store
+        self.max_age = max_age
+        self.stats = stats
+        self.started_at = time.time()
 
     @classmethod
-    def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
-
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
-
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
-
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        if not (path := crawler.settings.get("LISTING_STATE_PATH")):
+            raise NotConfigured
+        middleware = cls(
+            ListingStateStore(path),
+            crawler.settings.getfloat("LISTING_STATE_MAX_AGE"),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_request(self, request: Request, spider: Spider) -> None:
+        if (listing_id := get_listing_id(request.url)) is None:
+            return
+        state = self.store.see(listing_id, request.url, request.meta.get("category"))
+        request.meta["listing_state"] = state
+        if state and state.fetched_at and time.time() - state.fetched_at < self.max_age:
+            self.stats.inc_value("listing_state/skipped_recent", spider=spider)
+            msg = f"Listing {listing_id} was fetched recently"
+            raise IgnoreRequest(msg)
+        # Splash doesn't pass the validators on, so only plain requests are conditional
+        if "splash" in request.meta or not state or not state.content_hash:
+            return
+        if state.etag:
+            request.headers.setdefault("If-None-Match", state.etag)
+        if state.last_modified:
+            request.headers.setdefault("If-Modified-Since", state.last_modified)
+
+    def process_response(
+        self, request: Request, response: Response, spider: Spider
+    ) -> Response:
+        if "splash" in request.meta or (
+            (listing_id := get_listing_id(request.url)) is None
+        ):
+            return response
+        if response.status == 304:
+            self.store.record_not_modified(listing_id)
+            self.stats.inc_value("listing_state/not_modified", spider=spider)
+            msg = f"Listing {listing_id} hasn't changed"
+            raise IgnoreRequest(msg)
+        if response.status == 200:
+            self.store.record_response(
+                listing_id,
+                header_value(response, "ETag"),
+                header_value(response, "Last-Modified"),
+            )
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def spider_closed(self, spider: Spider, reason: str) -> None:
+        # Only the categories that were crawled from start to end can tell that a
+        # listing is gone, not the ones limited to their first few pages
+        complete = [
+            category
+            for category, max_page in getattr(spider, "categories", {}).items()
+            if max_page is None
+        ]
+        if reason == "finished" and complete:
+            disappeared = self.store.mark_disappeared(complete, self.started_at)
+            self.stats.set_value(
+                "listing_state/disappeared", disappeared, spider=spider
+            )
+        self.store.close()
+
+
+class ListingStateSpiderMiddleware:
+    """Spider middleware that passes on only the new and changed business items.
+
+    Counterpart of `ListingStateMiddleware`, enabled by the same settings. The hash
+    of every item is compared with the one of the previous crawl. The number of
+    reviews of every new or changed business and its newest review, the first one
+    on its page, are recorded for the next crawl.
+
+    A crawl of only some of the fields, e.g. `-a fields=leads`, passes every item on
+    and leaves the state as it is. Its items can't be compared with those of a
+    full crawl, and the next full crawl would find every business changed.
+    """
+
+    def __init__(self, store: ListingStateStore, stats: StatsCollector):
+        self.store = store
+        self.stats = stats
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
-
-    def spider_opened(self, spider):
-        spider.logger.info(f"Spider opened: {spider.name}")
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        if not (path := crawler.settings.get("LISTING_STATE_PATH")):
+            raise NotConfigured
+        middleware = cls(
+            ListingStateStore(path),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_spider_output(
+        self, response: Response, result: Iterable[Any], spider: Spider
+    ) -> Iterator[Any]:
+        if getattr(spider, "selected_fields", FIELDS) != FIELDS:
+            yield from result
+            return
+        # The listings whose newest review was recorded
+        newest_reviews = set()
+        for element in result:
+            if isinstance(element, BusinessItem | BusinessRecord) and (
+                listing_id := ItemAdapter(element).get("listing_id")
+            ):
+                if not self.store.record_item(listing_id, item_hash(element)):
+                    # Unchanged items are left out silently, dropping them in a
+                    # pipeline would log a warning for each one of them
+                    self.stats.inc_value("listing_state/unchanged", spider=spider)
+                    continue
+                self.store.record_reviews(
+                    listing_id, ItemAdapter(element).get("review_count")
+                )
+                self.stats.inc_value("listing_state/changed", spider=spider)
+            elif (
+                isinstance(element, ReviewItem)
+                and element["listing_id"] not in newest_reviews
+            ):
+                newest_reviews.add(element["listing_id"])
+                self.store.record_reviews(
+                    element["listing_id"], newest_review_id=element["review_id"]
+                )
+            yield element
+
+    def spider_closed(self, spider: Spider) -> None:
+        self.store.close()
+
+
+def header_value(response: Response, name: str) -> str | None:
+    """Return the value of a response header as a string."""
+    value = response.headers.get(name)
+    return value.decode("latin-1") if value else None
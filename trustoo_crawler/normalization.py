@@ -0,0 +1,179 @@
+import operator
+import re
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+from trustoo_crawler.items import BusinessRecord, WorkingTimes
+from trustoo_crawler.utils import DutchWeekDay
+
+# Gouden Gids only lists Dutch businesses, so national numbers are Dutch
+COUNTRY_CODE = "31"
+# How a number may start, with what replaces that start to get the international
+# number without its "+". The first prefix that matches is used.
+PHONE_PREFIXES = (
+    ("+", ""),
+    ("00", ""),  # International access code
+    ("0", COUNTRY_CODE),  # National trunk prefix
+)
+# The characters that phone numbers are written with, besides the digits. A trunk
+# prefix written after the country code goes as well, e.g. "+31 (0)20 551 7555".
+PHONE_SEPARATORS = re.compile(r"\s*\(0\)|[\s\-./()]+")
+# E.164 numbers have at most 15 digits, the shortest Dutch ones (e.g. 0800
+# numbers) have 7 after the country code
+MIN_PHONE_DIGITS = 9
+MAX_PHONE_DIGITS = 15
+# e.g. "Zuidzijde Haven 39/a, 4611HC Bergen op Zoom". The house number is the
+# last word of the street part that starts with a digit, the street may contain
+# digits as well, e.g. "Laan 1940-1945 12".
+ADDRESS = re.compile(
+    r"(?P<street>.+?)\s+(?P<house_number>\d[^\s,]*(?:\s+[A-Za-z]{1,2})?)\s*,\s*"
+    r"(?P<postcode>\d{4})\s*(?P<letters>[A-Za-z]{2})\s+(?P<city>.+)"
+)
+# The intervals of a day, e.g. "Maandag 9:00 - 12:00 13:00 - 17:30"
+HOURS = re.compile(r"(\d{1,2})[:.u](\d{2})\s*-\s*(\d{1,2})[:.u](\d{2})")
+# Texts of a day that is open all day long, lowercase
+ALL_DAY = ("24 uur", "dag en nacht")
+MINUTES_PER_DAY = 24 * 60
+# The offset of each day of the week, starting on Monday at 00:00
+DAY_OFFSETS = tuple(index * MINUTES_PER_DAY for index in range(len(DutchWeekDay)))
+# The names of the days in `WorkingTimeItem`, in the order of the week
+DAY_NAMES = tuple(day.name.lower() for day in DutchWeekDay)
+get_days = operator.itemgetter(*DAY_NAMES)
+# The parsers see the same values over and over again, e.g. the opening hours of
+# most businesses are one of a few dozens. The caches are bounded, so that a long
+# crawl of mostly unique phone numbers doesn't keep all of them in memory.
+CACHE_SIZE = 2**16
+
+
+class Address(NamedTuple):
+    """The components of an address."""
+
+    street: str
+    house_number: str
+    postcode: str  # e.g. "1082 MD"
+    city: str
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize_phone(text: str) -> str | None:
+    """Return a phone number in E.164 format, e.g. "+31205517555".
+
+    :return: `None` if the text isn't a phone number.
+    """
+    if text[0] == "+" and text[1:].isdigit():
+        # Gouden Gids usually has them in this format already
+        digits = text[1:]
+        return text if MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS else None
+    digits = PHONE_SEPARATORS.sub("", text)
+    for prefix, replacement in PHONE_PREFIXES:
+        if digits.startswith(prefix):
+            digits = replacement + digits[len(prefix) :]
+            break
+    else:
+        return None
+    if not digits.isdigit() or not MIN_PHONE_DIGITS <= len(digits) <= MAX_PHONE_DIGITS:
+        return None
+    return f"+{digits}"
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_address(text: str) -> Address | None:
+    """Return the components of an address, e.g. "Kerkstraat 28, 5751BH Deurne".
+
+    :return: `None` if the text isn't an address with a postcode.
+    """
+    if (match := ADDRESS.fullmatch(text.strip())) is None:
+        return None
+    return Address(
+        match["street"],
+        match["house_number"],
+        f"{match['postcode']} {match['letters'].upper()}",
+        match["city"],
+    )
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def day_intervals(text: str) -> tuple[tuple[int, int], ...]:
+    """Return the intervals of a day in minutes since midnight.
+
+    An interval that ends before it starts ends after midnight, e.g. "18:00 - 2:00"
+    is `(1080, 1560)`. A day without any hours is closed.
+    """
+    if any(all_day in text.lower() for all_day in ALL_DAY):
+        return ((0, MINUTES_PER_DAY),)
+    intervals = []
+    for start_hour, start_minute, end_hour, end_minute in HOURS.findall(text):
+        start = int(start_hour) * 60 + int(start_minute)
+        end = int(end_hour) * 60 + int(end_minute)
+        intervals.append((start, end if end > start else end + MINUTES_PER_DAY))
+    return tuple(intervals)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def week_intervals(days: tuple[str, ...]) -> tuple[tuple[int, int], ...]:
+    """Return the opening hours of a week in minutes since Monday 00:00.
+
+    :param days: The working time of each day, from Monday to Sunday.
+    """
+    return tuple(
+        (offset + start, offset + end)
+        for offset, text in zip(DAY_OFFSETS, days, strict=True)
+        for start, end in day_intervals(text or "")
+    )
+
+
+def opening_hours(working_time: Any) -> list[list[int]]:
+    """Return the opening hours of a `WorkingTimeItem` or `WorkingTimes`.
+
+    Each interval is a `[start, end]` pair of minutes since Monday 00:00. The ones
+    on Sunday night may end after the end of the week.
+    """
+    if isinstance(working_time, WorkingTimes):
+        days = working_time
+    else:
+        try:
+            days = get_days(working_time)
+        except KeyError:
+            days = tuple(working_time.get(day) for day in DAY_NAMES)
+    return [[start, end] for start, end in week_intervals(days)]
+
+
+def normalized_fields(
+    phone: str | None, location: str | None, working_time: Any
+) -> tuple[str | None, dict[str, str] | None, list[list[int]]]:
+    """Return the normalized phone number, address and opening hours of a business."""
+    address = parse_address(location) if location else None
+    return (
+        normalize_phone(phone) if phone else None,
+        None if address is None else address._asdict(),
+        [] if working_time is None else opening_hours(working_time),
+    )
+
+
+def normalize_item(business_item: Any) -> Any:
+    """Fill in the normalized fields of a business from its scraped fields.
+
+    Sets `phone_e164`, `address` and `opening_hours`. Takes a `BusinessItem` as
+    well as a `BusinessRecord`.
+    """
+    # Not through `ItemAdapter`, building one takes longer than the normalization
+    # of a business whose values are cached
+    if isinstance(business_item, BusinessRecord):
+        (
+            business_item.phone_e164,
+            business_item.address,
+            business_item.opening_hours,
+        ) = normalized_fields(
+            business_item.phone, business_item.location, business_item.working_time
+        )
+        return business_item
+    (
+        business_item["phone_e164"],
+        business_item["address"],
+        business_item["opening_hours"],
+    ) = normalized_fields(
+        business_item.get("phone"),
+        business_item.get("location"),
+        business_item.get("working_time"),
+    )
+    return business_item
@@ -0,0 +1,123 @@
+import re
+from typing import Any
+from urllib.parse import urlencode
+
+from trustoo_crawler.extraction import PLACEHOLDER
+
+# The endpoint that the parking info widget of a business page fetches its data from.
+# It is served by Gouden Gids itself, which forwards the request to seety.co.
+PARKING_API_URL = "https://www.goudengids.nl/api/seety/parking/"
+# The types of parking, as the widget translates them to Dutch
+PARKING_TYPES = {
+    "paid": "Betalend",
+    "disc": "Schijf",
+    "free": "Gratis",
+    "resident": "Residentieel",
+    "pedestrian": "Voetgangerszone",
+}
+DEFAULT_PARKING_TYPE = "Geen parking"
+# Mimics JavaScript's `parseInt`, which reads the leading integer of a string
+LEADING_INTEGER = re.compile(r"\s*[+-]?\d+")
+
+
+def parking_api_url(parameters: dict[str, Any]) -> str | None:
+    """Return the URL of the parking info of a business.
+
+    :param parameters: The parameters of the widget, as found in the
+        `data-parking-info` attribute of the business page.
+    :return: The URL or `None` if the parameters are incomplete, in which case the
+        widget doesn't make the request either.
+    """
+    if any(parameters.get(key) is None for key in ("id", "lat", "lng", "isDetail")):
+        return None
+    # The coordinates are sometimes written with a decimal comma
+    query = {
+        "lat": str(parameters["lat"]).replace(",", "."),
+        "lng": str(parameters["lng"]).replace(",", "."),
+    }
+    return f"{PARKING_API_URL}?{urlencode(query)}"
+
+
+def js_number(number: float) -> str:
+    """Format a number the way JavaScript does when converting it to a string."""
+    return str(int(number)) if float(number).is_integer() else str(number)
+
+
+def format_type(parking_type: str) -> str:
+    return PARKING_TYPES.get(parking_type, DEFAULT_PARKING_TYPE)
+
+
+def format_hours(hours: dict[str, str] | list[str]) -> str:
+    """Format the opening hours of a parking, e.g. "9:00-18:30".
+
+    The hours come in pairs of opening and closing times, a value without a pair
+    is left out. Without a single pair there are no hours to show.
+    """
+    values = list(hours.values()) if isinstance(hours, dict) else list(hours)
+    # Leading zeros are dropped, "09:00" becomes "9:00"
+    values = [value.removeprefix("0") for value in values]
+    return " ".join(
+        f"{values[index]}-{values[index + 1]}" for index in range(0, len(values) - 1, 2)
+    )
+
+
+def format_prices(prices: dict[str, Any]) -> str:
+    """Format the prices of a parking, e.g. "1.3 euro (1h) 2.6 euro (2h)"."""
+    formatted = ""
+    for minutes, price in prices.items():
+        if match := LEADING_INTEGER.match(minutes):
+            formatted += (
+                f" {js_number(price)} euro ({js_number(int(match.group()) / 60)}h)"
+            )
+    return formatted
+
+
+def format_max_stay(max_stay: float) -> str:
+    """Format the maximum duration of a stay given in minutes, e.g. "24h"."""
+    return (
+        f"{js_number(max_stay)}m" if max_stay < 60 else f"{js_number(max_stay / 60)}h"
+    )
+
+
+# The placeholders of the parking info section, in the order in which the widget
+# fills them in, together with the rule that each one is filled with.
+RULE_FORMATTERS = (
+    ("type", format_type),
+    ("hours", format_hours),
+    ("prices", format_prices),
+    ("maxStay", format_max_stay),
+)
+
+
+def fill_parking_info(
+    template: dict[str, list[str]], data: dict[str, Any]
+) -> dict[str, list[str]]:
+    """Fill the placeholders of the parking info section in with the data of its endpoint.
+
+    Does the same as the JavaScript of the widget on the business page.
+
+    :param template: The parking info as extracted from the plain HTML, where each
+        value is a placeholder such as "{0}".
+    :param data: The JSON returned by the endpoint.
+    :return: The parking info as it would be displayed on the rendered page.
+    """
+    rules = data.get("rules")
+    if not rules:
+        # The widget hides the section, so there is nothing to scrape
+        return {}
+    formatted = [
+        formatter(rules[rule]) if rules.get(rule) else ""
+        for rule, formatter in RULE_FORMATTERS
+    ]
+
+    def fill(match: re.Match[str]) -> str:
+        index = int(match.group()[1:-1])
+        return formatted[index] if index < len(formatted) else match.group()
+
+    parking_info = {}
+    for name, values in template.items():
+        filled = [PLACEHOLDER.sub(fill, value).strip() for value in values]
+        # The widget removes the entries whose rule is missing
+        if all(filled):
+            parking_info[name] = filled
+    return parking_info
@@ -3,10 +3,344 @@
 # Don't forget to add your pipeline to the ITEM_PIPELINES setting
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Self
 
 # useful for handling different item types with a single interface
+from itemadapter import ItemAdapter
+from scrapy import Spider
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.misc import load_object
+from scrapy.utils.project import data_path
+from twisted.internet import task
+from twisted.internet.defer import Deferred, DeferredList, maybeDeferred, succeed
+from twisted.python.failure import Failure
 
+from trustoo_crawler.database import BusinessDatabase, BusinessRows, business_rows
+from trustoo_crawler.extraction import FIELDS
+from trustoo_crawler.items import BusinessItem, BusinessRecord
+from trustoo_crawler.media import (
+    AssetFetcher,
+    AssetStore,
+    StoredAsset,
+    ThumbnailPool,
+    can_make_thumbnails,
+    make_thumbnails,
+)
+from trustoo_crawler.normalization import normalize_item
+from trustoo_crawler.pool import deferred_from_future
 
-class TrustooCrawlerPipeline:
-    def process_item(self, item, spider):
+logger = logging.getLogger(__name__)
+
+# Batches that may wait for the database before the items wait for them
+MAX_PENDING_BATCHES = 4
+
+
+class NormalizationPipeline:
+    """Item pipeline that adds structured versions of the free text fields of a business.
+
+    The phone number in E.164 format, the components of the address and the opening
+    hours as intervals of minutes in the week, see `normalize_item`. The scraped
+    fields are kept as they are. Disable it with `NORMALIZATION_ENABLED`.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        if not crawler.settings.getbool("NORMALIZATION_ENABLED", True):
+            raise NotConfigured
+        return cls()
+
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        if isinstance(item, BusinessItem | BusinessRecord):
+            normalize_item(item)
         return item
+
+
+class AssetPipeline:
+    """Item pipeline that downloads the logo and pictures of each business.
+
+    Enabled by the `MEDIA_STORE` setting, the directory of the `AssetStore`, e.g.
+    `scrapy crawl gouden_gids -s MEDIA_STORE=media`. The images are downloaded
+    `MEDIA_CONCURRENCY` at a time by an `AssetFetcher`, next to the pages instead
+    of in their queue. An item is passed on once its images are stored.
+
+    Every image is downloaded once: a URL that is stored already, from this crawl or
+    a previous one, isn't downloaded again and the items that share a URL which is
+    being downloaded wait for the same download. Images with the same content are
+    stored once. A thumbnail of each new image is made for each of the
+    `MEDIA_THUMBNAILS`, in `MEDIA_THUMBNAIL_POOL_SIZE` other processes.
+
+    The files of the images are set on the item, `logo_file` and `picture_files`,
+    relative to the store. An image that can't be downloaded is counted in
+    `media/failed` and doesn't hold its item back, its file is `None`. The items
+    other than businesses, e.g. the reviews, are passed on as they are.
+    """
+
+    def __init__(
+        self,
+        store: AssetStore,
+        fetcher: AssetFetcher,
+        stats: StatsCollector,
+        thumbnails: dict[str, tuple[int, int]] | None = None,
+        thumbnail_pool: ThumbnailPool | None = None,
+    ):
+        self.store = store
+        self.fetcher = fetcher
+        self.stats = stats
+        self.thumbnails = thumbnails or {}
+        self.thumbnail_pool = thumbnail_pool
+        # The items waiting for each URL that is being downloaded
+        self.waiting: dict[str, list[Deferred[StoredAsset | None]]] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not (path := settings.get("MEDIA_STORE")):
+            raise NotConfigured
+        thumbnails = {
+            name: (int(width), int(height))
+            for name, (width, height) in settings.getdict("MEDIA_THUMBNAILS").items()
+        }
+        if thumbnails and not can_make_thumbnails():
+            logger.warning(
+                "Making thumbnails requires pillow, install the 'images' extra"
+            )
+            thumbnails = {}
+        pool_size = settings.getint("MEDIA_THUMBNAIL_POOL_SIZE")
+        return cls(
+            AssetStore(Path(data_path(path, createdir=True))),
+            AssetFetcher(
+                settings.getint("MEDIA_CONCURRENCY"),
+                settings.getfloat("MEDIA_TIMEOUT"),
+                settings.get("USER_AGENT"),
+            ),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+            thumbnails,
+            ThumbnailPool(pool_size) if thumbnails and pool_size > 0 else None,
+        )
+
+    def close_spider(self, spider: Spider) -> Deferred:
+        self.store.close()
+        if self.thumbnail_pool is not None:
+            self.thumbnail_pool.close()
+        return self.fetcher.close()
+
+    def process_item(self, item: Any, spider: Spider) -> Deferred:
+        if not isinstance(item, BusinessItem | BusinessRecord):
+            return succeed(item)
+        adapter = ItemAdapter(item)
+        logo = adapter.get("logo")
+        pictures = adapter.get("pictures") or []
+        urls = [url for url in dict.fromkeys([logo, *pictures]) if url]
+        assets = DeferredList([self.asset(url) for url in urls])
+
+        def set_files(results: list[tuple[bool, StoredAsset | None]]) -> Any:
+            files = {
+                url: asset.file_name
+                for url, (_, asset) in zip(urls, results, strict=True)
+                if asset is not None
+            }
+            adapter["logo_file"] = files.get(logo) if logo else None
+            adapter["picture_files"] = [files.get(picture) for picture in pictures]
+            return item
+
+        return assets.addCallback(set_files)
+
+    def asset(self, url: str) -> Deferred[StoredAsset | None]:
+        """Store the image at a URL, unless it is stored already."""
+        if url.startswith("//"):
+            url = f"https:{url}"
+        if not url.startswith(("http://", "https://")):
+            self.stats.inc_value("media/invalid_url")
+            return succeed(None)
+        if (stored := self.store.get(url)) is not None:
+            self.stats.inc_value("media/stored_already")
+            return succeed(stored)
+        if (waiting := self.waiting.get(url)) is not None:
+            self.stats.inc_value("media/shared_download")
+            waiting.append(waiter := Deferred())
+            return waiter
+        self.waiting[url] = []
+        download: Deferred[StoredAsset | None] = (
+            self.fetcher.fetch(url)
+            .addCallback(self.downloaded, url)
+            .addErrback(self.failed, url)
+        )
+        return download.addCallback(self.release, url)
+
+    def downloaded(
+        self, result: tuple[bytes, str | None], url: str
+    ) -> Deferred[StoredAsset]:
+        body, content_type = result
+        self.stats.inc_value("media/downloaded")
+        self.stats.inc_value("media/downloaded_bytes", len(body))
+        asset, new = self.store.put(url, body, content_type)
+        if not new:
+            self.stats.inc_value("media/duplicate_content")
+        return self.make_thumbnails(asset).addCallback(lambda _: asset)
+
+    def make_thumbnails(self, asset: StoredAsset) -> Deferred:
+        """Make the thumbnails of an asset that are missing."""
+        targets = {
+            path: size
+            for name, size in self.thumbnails.items()
+            if not (path := self.store.thumbnail_path(asset, name)).exists()
+        }
+        if not targets:
+            return succeed(None)
+        source = self.store.file_path(asset)
+        thumbnails = (
+            maybeDeferred(make_thumbnails, source, targets)
+            if self.thumbnail_pool is None
+            else self.thumbnail_pool.make(source, targets)
+        )
+        return thumbnails.addCallbacks(
+            lambda count: self.stats.inc_value("media/thumbnails", count),
+            self.thumbnails_failed,
+            errbackArgs=(asset,),
+        )
+
+    def thumbnails_failed(self, failure: Failure, asset: StoredAsset) -> None:
+        # e.g. an SVG logo, which pillow can't read
+        self.stats.inc_value("media/thumbnails_failed")
+        logger.debug(
+            "Can't make thumbnails of %s: %s", asset.url, failure.getErrorMessage()
+        )
+
+    def failed(self, failure: Failure, url: str) -> None:
+        self.stats.inc_value("media/failed")
+        logger.warning("Can't download %s: %s", url, failure.getErrorMessage())
+
+    def release(self, asset: StoredAsset | None, url: str) -> StoredAsset | None:
+        """Pass an asset on to the items that waited for its download."""
+        for waiter in self.waiting.pop(url):
+            waiter.callback(asset)
+        return asset
+
+
+class DatabasePipeline:
+    """Item pipeline that writes the businesses to a database, in batches.
+
+    Enabled by the `DATABASE_PATH` setting, e.g.
+    `scrapy crawl gouden_gids -s DATABASE_PATH=businesses.sqlite`. The backend is
+    picked with `DATABASE_BACKEND`, see `BusinessDatabase`.
+
+    The items are buffered and upserted `DATABASE_BATCH_SIZE` at a time, or every
+    `DATABASE_FLUSH_INTERVAL` seconds, each batch in a single transaction. The
+    batches are written by a thread of their own, so the crawl never waits for the
+    database, unless more than `MAX_PENDING_BATCHES` batches are waiting to be
+    written. The items are then held back until the oldest batch is written, which
+    keeps the buffered items bounded.
+
+    When the spider scrapes only some of the fields, e.g. `-a fields=leads`, only
+    their columns are written. The rest of the businesses that are in the database
+    already is kept as it was.
+    """
+
+    def __init__(
+        self,
+        database: BusinessDatabase,
+        stats: StatsCollector,
+        batch_size: int = 1000,
+        flush_interval: float = 5,
+    ):
+        self.database = database
+        self.stats = stats
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # A single thread, so that the batches are written one at a time, in order
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="database")
+        self.buffer: list[BusinessRows] = []
+        # The fields that the spider scrapes, only their columns are written
+        self.fields = FIELDS
+        self.pending: deque[Deferred] = deque()  # The batches being written
+        self.flushes = task.LoopingCall(self.flush)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not settings.get("DATABASE_PATH"):
+            raise NotConfigured
+        backend = load_object(
+            settings.get(
+                "DATABASE_BACKEND", "trustoo_crawler.database.SQLiteBusinessDatabase"
+            )
+        )
+        return cls(
+            backend.from_settings(settings),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+            settings.getint("DATABASE_BATCH_SIZE", 1000),
+            settings.getfloat("DATABASE_FLUSH_INTERVAL", 5),
+        )
+
+    def open_spider(self, spider: Spider) -> None:
+        self.fields = getattr(spider, "selected_fields", FIELDS)
+        if self.flush_interval > 0:
+            self.flushes.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider: Spider) -> Deferred:
+        if self.flushes.running:
+            self.flushes.stop()
+        self.flush()
+        done = DeferredList(list(self.pending))
+        done.addCallback(lambda _: self.write_in_thread(self.database.close))
+        return done.addBoth(lambda _: self.executor.shutdown(wait=False))
+
+    def process_item(self, item: Any, spider: Spider) -> Any:
+        if not isinstance(item, BusinessItem | BusinessRecord):
+            # e.g. the reviews
+            return item
+        if (rows := business_rows(item, self.fields)) is None:
+            self.stats.inc_value("database/no_listing_id")
+            return item
+        self.buffer.append(rows)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        if len(self.pending) <= MAX_PENDING_BATCHES:
+            return item
+        # The database doesn't keep up
+        self.stats.inc_value("database/waited")
+        waiter = Deferred()
+        self.pending[0].addBoth(self.release, waiter, item)
+        return waiter
+
+    def flush(self) -> None:
+        """Write the buffered items, in the thread of the pipeline."""
+        if not self.buffer:
+            return
+        batch, self.buffer = self.buffer, []
+        written = self.write_in_thread(self.database.write, batch)
+        written.addCallbacks(
+            self.written,
+            self.failed,
+            callbackArgs=(len(batch),),
+            errbackArgs=(len(batch),),
+        )
+        self.pending.append(written)
+
+    def write_in_thread(self, function: Any, *args: Any) -> Deferred:
+        return deferred_from_future(self.executor.submit(function, *args))
+
+    def written(self, result: None, count: int) -> None:
+        self.pending.popleft()
+        self.stats.inc_value("database/written", count)
+        self.stats.inc_value("database/batches")
+
+    def failed(self, failure: Failure, count: int) -> None:
+        self.pending.popleft()
+        self.stats.inc_value("database/failed", count)
+        logger.error(
+            "Can't write %d businesses to the database: %s",
+            count,
+            failure.getErrorMessage(),
+        )
+
+    def release(self, result: Any, waiter: Deferred, item: Any) -> Any:
+        """Pass an item on once the batch it waited for is written."""
+        waiter.callback(item)
+        return result
@@ -0,0 +1,64 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Self
+
+from scrapy.settings import BaseSettings
+from twisted.internet.defer import Deferred
+
+from trustoo_crawler.extraction import FIELDS, extract_page
+
+
+def deferred_from_future(future: Future) -> Deferred:
+    """Return a Deferred that fires in the reactor thread once the future is done."""
+    # Imported here, as importing it installs the default reactor if none is yet
+    from twisted.internet import reactor
+
+    deferred = Deferred()
+
+    def resolve(future: Future) -> None:
+        if (exception := future.exception()) is not None:
+            deferred.errback(exception)
+        else:
+            deferred.callback(future.result())
+
+    # The future is done in a thread of the executor, not in the reactor thread
+    future.add_done_callback(
+        lambda future: reactor.callFromThread(resolve, future)  # pyright: ignore[reportAttributeAccessIssue]
+    )
+    return deferred
+
+
+class ParsePool:
+    """Pool of processes that extract business pages, so that the reactor stays free.
+
+    Scrapy calls the callbacks in the reactor thread, which can't download anything
+    while a page is being extracted. With a pool, the text of a page is sent to
+    another process and its fields come back as a Deferred, so the extraction of
+    several pages happens on several cores while the downloads go on.
+
+    Enabled with `PARSE_POOL_SIZE`, e.g. `scrapy crawl gouden_gids -s PARSE_POOL_SIZE=4`.
+
+    :param size: Number of processes.
+    """
+
+    def __init__(self, size: int):
+        # Forking a process with a running reactor and its threads is unsafe, so the
+        # processes start from scratch
+        self.executor = ProcessPoolExecutor(
+            size, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self | None:
+        """Create the pool configured by the settings, `None` if it is disabled."""
+        size = settings.getint("PARSE_POOL_SIZE")
+        return cls(size) if size > 0 else None
+
+    def extract(
+        self, text: str, fields: tuple[str, ...] = FIELDS
+    ) -> Deferred[tuple[dict[str, Any], Any]]:
+        """Extract the fields and parking info parameters of a page, see `extract_page`."""
+        return deferred_from_future(self.executor.submit(extract_page, text, fields))
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,114 @@
+-- Renders a page of Gouden Gids for `GoudenGidsSpider`, with as little work as possible.
+--
+-- Images, fonts, stylesheets and the requests to trackers are never loaded, since
+-- none of them change the data that is extracted. With `selectors`, only the
+-- elements that match them are returned instead of the whole page, which keeps
+-- both the response and the memory that Splash needs for it small.
+--
+-- Instead of waiting a fixed time for the scripts of the page, the render ends as
+-- soon as the elements of `wait_for` are populated, i.e. none of them contains a
+-- placeholder such as `{0}` anymore, or once the page stopped making requests.
+--
+-- Arguments:
+--   url: The page to render.
+--   max_wait: The longest to wait for the scripts of the page once it has loaded, in seconds.
+--   wait_for: Optional CSS selector of the elements that the scripts fill in.
+--   idle: Seconds without any request after which the page is considered done.
+--   selectors: Optional CSS selector of the elements to return.
+--   blocked: Substrings of the URLs of the requests to abort, e.g. trackers.
+--
+-- Next to the HTML, returns how long it waited (`waited`), why it stopped waiting
+-- (`ready`: "elements", "idle" or "timeout") and how long the whole render took
+-- (`elapsed`), for the stats of the crawl.
+
+local BLOCKED_EXTENSIONS = {
+  "%.woff2?$", "%.ttf$", "%.otf$", "%.eot$", "%.css$",
+  "%.png$", "%.jpe?g$", "%.gif$", "%.svg$", "%.webp$", "%.ico$",
+}
+-- Seconds between two checks of whether the page is ready
+local POLL_INTERVAL = 0.1
+
+local function is_blocked(url, blocked)
+  -- The query string doesn't tell what kind of resource it is
+  local path = string.lower(string.gsub(url, "[?#].*$", ""))
+  for _, pattern in ipairs(BLOCKED_EXTENSIONS) do
+    if string.find(path, pattern) then
+      return true
+    end
+  end
+  for _, part in ipairs(blocked) do
+    if string.find(url, part, 1, true) then
+      return true
+    end
+  end
+  return false
+end
+
+function main(splash, args)
+  local started = splash:get_perf_counter()
+  splash.images_enabled = false
+  splash.plugins_enabled = false
+  splash.resource_timeout = 10
+  local blocked = args.blocked or {}
+  local pending = 0  -- Requests that haven't been answered yet
+  local last_activity = started
+  splash:on_request(function(request)
+    if is_blocked(request.url, blocked) then
+      request:abort()
+      return
+    end
+    pending = pending + 1
+    last_activity = splash:get_perf_counter()
+  end)
+  splash:on_response(function(response)
+    pending = math.max(0, pending - 1)
+    last_activity = splash:get_perf_counter()
+  end)
+  local has_placeholders = splash:jsfunc([[
+    function (selectors) {
+      var elements = document.querySelectorAll(selectors);
+      for (var i = 0; i < elements.length; i++) {
+        if (/\{\d+\}/.test(elements[i].textContent)) {
+          return true;
+        }
+      }
+      return false;
+    }
+  ]])
+  assert(splash:go(args.url))
+
+  local waiting_since = splash:get_perf_counter()
+  local max_wait = args.max_wait or 3
+  local idle = args.idle or 0.5
+  local ready = "timeout"
+  while splash:get_perf_counter() - waiting_since < max_wait do
+    if args.wait_for and not has_placeholders(args.wait_for) then
+      ready = "elements"
+      break
+    end
+    if pending == 0 and splash:get_perf_counter() - last_activity >= idle then
+      ready = "idle"
+      break
+    end
+    splash:wait(POLL_INTERVAL)
+  end
+  local waited = splash:get_perf_counter() - waiting_since
+
+  local html
+  if args.selectors then
+    local fragments = {}
+    for _, element in ipairs(splash:select_all(args.selectors)) do
+      fragments[#fragments + 1] = element.node.outerHTML
+    end
+    html = "<html><body>" .. table.concat(fragments) .. "</body></html>"
+  else
+    html = splash:html()
+  end
+  return {
+    url = splash:url(),
+    html = html,
+    waited = waited,
+    ready = ready,
+    elapsed = splash:get_perf_counter() - started,
+  }
+end
@@ -0,0 +1,211 @@
+"""Extract the business pages in the HTTP cache again, without fetching anything.
+
+After fixing the extraction of a field, the items of a whole crawl can be rebuilt
+from the responses that `ContentAddressedCacheStorage` stored during the crawl, at
+the speed of the local CPUs. The pages are extracted in a pool of processes. Their
+dynamic sections are filled in from the cached parking info and renders, and the
+items are normalized, like the spider and its pipelines do.
+
+Run with e.g.
+`poetry run python -m trustoo_crawler.reparse -o results.csv`.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from itemadapter import ItemAdapter
+from parsel import Selector
+from scrapy.exporters import (
+    BaseItemExporter,
+    CsvItemExporter,
+    JsonItemExporter,
+    JsonLinesItemExporter,
+)
+from scrapy.utils.project import data_path, get_project_settings
+
+from trustoo_crawler.exporters import ParquetItemExporter
+from trustoo_crawler.extraction import (
+    BusinessPageExtractor,
+    extract_page,
+    to_item,
+    to_record,
+    unresolved_sections,
+)
+from trustoo_crawler.httpcache import CachedResponse, ResponseCache
+from trustoo_crawler.items import AnyBusinessItem, ItemModel
+from trustoo_crawler.normalization import normalize_item
+from trustoo_crawler.parking import fill_parking_info, parking_api_url
+from trustoo_crawler.utils import get_listing_id
+
+EXPORTERS: dict[str, Callable[[BinaryIO], BaseItemExporter]] = {
+    ".csv": CsvItemExporter,
+    ".json": JsonItemExporter,
+    ".jl": JsonLinesItemExporter,
+    ".jsonl": JsonLinesItemExporter,
+    ".parquet": ParquetItemExporter,
+}
+# Pages sent to a process of the pool at a time
+CHUNK_SIZE = 16
+
+
+def page_text(cache: ResponseCache, cached: CachedResponse) -> str | None:
+    """Return the HTML of a cached page, `None` if it isn't a whole page."""
+    body = cache.body(cached.digest)
+    if cached.render is None:
+        return body.decode("utf-8", errors="replace")
+    render = json.loads(cached.render)
+    if render["args"].get("selectors"):
+        # Only some elements of the page, see `resolve_dynamic_sections`
+        return None
+    try:
+        return json.loads(body)["html"]
+    except (ValueError, KeyError, TypeError):
+        # The render.html endpoint returns the page itself
+        return body.decode("utf-8", errors="replace")
+
+
+def business_pages(cache: ResponseCache) -> Iterator[tuple[str, str]]:
+    """Yield the URL and HTML of the most recent response of every business page."""
+    seen: set[str] = set()
+    for cached in cache.responses():
+        listing_id = get_listing_id(cached.url)
+        if listing_id is None or listing_id in seen or cached.status != 200:
+            continue
+        if (text := page_text(cache, cached)) is None:
+            continue
+        seen.add(listing_id)
+        yield cached.url, text
+
+
+def resolve_dynamic_sections(
+    cache: ResponseCache,
+    business_item: AnyBusinessItem,
+    url: str,
+    parking_info_parameters: dict[str, Any] | None,
+) -> None:
+    """Fill the dynamic sections of an item in with the cached responses, if any."""
+    adapter = ItemAdapter(business_item)
+    if (
+        "parking_info" in unresolved_sections(business_item)
+        and parking_info_parameters
+        and (parking_url := parking_api_url(parking_info_parameters))
+    ):
+        for cached in cache.find(parking_url):
+            try:
+                data = json.loads(cache.body(cached.digest))
+            except ValueError:
+                continue
+            adapter["parking_info"] = fill_parking_info(
+                adapter["parking_info"], data if isinstance(data, dict) else {}
+            )
+            break
+    if not (sections := unresolved_sections(business_item)):
+        return
+    for cached in cache.find(url, rendered=True):
+        try:
+            html = json.loads(cache.body(cached.digest))["html"]
+        except (ValueError, KeyError, TypeError):
+            continue
+        extractor = BusinessPageExtractor(Selector(text=html, type="html").root)
+        for section in sections:
+            adapter[section] = extractor.list_information(section)
+        return
+
+
+def reparse(
+    cache: ResponseCache,
+    item_model: ItemModel = ItemModel.ITEM,
+    processes: int | None = None,
+    normalize: bool = True,
+) -> Iterator[AnyBusinessItem]:
+    """Yield an item for every business page in a cache.
+
+    :param cache: The cache of the crawl.
+    :param item_model: The class to represent businesses with.
+    :param processes: Size of the pool that extracts the pages, all cores by default.
+    :param normalize: Whether to fill in the normalized fields, see `normalize_item`.
+    """
+    processes = processes or os.cpu_count() or 1
+    with ProcessPoolExecutor(
+        processes, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        # `map` submits everything at once, so the pages are read a batch at a time
+        for batch in itertools.batched(
+            business_pages(cache), processes * CHUNK_SIZE * 4
+        ):
+            urls, texts = zip(*batch, strict=True)
+            results = executor.map(extract_page, texts, chunksize=CHUNK_SIZE)
+            for url, (fields, parking_info_parameters) in zip(
+                urls, results, strict=True
+            ):
+                business_item = (
+                    to_record(fields)
+                    if item_model is ItemModel.RECORD
+                    else to_item(fields)
+                )
+                ItemAdapter(business_item)["listing_id"] = get_listing_id(url)
+                resolve_dynamic_sections(
+                    cache, business_item, url, parking_info_parameters
+                )
+                if normalize:
+                    normalize_item(business_item)
+                yield business_item
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--cache",
+        default=None,
+        help="Directory of the cache of the spider, "
+        "`HTTPCACHE_DIR/gouden_gids` of the project by default",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=os.cpu_count() or 1, help="Size of the pool"
+    )
+    parser.add_argument(
+        "--item-model",
+        default=ItemModel.ITEM,
+        choices=list(ItemModel),
+        help="The class to represent businesses with",
+    )
+    parser.add_argument("-o", "--output", default="results.csv", help="Output file")
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    cache_path = (
+        Path(args.cache)
+        if args.cache
+        else Path(data_path(settings["HTTPCACHE_DIR"])) / "gouden_gids"
+    )
+    if not (cache_path / "index.sqlite").exists():
+        parser.error(f"There is no HTTP cache in {cache_path}")
+    output = Path(args.output)
+    if (exporter_class := EXPORTERS.get(output.suffix)) is None:
+        parser.error(f"Can't export to {output.suffix} files")
+    cache = ResponseCache(cache_path)
+    with output.open("wb") as file:
+        exporter = exporter_class(file)
+        exporter.start_exporting()
+        for business_item in reparse(
+            cache,
+            ItemModel(args.item_model),
+            args.processes,
+            normalize=settings.getbool("NORMALIZATION_ENABLED", True),
+        ):
+            exporter.export_item(business_item)
+        exporter.finish_exporting()
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
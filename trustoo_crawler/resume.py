@@ -0,0 +1,229 @@
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any, Self
+
+from itemadapter import ItemAdapter
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.settings import BaseSettings
+from scrapy.statscollectors import StatsCollector
+from scrapy.utils.job import job_dir
+
+from trustoo_crawler.dupefilters import ListingIndex
+from trustoo_crawler.items import BusinessItem, BusinessRecord
+
+# Number of search pages that are buffered before they are written to the journal
+DEFAULT_BATCH_SIZE = 20
+# The feed formats that can be appended to when a crawl is resumed
+APPENDABLE_FORMATS = {"csv", "jsonlines", "jl"}
+
+
+class SearchPageJournal:
+    """Append-only log of the search pages that were crawled completely.
+
+    Each line holds a category and a page number, separated by a tab. The pages are
+    buffered and written in batches, so keeping the journal costs next to nothing. A
+    crash loses at most the last batch, whose pages are then simply crawled again.
+
+    :param path: File to keep the journal in. Its existing pages are read back.
+    :param batch_size: Number of pages to buffer before writing them.
+    """
+
+    def __init__(self, path: Path, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.done: defaultdict[str, set[int]] = defaultdict(set)
+        if path.exists():
+            for line in path.read_text(encoding="utf-8").splitlines():
+                category, _, page_number = line.partition("\t")
+                # The last line may be incomplete if the process was killed
+                if page_number.isdigit():
+                    self.done[category].add(int(page_number))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = path.open("a", encoding="utf-8")
+        self.buffer: list[str] = []
+
+    def add(self, category: str, page_number: int) -> None:
+        self.done[category].add(page_number)
+        self.buffer.append(f"{category}\t{page_number}\n")
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def is_done(self, category: str, page_number: int) -> bool:
+        return page_number in self.done.get(category, ())
+
+    def remaining(self, category: str, max_page: int | None = None) -> list[int]:
+        """Return the pages to carry on crawling a category from.
+
+        These are the pages that weren't crawled before the last one that was, plus
+        the one after it, from which the rest of the pages are discovered.
+        """
+        if not (done := self.done.get(category)):
+            return [1]
+        last = max(done)
+        pages = [page for page in range(1, last + 2) if page not in done]
+        return [page for page in pages if max_page is None or page <= max_page]
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.file.flush()
+            self.buffer.clear()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class ResumeMiddleware:
+    """Spider middleware that lets a crawl with a `JOBDIR` carry on where it stopped.
+
+    Scrapy already keeps the queue of the scheduler and the fingerprints of the
+    requests in the job directory. On top of that this middleware keeps:
+
+    - a `SearchPageJournal` of the search pages that are done. A resumed crawl
+      starts each category from the pages that are left, instead of the first one.
+      Search pages are deduplicated per run by this middleware rather than by the
+      fingerprints, so that the pages that were still held back or being downloaded
+      when the crawl stopped are requested again.
+    - a `ListingIndex` of the businesses that were exported, so that a business
+      that was being scraped when the crawl stopped isn't written twice.
+
+    The search pages are recognized by the `category` and `page_number` of their
+    `cb_kwargs` and requested again with the spider's `search_page_request`.
+    Enabled whenever `JOBDIR` is set.
+    """
+
+    def __init__(
+        self,
+        journal: SearchPageJournal,
+        exported: ListingIndex,
+        stats: StatsCollector,
+    ):
+        self.journal = journal
+        self.exported = exported
+        self.stats = stats
+        # The search pages that were requested during this run
+        self.requested: set[tuple[str, int]] = set()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not (directory := job_dir(settings)):
+            raise NotConfigured
+        middleware = cls(
+            SearchPageJournal(
+                Path(directory) / "search_pages.journal",
+                settings.getint("RESUME_JOURNAL_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+            ),
+            ListingIndex(
+                capacity=settings.getint("LISTING_INDEX_CAPACITY", 10_000_000),
+                error_rate=settings.getfloat("LISTING_INDEX_ERROR_RATE", 1e-6),
+                path=Path(directory) / "exported.index",
+            ),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+        )
+        crawler.signals.connect(middleware.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def process_start_requests(
+        self, start_requests: Iterable[Request], spider: Spider
+    ) -> Iterator[Request]:
+        categories = getattr(spider, "categories", {})
+        for request in start_requests:
+            if (page := search_page(request)) is None:
+                yield request
+                continue
+            category, _ = page
+            remaining = self.journal.remaining(category, categories.get(category))
+            if remaining == [1]:
+                yield from self.request_search_page(request)
+                continue
+            self.stats.inc_value("resume/categories", spider=spider)
+            for page_number in remaining:
+                yield from self.request_search_page(
+                    spider.search_page_request(category, page_number)  # pyright: ignore[reportAttributeAccessIssue]
+                )
+
+    def process_spider_output(
+        self, response: Response, result: Iterable[Any], spider: Spider
+    ) -> Iterator[Any]:
+        for element in result:
+            if isinstance(element, Request):
+                if search_page(element) is None:
+                    yield element
+                else:
+                    yield from self.request_search_page(element)
+                continue
+            # The reviews share the listing ID of their business
+            listing_id = (
+                ItemAdapter(element).get("listing_id")
+                if isinstance(element, BusinessItem | BusinessRecord)
+                else None
+            )
+            if listing_id and listing_id in self.exported:
+                self.stats.inc_value("resume/duplicate_items", spider=spider)
+                continue
+            yield element
+        # Only once all of its businesses are scheduled is a search page done
+        if (page := search_page(response.request)) is not None:
+            self.journal.add(*page)
+
+    def request_search_page(self, request: Request) -> Iterator[Request]:
+        page = search_page(request)
+        if page is None or page in self.requested or self.journal.is_done(*page):
+            return
+        self.requested.add(page)
+        # The fingerprints of the previous run include the pages that were lost
+        yield request.replace(dont_filter=True)
+
+    def item_scraped(self, item: Any, spider: Spider) -> None:
+        if not isinstance(item, BusinessItem | BusinessRecord):
+            return
+        if listing_id := ItemAdapter(item).get("listing_id"):
+            self.exported.add(listing_id)
+
+    def spider_closed(self, spider: Spider) -> None:
+        self.journal.close()
+        self.exported.close()
+
+
+def search_page(request: Request | None) -> tuple[str, int] | None:
+    """Return the category and page number of a request of a search page."""
+    if request is None:
+        return None
+    category = request.cb_kwargs.get("category")
+    page_number = request.cb_kwargs.get("page_number")
+    if category is None or page_number is None:
+        return None
+    return category, page_number
+
+
+def resume_feeds(settings: BaseSettings) -> None:
+    """Append to the feeds of a resumed crawl, instead of overwriting them.
+
+    Only the line based formats can be appended to. The feeds in other formats are
+    left as they are, so they only contain the items of the last run.
+    """
+    if (
+        not (directory := job_dir(settings))
+        or not (Path(directory) / "search_pages.journal").exists()
+    ):
+        return
+    feeds = {}
+    for uri, options in settings.getdict("FEEDS").items():
+        options = dict(options)
+        if options.get("format") in APPENDABLE_FORMATS:
+            options["overwrite"] = False
+        if options.get("format") == "csv":
+            # The header is already in the file
+            options["item_export_kwargs"] = {
+                **options.get("item_export_kwargs", {}),
+                "include_headers_line": False,
+            }
+        feeds[uri] = options
+    settings.set("FEEDS", feeds, priority=settings.getpriority("FEEDS") or 0)
@@ -0,0 +1,115 @@
+import hashlib
+from collections.abc import Iterator
+from pathlib import PurePosixPath
+
+from lxml.etree import XPath
+from lxml.html import HtmlElement
+from scrapy.settings import BaseSettings
+from scrapy.utils.misc import load_object
+
+from trustoo_crawler.extraction import normalize_space, parse_rating, string_value
+from trustoo_crawler.items import BusinessItem, BusinessRecord, ReviewItem
+
+# The reviews are all on the business page, newest first, in the lists of the tabs
+# of `.tabs-navigation` (`Detail.switchReviews` of `detail.min.js`). "Load more"
+# (`Detail.showReviews`) only shows the reviews that are hidden, it doesn't fetch any.
+REVIEWS = XPath(
+    "//*[contains(concat(' ', normalize-space(@class), ' '), ' tabs ')]"
+    "/*/li[contains(concat(' ', normalize-space(@class), ' '), ' review ')]",
+    smart_strings=False,
+)
+# The attributes that hold the machine-readable value of a microdata property of a
+# review, if any. The business page marks up the business with microdata as well.
+VALUE_ATTRIBUTES = ("content", "datetime")
+# The feed format of each extension of `REVIEWS_FEED`, CSV otherwise
+FEED_FORMATS = {".jl": "jsonlines", ".jsonl": "jsonlines", ".json": "json"}
+
+
+def route_review_feeds(settings: BaseSettings) -> None:
+    """Keep the reviews out of the feeds of the businesses.
+
+    A feed without `item_classes`, e.g. the one of `-O results.parquet`, would take
+    the reviews as well, under the columns of the businesses. Such feeds only take
+    the businesses, and when the reviews are scraped without any feed taking them,
+    they are written to the feed of `REVIEWS_FEED`.
+    """
+    feeds = {}
+    reviews_taken = False
+    for uri, options in settings.getdict("FEEDS").items():
+        options = dict(options)
+        options.setdefault("item_classes", [BusinessItem, BusinessRecord])
+        reviews_taken = reviews_taken or any(
+            load_object(item_class) is ReviewItem
+            for item_class in options["item_classes"]
+        )
+        feeds[uri] = options
+    reviews_feed = settings.get("REVIEWS_FEED")
+    if (
+        feeds
+        and reviews_feed
+        and not reviews_taken
+        and settings.getbool("REVIEWS_ENABLED")
+    ):
+        feeds[reviews_feed] = {
+            "format": FEED_FORMATS.get(PurePosixPath(reviews_feed).suffix, "csv"),
+            "overwrite": True,
+            "item_classes": [ReviewItem],
+        }
+    settings.set("FEEDS", feeds, priority=settings.getpriority("FEEDS") or 0)
+
+
+def item_property(element: HtmlElement, name: str) -> str:
+    """Return the normalized value of the first microdata property of an element."""
+    for descendant in element.iterdescendants():
+        if descendant.get("itemprop") != name:
+            continue
+        for attribute in VALUE_ATTRIBUTES:
+            if (value := descendant.get(attribute)) is not None:
+                return normalize_space(value)
+        return normalize_space(string_value(descendant))
+    return ""
+
+
+def review_id(review: HtmlElement, author: str, date: str, text: str) -> str:
+    """Return the ID of a review.
+
+    Reviews that don't have an ID of their own get a hash of their content, which
+    stays the same from one crawl to the next as long as the review isn't edited.
+    """
+    if identifier := review.get("data-id"):
+        return identifier
+    content = "\n".join((author, date, text)).encode()
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
+def extract_reviews(
+    root: HtmlElement, listing_id: str, newest_review_id: str | None = None
+) -> Iterator[ReviewItem]:
+    """Yield the reviews of a business page, in the order of the page.
+
+    A review that is listed in several tabs is only yielded once.
+
+    :param root: Root of the parsed page, e.g. `response.selector.root`.
+    :param listing_id: The listing ID of the business that the reviews are about.
+    :param newest_review_id: The newest review of the previous crawl, if any. The
+        reviews from this one on were yielded by that crawl, so they are left out.
+    """
+    seen = set()
+    for review in REVIEWS(root):
+        author = item_property(review, "author")
+        date = item_property(review, "datePublished")
+        text = item_property(review, "reviewBody")
+        identifier = review_id(review, author, date, text)
+        if identifier == newest_review_id:
+            return
+        if identifier in seen:
+            continue
+        seen.add(identifier)
+        yield ReviewItem(
+            listing_id=listing_id,
+            review_id=identifier,
+            author=author,
+            rating=parse_rating(item_property(review, "ratingValue")),
+            date=date,
+            text=text,
+        )
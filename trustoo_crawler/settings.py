@@ -13,12 +13,52 @@ SPIDER_MODULES = ["trustoo_crawler.spiders"]
 NEWSPIDER_MODULE = "trustoo_crawler.spiders"
 
 SPLASH_URL = "http://localhost:8050"  # The url at which scrapy can find Splash
+# Spread the renders over several Splash instances instead, see `SplashPoolMiddleware`,
+# e.g. the ones of `docker-compose.yaml`:
+# `-s SPLASH_URLS=http://localhost:8050,http://localhost:8051`
+SPLASH_URLS = []
+# Failures in a row after which an instance is left out until it is healthy again
+SPLASH_POOL_MAX_FAILURES = 3
+# Seconds between the health checks of the instances, 0 to disable them
+SPLASH_POOL_HEALTH_CHECK_INTERVAL = 30
+# Renders that each Splash instance runs at the same time, its `--slots` option.
+# Only used for the slot utilization in the stats.
+SPLASH_SLOTS = 5
 
 # Write to a csv file upon running a spider by default
-FEEDS = {"results.csv": {"format": "csv", "overwrite": True}}
-
-# set the Splash deduplication class
-DUPEFILTER_CLASS = "scrapy_splash.SplashAwareDupeFilter"
+FEEDS = {
+    "results.csv": {
+        "format": "csv",
+        "overwrite": True,
+        "item_classes": [
+            "trustoo_crawler.items.BusinessItem",
+            "trustoo_crawler.items.BusinessRecord",
+        ],
+    },
+}
+# The reviews go to a file of their own, next to any feed of the businesses (e.g.
+# the one of `-O`), see `route_review_feeds`
+REVIEWS_FEED = "reviews.csv"
+# Scrape the reviews on the business pages, see `GoudenGidsSpider.business_reviews`.
+# Off by default: none of the saved business pages has reviews, so the markup of
+# a review (`trustoo_crawler/reviews.py`) may not match the website.
+REVIEWS_ENABLED = False
+# Parquet keeps the nested fields as they are, e.g. `-O results.parquet`.
+# Requires the "parquet" extra.
+FEED_EXPORTERS = {"parquet": "trustoo_crawler.exporters.ParquetItemExporter"}
+
+# Set the deduplication class. It is aware of Splash and fetches each business only
+# once per crawl, even if it is listed in several categories.
+DUPEFILTER_CLASS = "trustoo_crawler.dupefilters.ListingDupeFilter"
+# The listing IDs are kept in a Bloom filter, sized for this many businesses
+LISTING_INDEX_CAPACITY = 10_000_000
+LISTING_INDEX_ERROR_RATE = 1e-6
+# Remember the listings between crawls in this SQLite database, to only fetch the
+# business pages that may have changed and to only output the new or changed items.
+# Disabled when not set, e.g. enable it with `-s LISTING_STATE_PATH=state.sqlite`
+LISTING_STATE_PATH = None
+# Don't fetch the business pages that were fetched less than this many seconds ago
+LISTING_STATE_MAX_AGE = 0
 
 # Crawl responsibly by identifying yourself (and your website) on the user-agent
 # USER_AGENT = "Mozilla"
@@ -32,6 +72,7 @@ ROBOTSTXT_OBEY = False  # Gouden Gids doesn't want us to scrape it.
 # Configure a delay for requests for the same website (default: 0)
 # See https://docs.scrapy.org/en/latest/topics/settings.html#download-delay
 # See also autothrottle settings and docs
+# Only used when the adaptive throttle below is disabled
 DOWNLOAD_DELAY = 3  # No need to go fast for now, better lay low
 # The download delay setting will honor only one of:
 # CONCURRENT_REQUESTS_PER_DOMAIN = 16
@@ -52,20 +93,77 @@ COOKIES_ENABLED = False
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 SPIDER_MIDDLEWARES = {
-    # "trustoo_crawler.middlewares.TrustooCrawlerSpiderMiddleware": 543,
+    # Closest to the spider, to time its callbacks alone
+    "trustoo_crawler.instrumentation.InstrumentationMiddleware": 950,
     "scrapy_splash.SplashDeduplicateArgsMiddleware": 100,
+    "trustoo_crawler.middlewares.ListingStateSpiderMiddleware": 900,
+    # Keeps track of the search pages that are done, when the crawl has a `JOBDIR`
+    "trustoo_crawler.resume.ResumeMiddleware": 800,
+    # Close to the engine, to hold back the requests that all others let through
+    "trustoo_crawler.backpressure.BackpressureMiddleware": 50,
 }
+# Hold the search pages back until fewer requests than this are queued or being
+# downloaded, 0 to schedule them right away. See `BackpressureMiddleware`.
+BACKPRESSURE_WATERMARK = 100
+# How many of the held search pages may be pending at the same time
+BACKPRESSURE_IN_FLIGHT = 2
+# Time the stages of the crawl in histograms, see `InstrumentationMiddleware`.
+# They are published in the stats (`timing/*`) every `INSTRUMENTATION_INTERVAL`
+# seconds, written to the JSON file `INSTRUMENTATION_SNAPSHOT_PATH` if set and
+# served to Prometheus at `http://127.0.0.1:<INSTRUMENTATION_PORT>/metrics` if set.
+INSTRUMENTATION_ENABLED = True
+INSTRUMENTATION_INTERVAL = 60
+INSTRUMENTATION_SNAPSHOT_PATH = None
+INSTRUMENTATION_PORT = None
+# Extract the business pages in this many other processes, 0 to extract them in the
+# reactor thread. See `ParsePool`.
+PARSE_POOL_SIZE = 0
+
+# Several workers can share their queue and deduplication, see `FrontierScheduler`
+# and `python -m trustoo_crawler.workers`. Enabled per worker with
+# `SCHEDULER = "trustoo_crawler.frontier.FrontierScheduler"`.
+FRONTIER_BACKEND = "trustoo_crawler.frontier.SQLiteFrontier"
+FRONTIER_PATH = "frontier.sqlite"
+# Seconds without a heartbeat after which the requests of a worker are taken over
+FRONTIER_WORKER_TIMEOUT = 60
+
+# A crawl with a `JOBDIR` can be stopped and resumed, see `ResumeMiddleware`,
+# e.g. `scrapy crawl gouden_gids -s JOBDIR=crawls/gouden_gids`.
+# The done search pages are written to its journal in batches of this size.
+RESUME_JOURNAL_BATCH_SIZE = 20
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 # Specify Splash middlewares
 DOWNLOADER_MIDDLEWARES = {
+    # Before Splash rewrites the requests, so that it sees the URL of the page
+    "trustoo_crawler.middlewares.ListingStateMiddleware": 700,
+    # Publishes how the renders used Splash, see `SplashStatsMiddleware`
+    "trustoo_crawler.splash.SplashStatsMiddleware": 722,
     "scrapy_splash.SplashCookiesMiddleware": 723,
+    # Chooses the Splash instance of each render, when there are several
+    "trustoo_crawler.splash.SplashPoolMiddleware": 724,
     "scrapy_splash.SplashMiddleware": 725,
     "scrapy.downloadermiddlewares.httpcompression.HttpCompressionMiddleware": 810,
     "scrapy.downloadermiddlewares.useragent.UserAgentMiddleware": None,
     "scrapy_user_agents.middlewares.RandomUserAgentMiddleware": 400,
+    # Close to the downloader, to see the responses before they are retried
+    "trustoo_crawler.throttle.AdaptiveThrottleMiddleware": 950,
 }
+# Adapt the rate of each download slot to how the server copes, instead of waiting
+# `DOWNLOAD_DELAY` seconds between all requests. See `AdaptiveThrottleMiddleware`.
+ADAPTIVE_THROTTLE_ENABLED = True
+ADAPTIVE_THROTTLE_START_DELAY = 3  # The slots start as slow as the fixed delay did
+ADAPTIVE_THROTTLE_MIN_DELAY = 0.25
+ADAPTIVE_THROTTLE_MAX_DELAY = 60
+ADAPTIVE_THROTTLE_MAX_CONCURRENCY = 8
+ADAPTIVE_THROTTLE_TARGET_LATENCY = 2  # Seconds
+# Budgets of specific slots. Rendering takes a while, even when Splash is healthy.
+ADAPTIVE_THROTTLE_SLOTS = {"__splash__": {"target_latency": 8, "max_concurrency": 4}}
+# Send all renders through a single slot, so that Splash has a budget of its own.
+# With a pool of instances, each of them gets a slot with this budget instead.
+SPLASH_SLOT_POLICY = "single_slot"
+
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
 # EXTENSIONS = {
@@ -74,9 +172,38 @@ DOWNLOADER_MIDDLEWARES = {
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
-# ITEM_PIPELINES = {
-#    "trustoo_crawler.pipelines.TrustooCrawlerPipeline": 300,
-# }
+ITEM_PIPELINES = {
+    # Parses the phone number, address and opening hours of the businesses
+    "trustoo_crawler.pipelines.NormalizationPipeline": 100,
+    # Downloads the logos and pictures of the businesses
+    "trustoo_crawler.pipelines.AssetPipeline": 300,
+    # Last, to write the items as the other pipelines left them
+    "trustoo_crawler.pipelines.DatabasePipeline": 800,
+}
+# Add the normalized phone number, address and opening hours to the businesses,
+# see `normalize_item`
+NORMALIZATION_ENABLED = True
+# Store the logos and pictures in this directory, see `AssetPipeline`.
+# Disabled when not set, e.g. enable it with `-s MEDIA_STORE=media`.
+MEDIA_STORE = None
+# Images downloaded at the same time, on connections of their own
+MEDIA_CONCURRENCY = 8
+MEDIA_TIMEOUT = 30  # Seconds
+# The thumbnails made of each image, by name, with the width and height that they
+# fit in. Requires the "images" extra.
+MEDIA_THUMBNAILS = {"small": (120, 120), "medium": (400, 400)}
+# Make the thumbnails in this many other processes, 0 to make them in the reactor
+# thread
+MEDIA_THUMBNAIL_POOL_SIZE = 2
+# Write the businesses to this database as well, see `DatabasePipeline`.
+# Disabled when not set, e.g. enable it with `-s DATABASE_PATH=businesses.sqlite`.
+DATABASE_PATH = None
+# Another backend can be plugged in, see `BusinessDatabase`
+DATABASE_BACKEND = "trustoo_crawler.database.SQLiteBusinessDatabase"
+# Businesses written in a single transaction
+DATABASE_BATCH_SIZE = 1000
+# Seconds after which the businesses are written even if the batch isn't full
+DATABASE_FLUSH_INTERVAL = 5
 
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
@@ -93,11 +220,17 @@ DOWNLOADER_MIDDLEWARES = {
 
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
+# Caches the renders of Splash too. The business pages in the cache can be extracted
+# again with `python -m trustoo_crawler.reparse`.
 # HTTPCACHE_ENABLED = True
 # HTTPCACHE_EXPIRATION_SECS = 0
 # HTTPCACHE_DIR = "httpcache"
 # HTTPCACHE_IGNORE_HTTP_CODES = []
-# HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
+HTTPCACHE_STORAGE = "trustoo_crawler.httpcache.ContentAddressedCacheStorage"
+# Evict the least recently used responses beyond this many bytes, 0 to keep them all
+HTTPCACHE_MAX_SIZE = 0
+# "zstd" (requires the "zstd" extra) or "gzip", the best available by default
+HTTPCACHE_COMPRESSION = None
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
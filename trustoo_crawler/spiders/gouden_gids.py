@@ -1,20 +1,63 @@
+import re
+import time
 from collections.abc import Iterator
-from enum import StrEnum
-from typing import Any
+from enum import IntEnum, StrEnum
+from pathlib import Path
+from typing import Any, Self
 
+from itemadapter import ItemAdapter
+from lxml.etree import XPath
 from scrapy import Request, Spider
-from scrapy.http import HtmlResponse
+from scrapy.crawler import Crawler
+from scrapy.http import HtmlResponse, TextResponse
+from scrapy.settings import BaseSettings
+from scrapy.utils.defer import maybe_deferred_to_future
 from scrapy_splash import SplashRequest
+from twisted.python.failure import Failure
 
-from trustoo_crawler.items import BusinessItem, WorkingTimeItem
-from trustoo_crawler.utils import DutchWeekDay
+from trustoo_crawler.categories import (
+    load_categories,
+    parse_categories,
+    parse_max_page,
+)
+from trustoo_crawler.extraction import (
+    DYNAMIC_SECTIONS,
+    FIELDS,
+    BusinessPageExtractor,
+    parse_rating,
+    parse_review_count,
+    select_fields,
+    to_item,
+    to_record,
+    unresolved_sections,
+)
+from trustoo_crawler.instrumentation import Timings
+from trustoo_crawler.items import (
+    AnyBusinessItem,
+    BusinessItem,
+    ItemModel,
+    ReviewItem,
+    WorkingTimeItem,
+)
+from trustoo_crawler.parking import fill_parking_info, parking_api_url
+from trustoo_crawler.pool import ParsePool
+from trustoo_crawler.resume import resume_feeds
+from trustoo_crawler.reviews import extract_reviews, route_review_feeds
+from trustoo_crawler.splash import render_args
+from trustoo_crawler.state import ListingState
+from trustoo_crawler.utils import DutchWeekDay, get_listing_id
 
 # Store some usefule URLs in constants
 BASE_URL = "https://www.goudengids.nl"  # The base of the later generated urls
 # The URLs below are parametrized to allow the spider to crawl any category in Gouden gids
 # Fortunately all categories share the same structure
-START_URL = "https://www.goudengids.nl/nl/bedrijven/{category}/"  # The "starting" page for each category
 PAGE_URL = "https://www.goudengids.nl/nl/zoeken/{category}/"  # The url shared by all pages of results for categories
+# Matches the URL of a page of search results, as found in the pagination links
+SEARCH_PAGE_URL = re.compile(r"/nl/zoeken/(?P<category>[^/]+)/(?P<page_number>\d+)/")
+# How many pages ahead of the current one the pagination links may be followed.
+# The links only show a few pages around the current one anyway, so the search pages
+# are requested a few at a time, as the crawl progresses.
+PAGE_LOOKAHEAD = 5
 # I have (over)used the construction below, so it made sense to parametrize it and
 # store it in a constant
 # As of writing this comment, I have no more time left to change things up and
@@ -26,6 +69,36 @@ XPATH_CONTAINS = (  # Find element that has a certain attribute of specific valu
 )
 # The task called for lawyers, so they are the default category
 DEFAULT_CATEGORY = "advocaten"
+# The longest Splash waits for the JavaScript of a business page to fill the
+# dynamic sections in. Usually they are filled in after a fraction of a second.
+RENDER_MAX_WAIT = 10
+# The elements of the dynamic sections. A render waits for their placeholders to be
+# filled in and, when it completes an item, returns nothing else.
+DYNAMIC_SECTION_SELECTORS = "#parking-info, #economic-data"
+
+
+class RenderMode(StrEnum):
+    """When to render business pages with Splash."""
+
+    ALWAYS = "always"  # Render every business page
+    # Fetch business pages as plain HTML and resolve the dynamic sections that are
+    # still unresolved in the HTML, by requesting their data directly where
+    # possible and by rendering the page otherwise
+    AUTO = "auto"
+    NEVER = "never"  # Extract everything from the plain HTML
+
+
+class RequestPriority(IntEnum):
+    """The priority of the requests of each callback, higher is downloaded first.
+
+    The requests that complete an item in progress come first, then the business
+    pages and only then the next search pages. This way the queue drains towards
+    items, instead of filling up with the business pages of ever more search pages.
+    """
+
+    SEARCH_PAGE = -10  # `parse_page`
+    BUSINESS_PAGE = 0  # `parse_business_page` and `parse_business_page_in_pool`
+    DYNAMIC_SECTION = 10  # `parse_parking_info` and `parse_rendered_business_page`
 
 
 class GoudenGidsXPaths(StrEnum):
@@ -66,9 +139,8 @@ class GoudenGidsXPaths(StrEnum):
         f"//{XPATH_CONTAINS.format(element="div", attr="h3", val="Openingsuren")}"
         f"//{XPATH_CONTAINS.format(element="div", attr="div/text()", val="{day}")}"
     )
-    # Find the number of pages of results
-    # TODO(Ivan Yordanov): Move away from absolute address
-    MAX_PAGE = "/html/body/main/div/div/div[2]/div[1]/div[2]/div[2]/ul/li[8]/a/text()"
+    # The links towards other pages of search results, e.g. the next page
+    PAGINATION = "//a[contains(@href, '/nl/zoeken/')]/@href"
     LISTING = f"//{XPATH_CONTAINS.format(element="li", attr="@itemtype", val="http://schema.org/LocalBusiness")}/@data-href"
     # The folowing 3 XPaths work great on the HTML responses I downloaded for unit testing,
     # but since the parking info is generated dynamically using JS and seety.nl, scrapy
@@ -104,6 +176,52 @@ class GoudenGidsXPaths(StrEnum):
         f"//{XPATH_CONTAINS.format(element="img", attr="@class", val="gallery__item")}"
         "/@src"
     )
+    # The average rating of the business and its number of reviews
+    RATING = f"//{XPATH_CONTAINS.format(element="div", attr="@id", val="profile")}/@data-rating-avg"
+    REVIEW_COUNT = f"//{XPATH_CONTAINS.format(element="div", attr="@id", val="profile")}/@data-rating-cnt"
+
+
+def compile_xpath(xpath: str) -> XPath:
+    """Compile an XPath into an object that can be evaluated on lxml elements."""
+    # "Smart" strings keep a reference to the element they came from, which would
+    # keep the whole parsed page in memory for as long as a scraped value is alive.
+    return XPath(xpath, smart_strings=False)
+
+
+# Scrapy (or rather parsel) parses the XPath string on every `response.xpath(...)` call.
+# Instead, all of them are compiled just once, at import.
+COMPILED_XPATHS: dict[str, XPath] = {
+    xpath: compile_xpath(xpath) for xpath in GoudenGidsXPaths
+}
+# The `normalize-space(...)` variants, used to get a single clean text
+COMPILED_TEXT_XPATHS: dict[str, XPath] = {
+    xpath: compile_xpath(f"normalize-space({xpath})") for xpath in GoudenGidsXPaths
+}
+# `GoudenGidsXPaths.WORKING_DAY` is parametrized, so it is compiled once per day
+COMPILED_WORKING_DAY_XPATHS: dict[DutchWeekDay, XPath] = {
+    day: compile_xpath(
+        f"normalize-space({GoudenGidsXPaths.WORKING_DAY.format(day=day)})"
+    )
+    for day in DutchWeekDay
+}
+
+
+def get_compiled_xpath(xpath: str, *, normalize: bool = False) -> XPath:
+    """Return the compiled version of an XPath.
+
+    XPaths that are not in the registry yet are compiled and added to it, so that
+    each XPath is compiled only once.
+
+    :param xpath: XPath to look up, usually a member of `GoudenGidsXPaths`.
+    :param normalize: Whether to return the `normalize-space(...)` variant.
+    :return: The compiled XPath.
+    """
+    registry = COMPILED_TEXT_XPATHS if normalize else COMPILED_XPATHS
+    if (compiled := registry.get(xpath)) is None:
+        compiled = registry[xpath] = compile_xpath(
+            f"normalize-space({xpath})" if normalize else xpath
+        )
+    return compiled
 
 
 class GoudenGidsSpider(Spider):
@@ -111,77 +229,385 @@ class GoudenGidsSpider(Spider):
 
     :param category: Category to scrape.
     :param max_page: Number of pages to scrape starting from page 1.
+    :param categories: Several categories to scrape, separated by commas. Each
+        can be followed by a colon and its own number of pages, e.g.
+        "advocaten:3,notarissen". Takes precedence over `category` and `max_page`.
+    :param categories_file: Path to a YAML file with the categories to scrape,
+        see `load_categories`. Takes precedence over all of the above.
+    :param render: When to render business pages with Splash, see `RenderMode`.
+    :param item_model: The class to represent businesses with, see `ItemModel`.
+    :param fields: The fields to scrape, either the name of a profile of
+        `FIELD_PROFILES` or comma-separated fields, e.g. "name,phone,website". All
+        of them by default.
+
+    The reviews of the businesses are scraped as `ReviewItem`s when the
+    `REVIEWS_ENABLED` setting is on and `review_count` is one of the fields.
     """
 
     name = (
         "gouden_gids"  # Name of the spider, seemed fitting to name it after the website
     )
+    # The search pages are held back by `BackpressureMiddleware` while enough
+    # business pages are pending
+    backpressure_callbacks = ("parse_page",)
+    # Extracts the business pages in other processes, if enabled in the settings
+    parse_pool: ParsePool | None = None
+    # Times the extraction of the business pages, set by `InstrumentationMiddleware`
+    timings: Timings | None = None
+    # Whether to scrape the reviews on the business pages
+    scrape_reviews: bool = False
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler, *args, **kwargs) -> Self:
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.parse_pool = ParsePool.from_settings(crawler.settings)
+        spider.scrape_reviews = crawler.settings.getbool("REVIEWS_ENABLED", False)
+        return spider
+
+    def closed(self, reason: str) -> None:
+        if self.parse_pool is not None:
+            self.parse_pool.close()
+
+    @classmethod
+    def update_settings(cls, settings: BaseSettings) -> None:
+        super().update_settings(settings)
+        route_review_feeds(settings)
+        # A resumed crawl adds to the output of the previous runs
+        resume_feeds(settings)
 
     # Overriding the object initialization to add parameters.
     # This way the user can provide as arguments the desired category
-    # and the number of pages to scrape. I could allow selection of multiple categories at once,
-    # but then the number of pages to scrape must be defined per category, so I
-    # ultimately decided it was not worth the hassle for now.
-    # I would make the crawler configurable via a YAML or maybe env vars to
-    # enable more complicated scrapes with just 1 command.
-    # For now if one wants to scrape more than 1 category with 1 command,
-    # the easiest way is probably to write a simple parametrized bash function that
-    # runs a couple instances of this spider.
+    # and the number of pages to scrape. Crawling several categories at once
+    # is possible as well, each with its own number of pages. They all share
+    # the scheduler, connections and throttling of a single process, which is a lot
+    # cheaper than running an instance of this spider per category.
     def __init__(
         self,
         name: str | None = None,
         category: str = DEFAULT_CATEGORY,
         max_page: str | None = None,
+        categories: str | None = None,
+        categories_file: str | None = None,
+        render: str = RenderMode.AUTO,
+        item_model: str = ItemModel.ITEM,
+        fields: str | None = None,
         **kwargs,
     ):
-        self.category = category
-        self.max_page = max_page
+        if categories_file:
+            self.categories = load_categories(Path(categories_file))
+        elif categories:
+            self.categories = parse_categories(categories)
+        else:
+            self.categories = {category: parse_max_page(max_page)}
+        if not self.categories:
+            msg = "No categories to crawl"
+            raise ValueError(msg)
+        self.render = RenderMode(render)
+        self.item_model = ItemModel(item_model)
+        self.selected_fields = select_fields(fields) if fields else FIELDS
+        # Without any of the dynamic sections, there is nothing worth a render
+        if not any(field in DYNAMIC_SECTIONS for field in self.selected_fields):
+            self.render = RenderMode.NEVER
         super().__init__(name, **kwargs)
 
     def start_requests(self) -> Iterator[Request]:
         """Generate starting point(s) for the spider."""
-        # Here is where the selected category is injected into the url that
-        # determines the number of pages. The URL is then passed on to `self.parse`
-        yield Request(START_URL.format(category=self.category), self.parse)
-
-    def parse(self, response: HtmlResponse, **kwargs) -> Iterator[Request]:
-        """Find the number of pages for a specific category, call `parse_page` on each."""
-        # The max page to reach while crawling is either the one passed by the user (`self.max_page`)
-        # or if the user didn't pass it, it is scraped from the category "home page"
-        # That is also the only use of the category home page.
-        # We have to scrape it though, because otherwise we couldn't detect whether
-        # the user has passed a larger number of pages than exist.
-        max_page = int(response.xpath(GoudenGidsXPaths.MAX_PAGE)[0].get())
-        if self.max_page:
-            # We could log here and notify the user if he provides too big of a number.
-            max_page = min(int(self.max_page), max_page)
-        for page_number in range(1, max_page + 1):
-            # The search results share the same url, just with a different page number
-            # at the end, hence we can generate all of those and call `parse_page` on
-            # each.
-            page_url = f"{PAGE_URL.format(category=self.category)}{page_number}/"
-            yield Request(
-                page_url,
-                callback=self.parse_page,
-            )
+        # Here is where the selected categories are injected into the urls.
+        # The crawl of each category starts right at its first page of search results,
+        # the further pages are discovered from there.
+        for category in self.categories:
+            yield self.search_page_request(category, 1)
+
+    def search_page_request(self, category: str, page_number: int) -> Request:
+        """Return the request of a page of search results."""
+        # The search results share the same url, just with a different page number
+        # at the end
+        return Request(
+            f"{PAGE_URL.format(category=category)}{page_number}/",
+            callback=self.parse_page,
+            cb_kwargs={"category": category, "page_number": page_number},
+            priority=RequestPriority.SEARCH_PAGE,
+        )
 
     # This is the function that generates the responses that we really care about
-    def parse_page(self, response: HtmlResponse) -> Iterator[Request]:
-        """Find all businesses in a "search results" page, call `parse_business_page` on each."""
-        for url in response.xpath(GoudenGidsXPaths.LISTING).getall():
-            # TODO(Ivan Yordanov): Using `SplashRequest` to read elements such as parking infor properly,
-            # but it is not working at the moment. I suspect that it has something to
-            # do with the args, and perhaps some settings in `settings.py`, but I am
-            # not sure.
-            # The goal is to wait for a little, so that the page has time to
-            # load fully and then pass the now final HtmlResponse to the functions
-            # that scrape the data off of it.
+    def parse_page(
+        self,
+        response: HtmlResponse,
+        category: str | None = None,
+        page_number: int | None = None,
+    ) -> Iterator[Request]:
+        """Find all businesses in a "search results" page, call `parse_business_page` on each.
+
+        Then follow the pagination towards the next pages of the same category.
+        """
+        urls = COMPILED_XPATHS[GoudenGidsXPaths.LISTING](response.selector.root)
+        yield from self.business_page_requests(urls, category)
+        # A page without any businesses is past the last page
+        if urls and category is not None:
+            yield from self.next_page_requests(response, category, page_number)
+
+    def business_page_requests(
+        self, urls: list[str], category: str | None
+    ) -> Iterator[Request]:
+        """Yield the requests of the business pages found in a search page."""
+        # The category is passed on, so that the listing state knows which
+        # category each business was found in
+        meta = {"category": category}
+        callback = (
+            self.parse_business_page
+            if self.parse_pool is None
+            else self.parse_business_page_in_pool
+        )
+        for url in urls:
+            if self.render is not RenderMode.ALWAYS:
+                # All fields except for the dynamic sections are present in the
+                # plain HTML, so there is no need to pay for a render up front
+                yield Request(
+                    BASE_URL + url,
+                    callback=callback,
+                    meta=meta,
+                    priority=RequestPriority.BUSINESS_PAGE,
+                )
+                continue
+            # The render waits until the scripts of the page have filled the
+            # dynamic sections in, rather than for a fixed time, which either wasted
+            # seconds or returned the placeholders when the scripts were slower.
+            # The now final HtmlResponse is passed to the functions that scrape the
+            # data off of it.
             yield SplashRequest(
-                BASE_URL + url, callback=self.parse_business_page, args={"wait": 3}
+                BASE_URL + url,
+                callback=callback,
+                endpoint="execute",
+                args=render_args(RENDER_MAX_WAIT, wait_for=DYNAMIC_SECTION_SELECTORS),
+                meta=meta,
+                priority=RequestPriority.BUSINESS_PAGE,
             )
 
-    def parse_business_page(self, response: HtmlResponse) -> Iterator[BusinessItem]:
+    def next_page_requests(
+        self, response: HtmlResponse, category: str, page_number: int | None = None
+    ) -> Iterator[Request]:
+        """Yield the requests of the next pages linked to from a search page.
+
+        Only the pages up to `PAGE_LOOKAHEAD` pages ahead are followed, within the
+        limit of the category. The pages that were requested already are left out
+        by the duplicate filter.
+        """
+        if page_number is None:
+            match = SEARCH_PAGE_URL.search(response.url)
+            page_number = int(match.group("page_number")) if match else 1
+        linked_pages = {
+            int(match.group("page_number"))
+            for href in COMPILED_XPATHS[GoudenGidsXPaths.PAGINATION](
+                response.selector.root
+            )
+            if (match := SEARCH_PAGE_URL.search(href))
+            and match.group("category") == category
+        }
+        next_pages = sorted(
+            linked_pages & set(range(page_number + 1, page_number + PAGE_LOOKAHEAD + 1))
+        )
+        if not linked_pages:
+            # Without any pagination links, carry on with the next page until a page
+            # has no businesses
+            next_pages = [page_number + 1]
+        max_page = self.categories.get(category)
+        for next_page in next_pages:
+            if max_page is None or next_page <= max_page:
+                yield self.search_page_request(category, next_page)
+
+    def parse_business_page(
+        self, response: HtmlResponse
+    ) -> Iterator[AnyBusinessItem | ReviewItem | Request]:
         """Yield item containing all scraped details bout a business."""
+        # Evaluating the XPaths in `GoudenGidsXPaths` one by one searches the whole
+        # document ~25 times per business. `BusinessPageExtractor` walks the tree once
+        # instead and produces the same item as `extract_business_item` below.
+        timings = self.timings
+        started = time.perf_counter()
+        extractor = BusinessPageExtractor(response.selector.root, self.selected_fields)
+        if timings is not None:
+            timings.observe("extraction/walk", time.perf_counter() - started)
+        fields = extractor.fields(
+            None
+            if timings is None
+            else lambda field, seconds: timings.observe(f"field/{field}", seconds)
+        )
+        yield from self.complete_business_item(
+            fields, response, extractor.parking_info_parameters()
+        )
+
+    async def parse_business_page_in_pool(
+        self, response: HtmlResponse
+    ) -> list[AnyBusinessItem | ReviewItem | Request]:
+        """Extract a business page in `parse_pool`, otherwise like `parse_business_page`.
+
+        The reactor goes on downloading while another process extracts the page.
+        """
+        assert self.parse_pool is not None
+        fields, parking_info_parameters = await maybe_deferred_to_future(
+            self.parse_pool.extract(response.text, self.selected_fields)
+        )
+        # A list rather than an async generator, which the spider middlewares
+        # would have to support
+        return list(
+            self.complete_business_item(fields, response, parking_info_parameters)
+        )
+
+    def complete_business_item(
+        self,
+        fields: dict[str, Any],
+        response: HtmlResponse,
+        parking_info_parameters: dict[str, Any] | None,
+    ) -> Iterator[AnyBusinessItem | ReviewItem | Request]:
+        """Yield the item with the fields of a business page, once it is complete."""
+        business_item = (
+            to_record(fields)
+            if self.item_model is ItemModel.RECORD
+            else to_item(fields)
+        )
+        # The listing ID identifies the business across categories and crawls.
+        # `ItemAdapter` gives both item models the same interface.
+        ItemAdapter(business_item)["listing_id"] = get_listing_id(response.url)
+        if "splash" in response.meta:
+            # The page is already rendered, so there is nothing left to resolve
+            yield business_item
+        else:
+            yield from self.resolve_dynamic_sections(
+                business_item, response.url, parking_info_parameters
+            )
+        # `ListingStateMiddleware` passes on what the previous crawl knew
+        yield from self.business_reviews(
+            business_item, response, response.meta.get("listing_state")
+        )
+
+    def resolve_dynamic_sections(
+        self,
+        business_item: AnyBusinessItem,
+        url: str,
+        parking_info_parameters: dict[str, Any] | None = None,
+    ) -> Iterator[AnyBusinessItem | Request]:
+        """Yield the request that resolves the next dynamic section of an item.
+
+        Once there is nothing left to resolve, yield the item itself.
+
+        :param business_item: Item scraped from the plain HTML of a business page.
+        :param url: The URL of the business page.
+        :param parking_info_parameters: The parameters to request the parking info
+            with, `None` if it can't be requested directly.
+        """
+        sections = unresolved_sections(business_item)
+        if self.render is not RenderMode.AUTO or not sections:
+            # Since `business_item` is a scrapy.Item instance, scrapy knows to collect
+            # it and write it to the `.csv` file that we have defined in the settings.
+            yield business_item
+            return
+        if (
+            "parking_info" in sections
+            and parking_info_parameters
+            and (parking_url := parking_api_url(parking_info_parameters))
+        ):
+            # The parking info widget fetches its data from a small JSON endpoint.
+            # Requesting it directly is much cheaper than rendering the whole page.
+            yield Request(
+                parking_url,
+                callback=self.parse_parking_info,
+                errback=self.parking_info_failed,
+                headers={"Accept": "application/json", "Referer": url},
+                cb_kwargs={"business_item": business_item, "url": url},
+                dont_filter=True,  # Neighbouring businesses share the coordinates
+                priority=RequestPriority.DYNAMIC_SECTION,
+            )
+            return
+        # Only now is it worth rendering the page. The static fields are
+        # already scraped, so they are passed along with the request and only the
+        # dynamic sections are returned by Splash.
+        yield SplashRequest(
+            url,
+            callback=self.parse_rendered_business_page,
+            endpoint="execute",
+            args=render_args(
+                RENDER_MAX_WAIT,
+                selectors=DYNAMIC_SECTION_SELECTORS,
+                wait_for=DYNAMIC_SECTION_SELECTORS,
+            ),
+            cb_kwargs={"business_item": business_item},
+            dont_filter=True,  # The plain page has the same URL
+            priority=RequestPriority.DYNAMIC_SECTION,
+        )
+
+    def parse_parking_info(
+        self, response: TextResponse, business_item: AnyBusinessItem, url: str
+    ) -> Iterator[AnyBusinessItem | Request]:
+        """Fill the parking info of an item in with the data of its endpoint."""
+        try:
+            data = response.json()
+        except ValueError:
+            self.logger.warning("Invalid parking info for %s, rendering it", url)
+            yield from self.resolve_dynamic_sections(business_item, url)
+            return
+        adapter = ItemAdapter(business_item)
+        adapter["parking_info"] = fill_parking_info(
+            adapter["parking_info"], data if isinstance(data, dict) else {}
+        )
+        yield from self.resolve_dynamic_sections(business_item, url)
+
+    def parking_info_failed(
+        self, failure: Failure
+    ) -> Iterator[AnyBusinessItem | Request]:
+        """Fall back to rendering the business page when the parking info can't be fetched."""
+        # Scrapy attaches the failed request to the failure
+        kwargs = failure.request.cb_kwargs  # pyright: ignore[reportAttributeAccessIssue]
+        self.logger.warning(
+            "Failed to fetch the parking info for %s, rendering it: %s",
+            kwargs["url"],
+            failure.value,
+        )
+        yield from self.resolve_dynamic_sections(kwargs["business_item"], kwargs["url"])
+
+    def parse_rendered_business_page(
+        self, response: HtmlResponse, business_item: AnyBusinessItem
+    ) -> Iterator[AnyBusinessItem]:
+        """Complete an item scraped from plain HTML with the dynamic sections of the rendered page."""
+        sections = unresolved_sections(business_item)
+        extractor = BusinessPageExtractor(response.selector.root, tuple(sections))
+        adapter = ItemAdapter(business_item)
+        for section in sections:
+            adapter[section] = extractor.list_information(section)
+        yield business_item
+
+    def business_reviews(
+        self,
+        business_item: AnyBusinessItem,
+        response: HtmlResponse,
+        state: ListingState | None = None,
+    ) -> Iterator[ReviewItem]:
+        """Yield the reviews on the page of a business, newest first.
+
+        The reviews are emitted as items of their own, next to the item of the
+        business. The ones that the previous crawl emitted are left out.
+
+        :param business_item: Item of the business, with its listing ID.
+        :param response: The business page. With `parse_pool`, it is only parsed
+            here, and only for the businesses with reviews.
+        :param state: The state of the listing before it was crawled this time.
+        """
+        adapter = ItemAdapter(business_item)
+        listing_id = adapter.get("listing_id")
+        if not self.scrape_reviews or not listing_id or not adapter.get("review_count"):
+            return
+        yield from extract_reviews(
+            response.selector.root,
+            listing_id,
+            state.newest_review_id if state else None,
+        )
+
+    @classmethod
+    def extract_business_item(cls, response: HtmlResponse) -> BusinessItem:
+        """Return item containing all scraped details about a business, one XPath at a time.
+
+        Reference implementation of `BusinessPageExtractor`, useful for testing and
+        benchmarking it.
+        """
         # This is the object that contains all the scraped data for a business.
         # For each of its attributes I use one of the functions that I have defined
         # further down together with an XPath from that enum class at the top of the file.
@@ -191,50 +617,52 @@ class GoudenGidsSpider(Spider):
         # to a section changes and XPaths need to be modified. That can happen in
         # `GoudenGidsXPaths` where each string is assigned to a clear name, immediately
         # making it clear what its general meaning is.
-        business_item = BusinessItem(
-            name=self.get_element_text(response, GoudenGidsXPaths.NAME),
-            location=self.get_element_text(response, GoudenGidsXPaths.LOCATION),
-            description=self.get_element_text(response, GoudenGidsXPaths.DESCRIPTION),
-            phone=self.get_element_text(response, GoudenGidsXPaths.PHONE),
-            website=self.get_element_text(response, GoudenGidsXPaths.WEBSITE),
-            email=self.get_element_text(response, GoudenGidsXPaths.EMAIL),
-            social_media=self.get_element_texts(
-                response, GoudenGidsXPaths.SOCIAL_MEDIA
-            ),
-            payment_options=self.get_element_texts(
+        review_count = parse_review_count(
+            cls.get_element_text(response, GoudenGidsXPaths.REVIEW_COUNT)
+        )
+        return BusinessItem(
+            name=cls.get_element_text(response, GoudenGidsXPaths.NAME),
+            location=cls.get_element_text(response, GoudenGidsXPaths.LOCATION),
+            description=cls.get_element_text(response, GoudenGidsXPaths.DESCRIPTION),
+            phone=cls.get_element_text(response, GoudenGidsXPaths.PHONE),
+            website=cls.get_element_text(response, GoudenGidsXPaths.WEBSITE),
+            email=cls.get_element_text(response, GoudenGidsXPaths.EMAIL),
+            social_media=cls.get_element_texts(response, GoudenGidsXPaths.SOCIAL_MEDIA),
+            payment_options=cls.get_element_texts(
                 response, GoudenGidsXPaths.PAYMENT_OPTIONS
             ),
-            certificates=self.get_element_text(response, GoudenGidsXPaths.CERTIFICATES),
-            other_information=self.get_other_information(
+            certificates=cls.get_element_text(response, GoudenGidsXPaths.CERTIFICATES),
+            other_information=cls.get_other_information(
                 response,
                 GoudenGidsXPaths.OTHER_INFORMATION_SECTION,
                 GoudenGidsXPaths.OTHER_INFORMATION_SECTION_TITLE,
                 GoudenGidsXPaths.OTHER_INFORMATION_SECTION_VALUE,
             ),
-            working_time=self.get_working_times(response),
+            working_time=cls.get_working_times(response),
             # TODO(Ivan Yordanov): Broken because the content is loaded dynamically
             # Solvable using Splash or Selenium.
             # For now I have chosen Splash, because the library is slightly better maintained.
             # `scrapy-selenium` has been dead for ~3 years while `scrapy-splash`
             # was last updated in February 2023.
-            parking_info=self.get_other_information(
+            parking_info=cls.get_other_information(
                 response,
                 GoudenGidsXPaths.PARKING_INFO,
                 GoudenGidsXPaths.PARKING_INFO_SECTION_NAME,
                 GoudenGidsXPaths.PARKING_INFO_SECTION_VALUE,
             ),
-            economic_data=self.get_other_information(
+            economic_data=cls.get_other_information(
                 response,
                 GoudenGidsXPaths.ECONOMIC_DATA,
                 GoudenGidsXPaths.ECONOMIC_DATA_SECTION_NAME,
                 GoudenGidsXPaths.ECONOMIC_DATA_SECTION_VALUE,
             ),
-            logo=self.get_element_text(response, GoudenGidsXPaths.LOGO_SRC),
-            pictures=self.get_element_texts(response, GoudenGidsXPaths.PHOTO_SRC),
+            logo=cls.get_element_text(response, GoudenGidsXPaths.LOGO_SRC),
+            pictures=cls.get_element_texts(response, GoudenGidsXPaths.PHOTO_SRC),
+            rating=parse_rating(cls.get_element_text(response, GoudenGidsXPaths.RATING))
+            if review_count
+            else None,
+            review_count=review_count,
         )
-        # Since `business_item` is a scrapy.Item instance, scrapy knows to collect
-        # it and write it to the `.csv` file that we have defined in the settings.
-        yield business_item
 
     # Method is static, because it doesn't need to access anything from `self`
     # The code is gonna be a bit easier to read and no needless operations would
@@ -243,7 +671,7 @@ class GoudenGidsSpider(Spider):
     def get_element_text(response: HtmlResponse, xpath: str) -> str:
         """Return the text contained in the element towards which a provided xpath points."""
         # use `or` to ensure that the return type is `str`
-        return response.xpath(f"normalize-space({xpath})").get() or ""
+        return get_compiled_xpath(xpath, normalize=True)(response.selector.root) or ""
 
     @staticmethod
     def get_element_texts(response: HtmlResponse, xpath: str) -> list[str]:
@@ -252,14 +680,14 @@ class GoudenGidsSpider(Spider):
         # For those, it is hard to use `normalize-space()` in the XPath, especially because
         # scrapy uses XPath 1.0. Hence, we use Python's string manipulation abilities
         # to remove all redundant whitespace from the texts
-        return [el.strip() for el in response.xpath(xpath).getall()] or []
+        return [
+            el.strip() for el in get_compiled_xpath(xpath)(response.selector.root)
+        ] or []
 
-    # This method would have been static if it didn't have to call `get_element_text`.
-    # Neatly, we can make it a class method. It doesn't need anything from
-    # an instance, it only needs a static method, so instead of binding `get_working_times`
-    # to each instance of its class, we bind it just once to the class itself.
-    @classmethod
-    def get_working_times(cls, response: HtmlResponse) -> WorkingTimeItem:
+    # Now that the XPath of each day is compiled in advance, this method doesn't
+    # need `get_element_text` anymore and can be static as well.
+    @staticmethod
+    def get_working_times(response: HtmlResponse) -> WorkingTimeItem:
         """Return `WorkingTimeItem` containing the work time of a business."""
 
         # Here I have nested the function, because I see no place where
@@ -267,9 +695,8 @@ class GoudenGidsSpider(Spider):
         # clean.
         def get_working_time_day(response: HtmlResponse, day: DutchWeekDay) -> str:
             """Return the working time for a single day."""
-            return cls.get_element_text(
-                response, GoudenGidsXPaths.WORKING_DAY.format(day=day)
-            )
+            # The XPath of each day is compiled in advance, so no need to format it here
+            return COMPILED_WORKING_DAY_XPATHS[day](response.selector.root) or ""
 
         # Note how this function returns a `scrapy.Item`, instead of
         # yielding it. This is important as the `WorkingTimeItem` is intended
@@ -312,9 +739,9 @@ class GoudenGidsSpider(Spider):
         """
         # This is almost a combination of the 2 simpler static methods above
         # I would try to remove the repeated logic here.
+        section_name = get_compiled_xpath(section_name_xpath)
+        section_value = get_compiled_xpath(section_value_xpath)
         return {
-            section.xpath(section_name_xpath).get() or "": [
-                el.strip() for el in section.xpath(section_value_xpath).getall()
-            ]
-            for section in response.xpath(sections_xpath)
+            section_name(section) or "": [el.strip() for el in section_value(section)]
+            for section in get_compiled_xpath(sections_xpath)(response.selector.root)
         }
@@ -0,0 +1,344 @@
+import json
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Self
+from urllib.parse import urlsplit
+
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+from scrapy.statscollectors import StatsCollector
+from scrapy_splash import SlotPolicy
+from twisted.internet import task
+from twisted.internet.defer import Deferred
+
+logger = logging.getLogger(__name__)
+
+# The Lua script that renders the pages, see its header
+RENDER_SCRIPT = (Path(__file__).parent / "render.lua").read_text(encoding="utf-8")
+# Requests that the pages make, which never affect the data that is extracted
+BLOCKED_REQUESTS = [
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com/tr",
+    "hotjar.com",
+    "bing.com",
+    "linkedin.com",
+    "cookiebot.com",
+    "youtube.com",
+]
+# Statuses with which a Splash instance shows that it is overloaded or broken
+FAILURE_STATUSES = {502, 503, 504}
+# Failures in a row after which a Splash instance isn't used until it is healthy again
+DEFAULT_MAX_FAILURES = 3
+# Seconds between the health checks of the Splash instances
+DEFAULT_HEALTH_CHECK_INTERVAL = 30.0
+
+
+# Seconds without any request after which a rendered page is considered done
+DEFAULT_NETWORK_IDLE = 0.5
+# Renders that Splash runs at the same time, its `--slots` option as set in
+# `docker-compose.yaml`
+DEFAULT_SPLASH_SLOTS = 5
+
+
+def render_args(
+    max_wait: float,
+    selectors: str | None = None,
+    wait_for: str | None = None,
+    idle: float = DEFAULT_NETWORK_IDLE,
+) -> dict[str, Any]:
+    """Return the arguments of a render with `RENDER_SCRIPT`, for the `execute` endpoint.
+
+    :param max_wait: The longest to wait for the scripts of the page once it has loaded.
+    :param selectors: CSS selector of the elements to return instead of the whole page.
+    :param wait_for: CSS selector of the elements that the scripts of the page fill
+        in. The render ends as soon as none of them contains a placeholder anymore.
+    :param idle: Seconds without any request after which the render ends anyway.
+    """
+    args: dict[str, Any] = {
+        "lua_source": RENDER_SCRIPT,
+        "max_wait": max_wait,
+        "idle": idle,
+        "blocked": BLOCKED_REQUESTS,
+    }
+    if selectors:
+        args["selectors"] = selectors
+    if wait_for:
+        args["wait_for"] = wait_for
+    return args
+
+
+@dataclass
+class SplashNode:
+    """A Splash instance of the pool and how it is doing."""
+
+    url: str
+    pending: int = 0  # Renders sent to it that haven't been answered
+    failures: int = 0  # Failures in a row
+    healthy: bool = True
+
+    @property
+    def name(self) -> str:
+        return urlsplit(self.url).netloc
+
+    @property
+    def slot(self) -> str:
+        """The download slot of the renders of this instance."""
+        # `AdaptiveThrottleMiddleware` applies the `__splash__` budget to each of them
+        return f"__splash__/{self.name}"
+
+
+class SplashPoolMiddleware:
+    """Downloader middleware that spreads the renders over several Splash instances.
+
+    Each render goes to the healthy instance with the fewest renders pending and gets
+    a download slot of its own, so each instance is throttled on its own as well.
+    An instance that fails `SPLASH_POOL_MAX_FAILURES` times in a row, or fails a
+    health check, is left out until a health check succeeds again. The renders that
+    fail on an instance are sent to another one.
+
+    The health checks ping each instance every `SPLASH_POOL_HEALTH_CHECK_INTERVAL`
+    seconds and publish the memory it uses in the stats (`splash_pool/*`).
+
+    Enabled with `SPLASH_URLS`, the list of instances. Must come before
+    `SplashMiddleware`, which sends the renders to the chosen instance.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        crawler: Crawler,
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+    ):
+        self.nodes = {url: SplashNode(url) for url in urls}
+        self.crawler = crawler
+        self.stats: StatsCollector = crawler.stats  # pyright: ignore[reportAttributeAccessIssue]
+        self.max_failures = max_failures
+        self.health_check_interval = health_check_interval
+        self.health_checks = task.LoopingCall(self.check_health)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not (urls := settings.getlist("SPLASH_URLS")):
+            raise NotConfigured
+        middleware = cls(
+            urls,
+            crawler,
+            max_failures=settings.getint(
+                "SPLASH_POOL_MAX_FAILURES", DEFAULT_MAX_FAILURES
+            ),
+            health_check_interval=settings.getfloat(
+                "SPLASH_POOL_HEALTH_CHECK_INTERVAL", DEFAULT_HEALTH_CHECK_INTERVAL
+            ),
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider: Spider) -> None:
+        if self.health_check_interval > 0:
+            self.health_checks.start(self.health_check_interval)
+
+    def spider_closed(self, spider: Spider) -> None:
+        if self.health_checks.running:
+            self.health_checks.stop()
+
+    def process_request(self, request: Request, spider: Spider) -> None:
+        splash = request.meta.get("splash")
+        if not splash or request.meta.get("_splash_processed"):
+            return
+        node = self.least_loaded()
+        node.pending += 1
+        splash["splash_url"] = node.url
+        # The slot of the instance rather than the single `__splash__` one
+        splash["slot_policy"] = SlotPolicy.SCRAPY_DEFAULT
+        request.meta["download_slot"] = node.slot
+        self.stats.set_value(f"splash_pool/{node.name}/pending", node.pending)
+
+    def process_response(
+        self, request: Request, response: Response, spider: Spider
+    ) -> Request | Response:
+        if (node := self.node(request)) is None:
+            return response
+        self.done(node)
+        if response.status not in FAILURE_STATUSES:
+            node.failures = 0
+            return response
+        return self.fail(node, request) or response
+
+    def process_exception(
+        self, request: Request, exception: Exception, spider: Spider
+    ) -> Request | None:
+        if (node := self.node(request)) is None:
+            return None
+        self.done(node)
+        return self.fail(node, request)
+
+    def node(self, request: Request) -> SplashNode | None:
+        """Return the instance that a processed render was sent to."""
+        if not request.meta.get("_splash_processed"):
+            return None
+        return self.nodes.get(request.meta["splash"].get("splash_url"))
+
+    def least_loaded(self) -> SplashNode:
+        # Without any healthy instance, trying the others beats dropping the renders
+        nodes = [node for node in self.nodes.values() if node.healthy] or list(
+            self.nodes.values()
+        )
+        return min(nodes, key=lambda node: (node.pending, node.failures))
+
+    def done(self, node: SplashNode) -> None:
+        node.pending = max(0, node.pending - 1)
+        self.stats.set_value(f"splash_pool/{node.name}/pending", node.pending)
+
+    def fail(self, node: SplashNode, request: Request) -> Request | None:
+        """Count a failure of an instance, return the render sent to another one."""
+        node.failures += 1
+        if node.healthy and node.failures >= self.max_failures:
+            self.set_health(node, healthy=False)
+        reroutes = request.meta.get("splash_pool_reroutes", 0)
+        if len(self.nodes) < 2 or reroutes >= len(self.nodes) - 1:
+            # Left to `RetryMiddleware`
+            return None
+        self.stats.inc_value("splash_pool/rerouted")
+        meta = {
+            key: value
+            for key, value in request.meta.items()
+            if key not in {"_splash_processed", "download_slot"}
+        }
+        meta["splash"] = {
+            key: value
+            for key, value in request.meta["splash"].items()
+            if key != "splash_url"
+        }
+        meta["splash_pool_reroutes"] = reroutes + 1
+        # `SplashMiddleware` turns it into a render again, for another instance
+        return request.replace(
+            url=meta["splash"]["args"]["url"],
+            method="GET",
+            body=b"",
+            meta=meta,
+            dont_filter=True,
+        )
+
+    def set_health(self, node: SplashNode, *, healthy: bool) -> None:
+        if node.healthy != healthy:
+            logger.warning(
+                "Splash at %s is %s", node.url, "back" if healthy else "left out"
+            )
+        node.healthy = healthy
+        if healthy:
+            node.failures = 0
+        self.stats.set_value(f"splash_pool/{node.name}/healthy", healthy)
+
+    def check_health(self) -> Deferred:
+        """Ping every instance, publish how much memory it uses."""
+        from twisted.internet import reactor
+        from twisted.internet.defer import DeferredList
+        from twisted.web.client import Agent, readBody
+
+        agent = Agent(reactor, connectTimeout=5)
+
+        def read(response: Any) -> Deferred:
+            if response.code != 200:
+                msg = f"Splash answered its ping with {response.code}"
+                raise ValueError(msg)
+            return readBody(response)
+
+        def healthy(body: bytes, node: SplashNode) -> None:
+            self.set_health(node, healthy=True)
+            try:
+                status: dict[str, Any] = json.loads(body)
+            except ValueError:
+                return
+            if (maxrss := status.get("maxrss")) is not None:
+                # Kilobytes, like `ru_maxrss`
+                self.stats.set_value(
+                    f"splash_pool/{node.name}/maxrss_mb", maxrss / 1024
+                )
+
+        checks = []
+        for node in self.nodes.values():
+            check = agent.request(b"GET", f"{node.url.rstrip('/')}/_ping".encode())
+            check.addTimeout(10, reactor)  # pyright: ignore[reportArgumentType]
+            check.addCallback(read)
+            check.addCallbacks(
+                healthy,
+                lambda failure, node=node: self.set_health(node, healthy=False),
+                callbackArgs=(node,),
+            )
+            checks.append(check)
+        return DeferredList(checks, consumeErrors=True)
+
+
+class SplashStatsMiddleware:
+    """Downloader middleware that publishes how the renders used Splash.
+
+    For each render with `RENDER_SCRIPT`, how long it waited for the page
+    (`splash/waited`) and why it stopped waiting (`splash/ready/*`). Once the crawl
+    is done, the share of the time that the `SPLASH_SLOTS` slots of each instance
+    were rendering (`splash/<instance>/slot_utilization`).
+
+    Must come after `SplashMiddleware` in the responses, to see what Splash returned.
+    """
+
+    def __init__(self, splash_url: str, slots: int, stats: StatsCollector):
+        self.splash_url = splash_url
+        self.slots = slots
+        self.stats = stats
+        self.busy: dict[str, float] = {}  # Seconds spent rendering, per instance
+        self.started_at = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        middleware = cls(
+            settings.get("SPLASH_URL", ""),
+            settings.getint("SPLASH_SLOTS", DEFAULT_SPLASH_SLOTS),
+            crawler.stats,  # pyright: ignore[reportArgumentType]
+        )
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_opened(self, spider: Spider) -> None:
+        self.started_at = time.monotonic()
+
+    def process_response(
+        self, request: Request, response: Response, spider: Spider
+    ) -> Response:
+        if not request.meta.get("_splash_processed"):
+            return response
+        data: dict[str, Any] = getattr(response, "data", None) or {}
+        # The time that the render took in Splash, without the time that it was queued
+        if (elapsed := data.get("elapsed")) is None:
+            elapsed = request.meta.get("download_latency", 0.0)
+        name = urlsplit(
+            request.meta["splash"].get("splash_url") or self.splash_url
+        ).netloc
+        self.busy[name] = self.busy.get(name, 0.0) + elapsed
+        self.stats.inc_value("splash/renders")
+        self.stats.inc_value(f"splash/{name}/busy", elapsed)
+        if (waited := data.get("waited")) is not None:
+            self.stats.inc_value("splash/waited", waited)
+            self.stats.max_value("splash/max_waited", waited)
+        if ready := data.get("ready"):
+            self.stats.inc_value(f"splash/ready/{ready}")
+        return response
+
+    def spider_closed(self, spider: Spider) -> None:
+        if (duration := time.monotonic() - self.started_at) <= 0:
+            return
+        for name, busy in self.busy.items():
+            self.stats.set_value(
+                f"splash/{name}/slot_utilization", busy / (duration * self.slots)
+            )
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from itemadapter import ItemAdapter
+
+
+class ListingState(NamedTuple):
+    """What is known about a listing from previous crawls.
+
+    All timestamps are in seconds since the epoch.
+    """
+
+    listing_id: str
+    url: str
+    category: str | None
+    first_seen: float
+    last_seen: float  # When the listing was last found on a search page
+    fetched_at: float | None  # When the content of the page was last confirmed
+    content_hash: str | None  # Hash of the item that was last emitted
+    etag: str | None
+    last_modified: str | None
+    disappeared_at: float | None  # When the listing was no longer found
+    review_count: int | None  # The number of reviews of the last emitted item
+    newest_review_id: str | None  # The newest review that was emitted
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    category TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    fetched_at REAL,
+    content_hash TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    disappeared_at REAL,
+    review_count INTEGER,
+    newest_review_id TEXT,
+    -- The validators of the last response, until its item is emitted
+    has_pending_response INTEGER NOT NULL DEFAULT 0,
+    pending_etag TEXT,
+    pending_last_modified TEXT
+);
+CREATE INDEX IF NOT EXISTS listings_category ON listings (category, last_seen);
+"""
+COLUMNS = ", ".join(ListingState._fields)
+# The columns that were added after the table was first created, with their types.
+# They are added to the databases of older crawls when these are opened.
+ADDED_COLUMNS = {"review_count": "INTEGER", "newest_review_id": "TEXT"}
+
+
+def item_hash(item: Any) -> str:
+    """Return a hash of the content of an item, independent of the order of its fields."""
+    content = json.dumps(
+        ItemAdapter(item).asdict(), sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+class ListingStateStore:
+    """SQLite database that remembers the listings of previous crawls.
+
+    The validators of a response (ETag and Last-Modified) are only used for
+    conditional requests once the item of that response has been emitted.
+    Otherwise an item that got lost along the way would never be emitted again.
+
+    :param path: Path to the database file, created if it doesn't exist.
+    """
+
+    def __init__(self, path: Path | str):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Every statement is committed right away. With a write-ahead log that is
+        # cheap, and another process may read the state while crawling.
+        self.connection = sqlite3.connect(path, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        existing = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(listings)")
+        }
+        for column, column_type in ADDED_COLUMNS.items():
+            if column not in existing:
+                self.connection.execute(
+                    f"ALTER TABLE listings ADD COLUMN {column} {column_type}"
+                )
+
+    def get(self, listing_id: str) -> ListingState | None:
+        row = self.connection.execute(
+            f"SELECT {COLUMNS} FROM listings WHERE listing_id = ?",
+            (listing_id,),
+        ).fetchone()
+        return None if row is None else ListingState(*row)
+
+    def see(
+        self, listing_id: str, url: str, category: str | None = None
+    ) -> ListingState | None:
+        """Record that a listing was found while crawling.
+
+        :return: The state of the listing before it was seen this time.
+        """
+        state = self.get(listing_id)
+        now = time.time()
+        self.connection.execute(
+            """
+            INSERT INTO listings (listing_id, url, category, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (listing_id) DO UPDATE SET
+                url = excluded.url,
+                category = coalesce(excluded.category, category),
+                last_seen = excluded.last_seen,
+                disappeared_at = NULL
+            """,
+            (listing_id, url, category, now, now),
+        )
+        return state
+
+    def record_response(
+        self, listing_id: str, etag: str | None, last_modified: str | None
+    ) -> None:
+        """Remember the validators of a response until its item is emitted."""
+        self.connection.execute(
+            """
+            UPDATE listings SET
+                has_pending_response = 1,
+                pending_etag = ?,
+                pending_last_modified = ?
+            WHERE listing_id = ?
+            """,
+            (etag, last_modified, listing_id),
+        )
+
+    def record_not_modified(self, listing_id: str) -> None:
+        """Record that the page of a listing hasn't changed since the last crawl."""
+        self.connection.execute(
+            "UPDATE listings SET fetched_at = ? WHERE listing_id = ?",
+            (time.time(), listing_id),
+        )
+
+    def record_item(self, listing_id: str, content_hash: str) -> bool:
+        """Record the item of a listing.
+
+        :return: Whether the item is new or has changed since the last crawl.
+        """
+        state = self.get(listing_id)
+        self.connection.execute(
+            """
+            INSERT INTO listings (
+                listing_id, url, first_seen, last_seen, fetched_at, content_hash
+            )
+            VALUES (?, '', ?, ?, ?, ?)
+            ON CONFLICT (listing_id) DO UPDATE SET
+                fetched_at = excluded.fetched_at,
+                content_hash = excluded.content_hash,
+                etag = iif(has_pending_response, pending_etag, etag),
+                last_modified = iif(
+                    has_pending_response, pending_last_modified, last_modified
+                ),
+                has_pending_response = 0,
+                pending_etag = NULL,
+                pending_last_modified = NULL
+            """,
+            (listing_id, *([time.time()] * 3), content_hash),
+        )
+        return state is None or state.content_hash != content_hash
+
+    def record_reviews(
+        self,
+        listing_id: str,
+        review_count: int | None = None,
+        newest_review_id: str | None = None,
+    ) -> None:
+        """Record the number of reviews of a listing and/or its newest review."""
+        self.connection.execute(
+            """
+            UPDATE listings SET
+                review_count = coalesce(?, review_count),
+                newest_review_id = coalesce(?, newest_review_id)
+            WHERE listing_id = ?
+            """,
+            (review_count, newest_review_id, listing_id),
+        )
+
+    def mark_disappeared(self, categories: Iterable[str], since: float) -> int:
+        """Mark the listings of categories that weren't seen since a given time.
+
+        :param categories: Categories that were crawled completely.
+        :param since: When the crawl started.
+        :return: The number of listings that have disappeared.
+        """
+        categories = list(categories)
+        cursor = self.connection.execute(
+            f"""
+            UPDATE listings SET disappeared_at = ?
+            WHERE category IN ({", ".join("?" * len(categories))})
+            AND last_seen < ? AND disappeared_at IS NULL
+            """,
+            (time.time(), *categories, since),
+        )
+        return cursor.rowcount
+
+    def disappeared(self) -> list[ListingState]:
+        """Return the listings that are no longer found on Gouden Gids."""
+        rows = self.connection.execute(
+            f"SELECT {COLUMNS} FROM listings WHERE disappeared_at IS NOT NULL"
+        )
+        return [ListingState(*row) for row in rows]
+
+    def close(self) -> None:
+        self.connection.close()
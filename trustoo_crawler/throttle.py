@@ -0,0 +1,236 @@
+import re
+from dataclasses import dataclass, replace
+from typing import Any, Self
+
+from scrapy import Request, Spider, signals
+from scrapy.crawler import Crawler
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.http import Response, TextResponse
+from scrapy.settings import BaseSettings
+from scrapy.statscollectors import StatsCollector
+
+# The statuses with which a website asks to slow down
+BACKOFF_STATUSES = {429, 503}
+# Pages that ask to prove that the visitor is human, served instead of the real page.
+# Normal pages may embed a captcha too (e.g. reCAPTCHA in a contact form), so only
+# these signals of a challenge count:
+# - a redirect to the challenge, whose URL then names it
+CHALLENGE_URL = re.compile(r"captcha|/cdn-cgi/challenge-platform/", re.IGNORECASE)
+# - the title of the challenge, in the head of the page
+CHALLENGE_TITLE = re.compile(
+    rb"<title[^>]*>[^<]*(?:captcha|just a moment|attention required|are you a robot|geen robot)",
+    re.IGNORECASE,
+)
+HEAD_SIZE = 16 * 1024
+# - a captcha in a page that is too small to be a business or search page, which
+#   are about 100 KB
+CAPTCHA = re.compile(rb"captcha", re.IGNORECASE)
+CHALLENGE_MAX_SIZE = 32 * 1024
+# Weight of the latest response in the average latency of a slot
+LATENCY_WEIGHT = 0.2
+
+
+@dataclass(frozen=True)
+class SlotBudget:
+    """The limits within which the rate of a download slot is adjusted.
+
+    :param start_delay: Delay between the first requests, in seconds.
+    :param min_delay: Shortest delay between requests.
+    :param max_delay: Longest delay between requests, after backing off.
+    :param max_concurrency: Maximum number of requests at the same time.
+    :param target_latency: Average latency up to which the slot is considered healthy.
+    """
+
+    start_delay: float = 1.0
+    min_delay: float = 0.25
+    max_delay: float = 60.0
+    max_concurrency: int = 8
+    target_latency: float = 2.0
+
+    @classmethod
+    def from_settings(cls, settings: BaseSettings) -> Self:
+        return cls(
+            start_delay=settings.getfloat("ADAPTIVE_THROTTLE_START_DELAY", 1.0),
+            min_delay=settings.getfloat("ADAPTIVE_THROTTLE_MIN_DELAY", 0.25),
+            max_delay=settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0),
+            max_concurrency=settings.getint("ADAPTIVE_THROTTLE_MAX_CONCURRENCY", 8),
+            target_latency=settings.getfloat("ADAPTIVE_THROTTLE_TARGET_LATENCY", 2.0),
+        )
+
+
+@dataclass
+class SlotRate:
+    """The current rate of a download slot."""
+
+    delay: float
+    concurrency: int = 1
+    latency: float | None = None  # Moving average of the latency
+    successes: int = 0  # Healthy responses since the concurrency was last changed
+
+
+class AdaptiveThrottleMiddleware:
+    """Downloader middleware that adapts the rate of each download slot to how the server copes.
+
+    A slot starts slowly and speeds up as long as its responses are healthy: first the
+    delay between requests shrinks until it drops below `min_delay`, then the
+    concurrency grows, one request at a time, up to `max_concurrency`. When the
+    server asks to slow down (429 or 503), serves a captcha or fails to respond, the
+    concurrency is halved and the delay brought back to at least `min_delay`. A
+    latency above twice the target slows the slot down more gently.
+
+    Each slot has its own budget, which can be configured per slot key with
+    `ADAPTIVE_THROTTLE_SLOTS`, e.g. for Splash (`__splash__`) or the hosts of the
+    images. The rate of each slot is published in the stats.
+    """
+
+    def __init__(
+        self,
+        budget: SlotBudget,
+        slot_budgets: dict[str, SlotBudget],
+        crawler: Crawler,
+    ):
+        self.budget = budget
+        self.slot_budgets = slot_budgets
+        self.crawler = crawler
+        self.stats: StatsCollector = crawler.stats  # pyright: ignore[reportAttributeAccessIssue]
+        self.rates: dict[str, SlotRate] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler) -> Self:
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        budget = SlotBudget.from_settings(settings)
+        slot_budgets = {
+            key: replace(budget, **overrides)
+            for key, overrides in settings.getdict("ADAPTIVE_THROTTLE_SLOTS").items()
+        }
+        middleware = cls(budget, slot_budgets, crawler)
+        crawler.signals.connect(middleware.spider_opened, signal=signals.spider_opened)
+        return middleware
+
+    def spider_opened(self, spider: Spider) -> None:
+        # New download slots are created with these, like with AutoThrottle
+        spider.download_delay = self.budget.start_delay  # pyright: ignore[reportAttributeAccessIssue]
+        spider.max_concurrent_requests = 1  # pyright: ignore[reportAttributeAccessIssue]
+
+    def process_response(
+        self, request: Request, response: Response, spider: Spider
+    ) -> Response:
+        if (key := request.meta.get("download_slot")) is None:
+            return response
+        budget = self.slot_budget(key)
+        rate = self.rate(key)
+        if response.status in BACKOFF_STATUSES or is_blocked(response):
+            self.back_off(rate, budget, retry_after(response))
+        elif (latency := request.meta.get("download_latency")) is not None:
+            average: float = (
+                latency
+                if rate.latency is None
+                else (1 - LATENCY_WEIGHT) * rate.latency + LATENCY_WEIGHT * latency
+            )
+            rate.latency = average
+            if average > 2 * budget.target_latency:
+                self.slow_down(rate, budget)
+            elif average <= budget.target_latency and response.status < 400:
+                self.speed_up(rate, budget)
+        self.apply(key, rate)
+        return response
+
+    def process_exception(
+        self, request: Request, exception: Exception, spider: Spider
+    ) -> None:
+        # Timeouts and dropped connections are the clearest sign of an overloaded server
+        if isinstance(exception, IgnoreRequest) or (
+            (key := request.meta.get("download_slot")) is None
+        ):
+            return
+        rate = self.rate(key)
+        self.back_off(rate, self.slot_budget(key))
+        self.apply(key, rate)
+
+    def rate(self, key: str) -> SlotRate:
+        if (rate := self.rates.get(key)) is None:
+            budget = self.slot_budget(key)
+            rate = self.rates[key] = SlotRate(delay=budget.start_delay)
+        return rate
+
+    def slot_budget(self, key: str) -> SlotBudget:
+        """Return the budget of a slot, e.g. the `__splash__` one for `__splash__/host`."""
+        if (budget := self.slot_budgets.get(key)) is not None:
+            return budget
+        return self.slot_budgets.get(key.split("/", 1)[0], self.budget)
+
+    def speed_up(self, rate: SlotRate, budget: SlotBudget) -> None:
+        """Shorten the delay first, then add a request once every request succeeded."""
+        if rate.delay:
+            rate.delay *= 0.75
+            if rate.delay < budget.min_delay:
+                # Scrapy sends one request per delay, no matter the concurrency.
+                # From here on, the concurrency limits the rate instead.
+                rate.delay = 0
+            return
+        rate.successes += 1
+        if rate.successes >= rate.concurrency:
+            rate.concurrency = min(budget.max_concurrency, rate.concurrency + 1)
+            rate.successes = 0
+
+    def slow_down(self, rate: SlotRate, budget: SlotBudget) -> None:
+        """Remove a request, or lengthen the delay once there is a single one left."""
+        if rate.concurrency > 1:
+            rate.concurrency -= 1
+        else:
+            rate.delay = min(budget.max_delay, max(budget.min_delay, rate.delay * 1.5))
+        rate.successes = 0
+
+    def back_off(
+        self, rate: SlotRate, budget: SlotBudget, retry_after: float | None = None
+    ) -> None:
+        rate.concurrency = max(1, rate.concurrency // 2)
+        rate.delay = min(
+            budget.max_delay,
+            max(rate.delay * 2, budget.min_delay, retry_after or 0),
+        )
+        rate.successes = 0
+        self.stats.inc_value("adaptive_throttle/backoffs")
+
+    def apply(self, key: str, rate: SlotRate) -> None:
+        """Set the rate on the download slot and publish it in the stats."""
+        engine: Any = self.crawler.engine
+        if engine is not None and (slot := engine.downloader.slots.get(key)):
+            slot.delay = rate.delay
+            slot.concurrency = rate.concurrency
+        self.stats.set_value(f"adaptive_throttle/{key}/delay", rate.delay)
+        self.stats.set_value(f"adaptive_throttle/{key}/concurrency", rate.concurrency)
+        # Requests per second that the slot allows, limited either by the delay or
+        # by how many requests fit in the latency
+        if rate.delay:
+            requests_per_second = 1 / rate.delay
+        elif rate.latency:
+            requests_per_second = rate.concurrency / rate.latency
+        else:
+            requests_per_second = 0.0
+        self.stats.set_value(f"adaptive_throttle/{key}/rate", requests_per_second)
+
+
+def is_blocked(response: Response) -> bool:
+    """Return whether a captcha challenge was served instead of the requested page."""
+    if CHALLENGE_URL.search(response.url):
+        return True
+    if not isinstance(response, TextResponse):
+        return False
+    body = response.body
+    return bool(
+        CHALLENGE_TITLE.search(body, 0, HEAD_SIZE)
+        or (len(body) <= CHALLENGE_MAX_SIZE and CAPTCHA.search(body))
+    )
+
+
+def retry_after(response: Response) -> float | None:
+    """Return the seconds to wait according to the `Retry-After` header, if any."""
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        # An HTTP date, which the delay doubling covers well enough
+        return None
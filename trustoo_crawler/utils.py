@@ -1,3 +1,4 @@
+import re
 from enum import StrEnum
 
 
@@ -11,3 +12,14 @@ class DutchWeekDay(StrEnum):
     FRIDAY = "Vrijdag"
     SATURDAY = "Zaterdag"
     SUNDAY = "Zondag"
+
+
+# Every business has a stable listing ID, which is part of the URL of its page, e.g.
+# https://www.goudengids.nl/nl/bedrijf/Amsterdam/L119193538/Baker+%26+McKenzie+Amsterdam+NV/
+LISTING_ID = re.compile(r"/bedrijf/[^/]+/(L\d+)(?:/|$)")
+
+
+def get_listing_id(url: str) -> str | None:
+    """Return the listing ID of a business from the URL of its page, if it is one."""
+    match = LISTING_ID.search(url)
+    return match.group(1) if match else None
@@ -0,0 +1,178 @@
+"""Crawl with several `gouden_gids` workers that share a frontier, then merge their output.
+
+Each worker is a separate Scrapy process, so the parsing of the business pages is
+spread over as many cores. The workers share their queue and deduplication through
+`FrontierScheduler`, each writes its items to a part of the output and the parts
+are merged into a single file once all workers are done. The reviews, if enabled,
+are merged into a file of their own the same way.
+
+Run with e.g.
+`poetry run python -m trustoo_crawler.workers --workers 4 -o results.csv -a category=advocaten`.
+Any argument that isn't listed below is passed on to `scrapy crawl`.
+
+Each worker throttles its own requests, so lower `ADAPTIVE_THROTTLE_MAX_CONCURRENCY`
+when running many of them against the real website.
+
+The frontier is a temporary database by default, so every run starts from scratch.
+With `--frontier`, it is kept after the run, e.g. to resume the crawl where its
+workers stopped. A frontier without any pending requests only filters the requests
+that were seen before, so that case is logged.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from trustoo_crawler.frontier import SQLiteFrontier
+
+logger = logging.getLogger(__name__)
+
+# The formats whose parts can be concatenated, the header of CSV aside
+LINE_FORMATS = {".csv", ".jl", ".jsonl"}
+
+
+def merge_parts(parts: list[Path], output: Path) -> None:
+    """Merge the outputs of the workers into a single file of the same format."""
+    if output.suffix == ".parquet":
+        merge_parquet(parts, output)
+        return
+    if output.suffix not in LINE_FORMATS:
+        msg = f"Can't merge {output.suffix} files, use CSV, JSON lines or Parquet"
+        raise ValueError(msg)
+    header_written = False
+    with output.open("wb") as merged:
+        for part in parts:
+            if not part.exists():
+                continue
+            with part.open("rb") as file:
+                if output.suffix == ".csv":
+                    header = file.readline()
+                    if not header_written and header:
+                        merged.write(header)
+                        header_written = True
+                shutil.copyfileobj(file, merged)
+
+
+def merge_parquet(parts: list[Path], output: Path) -> None:
+    """Merge Parquet files one row group at a time, without loading them whole."""
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for part in parts:
+            if not part.exists():
+                continue
+            file = pq.ParquetFile(part)
+            if writer is None:
+                writer = pq.ParquetWriter(output, file.schema_arrow, compression="zstd")
+            for index in range(file.num_row_groups):
+                writer.write_table(file.read_row_group(index))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def part_paths(output: Path, workers: int) -> list[Path]:
+    """Return the paths of the parts of an output, one per worker."""
+    return [
+        output.with_name(f"{output.stem}.part{index}{output.suffix}")
+        for index in range(workers)
+    ]
+
+
+def check_frontier(path: Path) -> None:
+    """Log when an existing frontier has nothing left to crawl."""
+    if not path.exists():
+        return
+    frontier = SQLiteFrontier(path)
+    try:
+        pending = frontier.pending()
+    finally:
+        frontier.close()
+    if not pending:
+        logger.warning(
+            "The frontier %s has no pending requests, the requests that it has seen "
+            "before will be filtered. Remove it to crawl again from scratch.",
+            path,
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count() or 1, help="Number of workers"
+    )
+    parser.add_argument(
+        "--frontier",
+        default=None,
+        help="Database of the frontier, created if it doesn't exist and kept after "
+        "the run. A temporary one by default.",
+    )
+    parser.add_argument("-o", "--output", default="results.csv", help="Output file")
+    parser.add_argument(
+        "--reviews-output",
+        default="reviews.csv",
+        help="Output file of the reviews, with `-s REVIEWS_ENABLED=True`",
+    )
+    args, crawl_args = parser.parse_known_args()
+    with tempfile.TemporaryDirectory(prefix="frontier-") as directory:
+        if args.frontier:
+            frontier = Path(args.frontier)
+            check_frontier(frontier)
+        else:
+            frontier = Path(directory) / "frontier.sqlite"
+        run_workers(args, crawl_args, frontier)
+
+
+def run_workers(
+    args: argparse.Namespace, crawl_args: list[str], frontier: Path
+) -> None:
+    """Run the workers until they are all done, then merge their outputs."""
+    output = Path(args.output)
+    parts = part_paths(output, args.workers)
+    reviews_output = Path(args.reviews_output)
+    review_parts = part_paths(reviews_output, args.workers)
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "scrapy",
+                "crawl",
+                "gouden_gids",
+                "-O",
+                str(part),
+                "-s",
+                "SCHEDULER=trustoo_crawler.frontier.FrontierScheduler",
+                "-s",
+                f"FRONTIER_PATH={frontier}",
+                "-s",
+                f"FRONTIER_WORKER=worker-{index}",
+                "-s",
+                f"REVIEWS_FEED={review_part}",
+                *crawl_args,
+            ]
+        )
+        for index, (part, review_part) in enumerate(
+            zip(parts, review_parts, strict=True)
+        )
+    ]
+    failed = sum(worker.wait() != 0 for worker in workers)
+    merge_parts(parts, output)
+    if any(part.exists() for part in review_parts):
+        merge_parts(review_parts, reviews_output)
+    for part in [*parts, *review_parts]:
+        part.unlink(missing_ok=True)
+    if failed:
+        sys.exit(f"{failed} of the workers failed, see their logs")
+
+
+if __name__ == "__main__":
+    main()